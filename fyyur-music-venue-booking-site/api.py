@@ -0,0 +1,281 @@
+"""
+Versioned JSON API, mounted under /api/v1.
+
+Lists are paginated with a keyset on indexed columns: venues and artists by
+id, shows by (start_time, id) like the /shows page. A page is one query
+whatever its depth; follow "next" until it is null.
+    GET /api/v1/venues?state=CA&limit=100&fields=id,name,city
+    GET /api/v1/shows?fields=id,start_time&fields[venue]=name&fields[artist]=name,image_link
+"fields" projects the resource's own columns, only those are selected.
+"fields[venue]" and "fields[artist]" add the related venue or artist to each
+show, with the given columns; the join is only made when they are asked for.
+Shows of a date range, by day or week (timeline.py):
+    GET /api/v1/calendar?start=2026-10-23&end=2026-10-25&city=Austin
+    GET /api/v1/calendar?start=2026-10-01&end=2026-10-31&bucket=week&artist_id=4
+Venues nearest to a point or to a city, optionally within radius km (geo.py):
+    GET /api/v1/venues/near?lat=30.27&lon=-97.74&radius=50&limit=10
+    GET /api/v1/venues/near?city=Austin&state=TX
+Recommendations (recommend.py, needs numpy) are served in memory:
+    GET /api/v1/artists/3/recommended-venues?limit=10
+    GET /api/v1/venues/1/recommended-artists
+Responses carry an ETag of their body and answer If-None-Match with 304.
+"""
+from flask import Blueprint, abort, jsonify, request, url_for
+from sqlalchemy import tuple_
+from werkzeug.exceptions import HTTPException
+
+from geo import geocode, nearest_venues
+from models import db, Venue, Artist, Musicshows, listed_shows
+from queries import encode_cursor, decode_cursor
+from recommend import recommender
+from timeline import calendar, parse_range
+
+api = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+VENUE_COLUMNS = (
+    "id", "name", "city", "state", "address", "phone", "genres", "image_link",
+    "facebook_link", "website_link", "seeking_talent", "seeking_description",
+    "latitude", "longitude", "upcoming_shows_count", "past_shows_count",
+)
+ARTIST_COLUMNS = (
+    "id", "name", "city", "state", "phone", "genres", "image_link",
+    "facebook_link", "website_link", "seeking_venue", "seeking_description",
+    "upcoming_shows_count", "past_shows_count",
+)
+SHOW_COLUMNS = ("id", "start_time", "venue_id", "artist_id")
+RELATED_COLUMNS = {
+    "venue": (Venue, ("id", "name", "city", "state", "image_link")),
+    "artist": (Artist, ("id", "name", "image_link")),
+}
+
+
+def parse_fields(name, allowed):
+    """returns the requested columns of the fields[...] argument name,
+    all allowed columns if it is missing; aborts with 400 on unknown ones"""
+    value = request.args.get(name)
+    if value is None:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        abort(400, "unknown fields in {}: {}".format(name, ", ".join(sorted(unknown))))
+    return fields
+
+
+def parse_limit():
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        abort(400, "limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        abort(400, "limit must be between 1 and {}".format(MAX_LIMIT))
+    return limit
+
+
+def serialize(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def conditional(data):
+    """json response with an ETag of its body, 304 if the client has it"""
+    response = jsonify(data)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def page(rows, fields, limit, cursor_of):
+    """builds the page body from limit + 1 rows"""
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        args = request.args.to_dict()
+        args["after"] = cursor_of(rows[-1])
+        next_url = url_for(request.endpoint, **args)
+    return {
+        "data": [{field: serialize(getattr(row, field)) for field in fields} for row in rows],
+        "next": next_url,
+    }
+
+
+def list_entities(model, allowed):
+    """one page of venues or artists ordered by id"""
+    fields = parse_fields("fields", allowed)
+    limit = parse_limit()
+    # the cursor column is always selected, even if not returned
+    keys = fields if "id" in fields else fields + ["id"]
+    query = db.session.query(*[getattr(model, field) for field in keys])
+    for name in ("city", "state"):
+        if request.args.get(name):
+            query = query.filter(getattr(model, name) == request.args[name])
+    after = request.args.get("after")
+    if after:
+        try:
+            query = query.filter(model.id > int(after))
+        except ValueError:
+            abort(400, "malformed cursor")
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    return conditional(page(rows, fields, limit, lambda row: str(row.id)))
+
+
+def get_entity(model, allowed, key):
+    fields = parse_fields("fields", allowed)
+    row = (
+        db.session.query(*[getattr(model, field) for field in fields])
+        .filter(model.id == key)
+        .first()
+    )
+    if row is None:
+        abort(404)
+    return conditional({field: serialize(getattr(row, field)) for field in fields})
+
+
+@api.route("/venues")
+def venues():
+    return list_entities(Venue, VENUE_COLUMNS)
+
+
+@api.route("/venues/<int:venue_id>")
+def venue(venue_id):
+    return get_entity(Venue, VENUE_COLUMNS, venue_id)
+
+
+def parse_point():
+    """the lat and lon arguments, or the position of the city and state
+    arguments; aborts with 400 if neither is given or valid"""
+    if request.args.get("lat") or request.args.get("lon"):
+        try:
+            latitude, longitude = float(request.args["lat"]), float(request.args["lon"])
+        except (KeyError, ValueError):
+            abort(400, "lat and lon must be numbers")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            abort(400, "lat must be between -90 and 90, lon between -180 and 180")
+        return latitude, longitude
+    if request.args.get("state"):
+        latitude, longitude = geocode(request.args.get("city"), request.args["state"])
+        if latitude is None:
+            abort(400, "unknown state")
+        return latitude, longitude
+    abort(400, "lat and lon, or city and state, are required")
+
+
+@api.route("/venues/near")
+def venues_near():
+    """venues nearest to a point, within radius km if given"""
+    latitude, longitude = parse_point()
+    radius = None
+    if request.args.get("radius"):
+        try:
+            radius = float(request.args["radius"])
+        except ValueError:
+            abort(400, "radius must be a number")
+        if radius <= 0:
+            abort(400, "radius must be positive")
+    return conditional(
+        {
+            "center": {"latitude": latitude, "longitude": longitude},
+            "data": nearest_venues(latitude, longitude, parse_limit(), radius),
+        }
+    )
+
+
+@api.route("/artists")
+def artists():
+    return list_entities(Artist, ARTIST_COLUMNS)
+
+
+@api.route("/artists/<int:artist_id>")
+def artist(artist_id):
+    return get_entity(Artist, ARTIST_COLUMNS, artist_id)
+
+
+@api.route("/shows")
+def shows():
+    """one page of shows ordered by (start_time, id),
+    optionally of one venue or artist"""
+    fields = parse_fields("fields", SHOW_COLUMNS)
+    limit = parse_limit()
+    related = {
+        name: parse_fields("fields[%s]" % name, columns)
+        for name, (model, columns) in RELATED_COLUMNS.items()
+        if "fields[%s]" % name in request.args
+    }
+
+    columns = [Musicshows.id, Musicshows.start_time]
+    columns += [getattr(Musicshows, f) for f in fields if f not in ("id", "start_time")]
+    for name, related_fields in related.items():
+        model = RELATED_COLUMNS[name][0]
+        columns += [
+            getattr(model, field).label("%s__%s" % (name, field)) for field in related_fields
+        ]
+    query = db.session.query(*columns).filter(listed_shows())
+    if "venue" in related:
+        query = query.join(Venue, Venue.id == Musicshows.venue_id)
+    if "artist" in related:
+        query = query.join(Artist, Artist.id == Musicshows.artist_id)
+
+    for name in ("venue_id", "artist_id"):
+        if request.args.get(name):
+            try:
+                query = query.filter(getattr(Musicshows, name) == int(request.args[name]))
+            except ValueError:
+                abort(400, "{} must be an integer".format(name))
+    after = request.args.get("after")
+    if after:
+        try:
+            cursor = decode_cursor(after)
+        except ValueError:
+            abort(400, "malformed cursor")
+        query = query.filter(tuple_(Musicshows.start_time, Musicshows.id) > tuple_(*cursor))
+    rows = query.order_by(Musicshows.start_time, Musicshows.id).limit(limit + 1).all()
+
+    body = page(rows, fields, limit, lambda row: encode_cursor(row.start_time, row.id))
+    for item, row in zip(body["data"], rows):
+        for name, related_fields in related.items():
+            item[name] = {
+                field: serialize(getattr(row, "%s__%s" % (name, field)))
+                for field in related_fields
+            }
+    return conditional(body)
+
+
+@api.route("/calendar")
+def shows_calendar():
+    """shows of the days start to end (both included), in buckets"""
+    try:
+        start, end, bucket, filters = parse_range(request.args)
+        buckets = calendar(start, end, bucket, **filters)
+    except ValueError as e:
+        abort(400, str(e))
+    return conditional(
+        {"start": start.isoformat(), "end": end.isoformat(), "bucket": bucket, "buckets": buckets}
+    )
+
+
+def recommendations(suggest, key):
+    if recommender is None:
+        abort(501, "recommendations need numpy")
+    data = suggest(key, parse_limit())
+    if data is None:
+        abort(404)
+    return jsonify({"data": data})
+
+
+@api.route("/artists/<int:artist_id>/recommended-venues")
+def recommended_venues(artist_id):
+    """venues seeking talent suited to an artist seeking a venue"""
+    return recommendations(recommender and recommender.venues_for, artist_id)
+
+
+@api.route("/venues/<int:venue_id>/recommended-artists")
+def recommended_artists(venue_id):
+    """artists seeking a venue suited to a venue seeking talent"""
+    return recommendations(recommender and recommender.artists_for, venue_id)
+
+
+@api.errorhandler(HTTPException)
+def api_error(error):
+    """errors of the api are json, not the html error pages"""
+    return jsonify({"error": error.code, "message": error.description}), error.code
@@ -3,8 +3,7 @@
 # ----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
+from datetime import timedelta
 from flask import (
     Flask,
     render_template,
@@ -14,6 +13,7 @@ from flask import (
     redirect,
     url_for,
     abort,
+    jsonify,
 )
 from flask_moment import Moment
 import logging
@@ -21,10 +21,37 @@ from logging import Formatter, FileHandler
 from flask_wtf import FlaskForm
 from forms import *
 from models import setup_db, Musicshows, Venue, Artist
+from cache import init_cache, cached_page, add_cache_tags, page_cache
+from conditional import conditional_page
+from writebehind import init_write_behind
+from poolmetrics import init_pool_metrics, pool_metrics
+from profiler import init_profiler
+from routing import init_routing, read_only, router
+from recommend import init_recommendations, recommender
+from scheduler import init_scheduler, scheduler
+from dashboard import init_dashboard, dashboard
+from readmodel import init_read_model, read_model
+from purge import init_purge, purger
+import models
+from templating import init_templates, warm_templates
+from filters import format_datetime
+from queries import venue_directory, show_listing, venue_shows, artist_shows
+from search import search
+from booking import find_conflict, describe
+from dedup import find_duplicates
+from facets import browse, parse_filters, facet_links, query_args
+from timeline import calendar, parse_range
+import counters
+import dedup
+import geo
+import importer
+import exporter
+from api import api
 
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func
 import sys
+import click
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -33,22 +60,27 @@ import sys
 app = Flask(__name__)
 moment = Moment(app)
 db = setup_db(app)
+init_pool_metrics(app, db)
+init_profiler(app)
+init_routing(app)
+init_cache(app)
+init_write_behind(app)
+init_recommendations(app)
+init_read_model(app)
+geo.init_geo(app)
+init_scheduler(app)
+init_dashboard(app, scheduler)
+counters.init_counters(app, scheduler)
+init_purge(app, scheduler)
+app.register_blueprint(api)
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format="medium"):
-    date = dateutil.parser.parse(value)
-    if format == "full":
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == "medium":
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
-
-
 app.jinja_env.filters["datetime"] = format_datetime
+init_templates(app)
 
 
 # ----------------------------------------------------------------------------#
@@ -58,85 +90,55 @@ app.jinja_env.filters["datetime"] = format_datetime
 
 @app.route("/")
 def index():
-    return render_template("pages/home.html")
+    """home page, its lists come from the snapshot of dashboard.py"""
+    return render_template("pages/home.html", snapshot=dashboard.get())
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 
+def browse_page(model, endpoint):
+    """renders a page of the faceted browse of venues or artists"""
+    filters = parse_filters(request.args)
+    try:
+        page = browse(model, filters, after=request.args.get("after"))
+    except ValueError:
+        abort(400)
+    next_url = None
+    if page["next_cursor"]:
+        next_url = url_for(endpoint, after=page["next_cursor"], **query_args(filters))
+    return render_template(
+        "pages/browse.html",
+        kind=model.__tablename__,
+        results=page,
+        facets=facet_links(endpoint, filters, page["facets"]),
+        next_url=next_url,
+    )
+
+
 @app.route("/venues")
+@read_only
+@cached_page("venues")
 def venues():
     """Returns venues (grouped by city and state)
     along with number of upcoming shows in each (city, state).
     Returns:
         list of dictionary -- venues
     """
-    current_time = datetime.now()
-    data = []
-    venue_city_state = (
-        db.session.query(Venue.city, Venue.state)
-        .group_by(Venue.city, Venue.state)
-        .all()
-    )
-    i = 0
-
-    for v in venue_city_state:
-        venue_data = (
-            db.session.query(Venue)
-            .filter(Venue.city == v.city, Venue.state == v.state)
-            .all()
-        )
-        data.append({"city": v.city, "state": v.state, "venues": []})
-        for each_venue in venue_data:
-            upcoming_shows = (
-                db.session.query(Musicshows)
-                .filter(
-                    Musicshows.venue_id == each_venue.id,
-                    Musicshows.start_time > current_time,
-                )
-                .count()
-            )
-            data[i]["venues"].append(
-                {
-                    "id": each_venue.id,
-                    "name": each_venue.name,
-                    "num_upcoming_shows": upcoming_shows,
-                }
-            )
-        i += 1
-
+    data = venue_directory()
     return render_template("pages/venues.html", areas=data)
 
 
 @app.route("/venues/search", methods=["POST"])
+@read_only
 def search_venues():
-    """Returns venue results filtered by the search term.
+    """Returns venues whose name, city, state or genres match the search term.
     'search_term' is received in JSON body here.
     Returns:
         dictionary -- venues
     """
-    search_term = request.form["search_term"]
-    search_results = db.session.query(Venue).filter(
-        Venue.name.ilike("%" + search_term + "%")
-    )
-
-    response = {"count": search_results.count(), "data": []}
-    for result in search_results:
-        num_upcoming_shows = (
-            db.session.query(Musicshows)
-            .filter(
-                Musicshows.venue_id == result.id, Musicshows.start_time > datetime.now()
-            )
-            .count()
-        )
-        response["data"].append(
-            {
-                "id": result.id,
-                "name": result.name,
-                "num_upcoming_shows": num_upcoming_shows,
-            }
-        )
+    response = search(Venue, request.form["search_term"])
     return render_template(
         "pages/search_venues.html",
         results=response,
@@ -144,7 +146,23 @@ def search_venues():
     )
 
 
+@app.route("/venues/browse")
+@read_only
+@cached_page("venues")
+def browse_venues():
+    """returns one page of venues filtered by genre, city, state and
+    seeking_talent, with the number of venues of each filter value.
+    Filters and cursor are read from the query string, see facets.py.
+    Returns:
+        dictionary -- venues and facet counts
+    """
+    return browse_page(Venue, "browse_venues")
+
+
 @app.route("/venues/<int:venue_id>")
+@read_only
+@conditional_page(Venue, "venue_id")
+@cached_page("venue:{venue_id}")
 def show_venue(venue_id):
     """returns details of venue with venue_id.
     Arguments:
@@ -153,32 +171,26 @@ def show_venue(venue_id):
     Returns:
         dictionary -- details of venue
     """
-    data = Venue.query.get(venue_id)
-    venue_data = {}
-    current_time = datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
-
-    if data:
-        past_results = (
-            db.session.query(Musicshows)
-            .filter(Musicshows.venue_id == venue_id)
-            .filter(Musicshows.start_time < current_time)
-            .all()
-        )
-        upcoming_results = (
-            db.session.query(Musicshows)
-            .filter(Musicshows.venue_id == venue_id)
-            .filter(Musicshows.start_time > current_time)
-            .all()
-        )
-
-        venue_data = Venue.details(data)
-        venue_data["past_shows"] = list(map(Musicshows.artist_details, past_results))
-        venue_data["upcoming_shows"] = list(
-            map(Musicshows.artist_details, upcoming_results)
-        )
-        venue_data["past_shows_count"] = len(past_results)
-        venue_data["upcoming_shows_count"] = len(upcoming_results)
-
+    if read_model.enabled:
+        # a miss of the shared cache may follow another worker's write
+        venue_data = read_model.venue_page(venue_id, fresh=page_cache.shared) or {}
+    else:
+        venue_data = {}
+        data = Venue.query.get(venue_id)
+        if data:
+            past_shows, upcoming_shows = venue_shows(venue_id)
+            venue_data = Venue.details(data)
+            venue_data["past_shows"] = past_shows
+            venue_data["upcoming_shows"] = upcoming_shows
+            venue_data["past_shows_count"] = len(past_shows)
+            venue_data["upcoming_shows_count"] = len(upcoming_shows)
+
+    add_cache_tags(
+        *{
+            "artist:%d" % show["artist_id"]
+            for show in venue_data.get("past_shows", []) + venue_data.get("upcoming_shows", [])
+        }
+    )
     return render_template("pages/show_venue.html", venue=venue_data)
 
 
@@ -196,15 +208,28 @@ def create_venue_form():
     return render_template("forms/new_venue.html", form=form)
 
 
+def duplicates_of(model, form):
+    """existing entries the submitted venue or artist duplicates, none if
+    the user chose to list it anyway"""
+    if form.allow_duplicate.data:
+        return []
+    return find_duplicates(model, request.form.to_dict())
+
+
 @app.route("/venues/create", methods=["POST"])
 def create_venue_submission():
-    """insert form data as a new venue record
+    """insert form data as a new venue record,
+    unless it looks like a venue already listed
     """
     form = VenueForm(request.form)
     if form.is_submitted():
         print("Form successfully submitted")
 
     if form.validate_on_submit():
+        duplicates = duplicates_of(Venue, form)
+        if duplicates:
+            flash("Venue " + request.form["name"] + " looks like a venue already listed. Venue was not listed.")
+            return render_template("forms/new_venue.html", form=form, duplicates=duplicates)
         try:
             new_venue = Venue(
                 name=request.form["name"],
@@ -235,25 +260,55 @@ def create_venue_submission():
 
 @app.route("/venues/<venue_id>", methods=["DELETE"])
 def delete_venue(venue_id):
-    """deletes a record from venue model
+    """deletes a record from venue model, its shows are purged in the
+    background, see purge.py
     Arguments:
         venue_id {int} -- venue id
+    Returns:
+        json -- success of the deletion
     """
     venue_item = Venue.query.get(venue_id)
+    deleted = False
     try:
         Venue.delete(venue_item)
+        deleted = True
         flash("Venue item deleted successfully!")
     except:
         db.session.rollback()
         flash("Venue item deletion failed!")
     finally:
         db.session.close()
-    return None
+    return jsonify({"success": deleted})
+
+
+@app.route("/artists/<int:artist_id>", methods=["DELETE"])
+def delete_artist(artist_id):
+    """deletes a record from artist model, its shows are purged in the
+    background, see purge.py
+    Arguments:
+        artist_id {int} -- artist id
+    Returns:
+        json -- success of the deletion
+    """
+    artist_item = Artist.query.get(artist_id)
+    deleted = False
+    try:
+        Artist.delete(artist_item)
+        deleted = True
+        flash("Artist item deleted successfully!")
+    except:
+        db.session.rollback()
+        flash("Artist item deletion failed!")
+    finally:
+        db.session.close()
+    return jsonify({"success": deleted})
 
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route("/artists")
+@read_only
+@cached_page("artists")
 def artists():
     """returns artist names
     Returns:
@@ -264,35 +319,14 @@ def artists():
 
 
 @app.route("/artists/search", methods=["POST"])
+@read_only
 def search_artists():
-    """returns search results of artists
+    """returns artists whose name, city, state or genres match the search term
     Returns:
         dictionary -- artists
     """
 
-    search_term = request.form["search_term"]
-    search_results = db.session.query(Artist).filter(
-        Artist.name.ilike("%" + search_term + "%")
-    )
-
-    response = {"count": search_results.count(), "data": []}
-    for result in search_results:
-        num_upcoming_shows = (
-            db.session.query(Musicshows)
-            .filter(
-                Musicshows.artist_id == result.id,
-                Musicshows.start_time > datetime.now(),
-            )
-            .count()
-        )
-        response["data"].append(
-            {
-                "id": result.id,
-                "name": result.name,
-                "num_upcoming_shows": num_upcoming_shows,
-            }
-        )
-
+    response = search(Artist, request.form["search_term"])
     return render_template(
         "pages/search_artists.html",
         results=response,
@@ -300,7 +334,23 @@ def search_artists():
     )
 
 
+@app.route("/artists/browse")
+@read_only
+@cached_page("artists")
+def browse_artists():
+    """returns one page of artists filtered by genre, city, state and
+    seeking_venue, with the number of artists of each filter value.
+    Filters and cursor are read from the query string, see facets.py.
+    Returns:
+        dictionary -- artists and facet counts
+    """
+    return browse_page(Artist, "browse_artists")
+
+
 @app.route("/artists/<int:artist_id>")
+@read_only
+@conditional_page(Artist, "artist_id")
+@cached_page("artist:{artist_id}")
 def show_artist(artist_id):
     """shows artist page with artist details
     Arguments:
@@ -308,33 +358,26 @@ def show_artist(artist_id):
     Returns:
         dictionary -- artist details
     """
-    data = Artist.query.get(artist_id)
-    artist_data = {}
-    current_time = datetime.now()
-
-    if data:
-        past_results = (
-            db.session.query(Musicshows)
-            .filter(Musicshows.artist_id == artist_id)
-            .filter(Musicshows.start_time < current_time)
-            .all()
-        )
-        upcoming_results = (
-            db.session.query(Musicshows)
-            .filter(Musicshows.artist_id == artist_id)
-            .filter(Musicshows.start_time > current_time)
-            .all()
-        )
-
-        artist_data = Artist.details(data)
-        artist_data["past_shows"] = list(map(Musicshows.venue_details, past_results))
-        artist_data["upcoming_shows"] = list(
-            map(Musicshows.venue_details, upcoming_results)
-        )
-        artist_data["past_shows_count"] = len(past_results)
-        artist_data["upcoming_shows_count"] = len(upcoming_results)
-
-    return render_template("pages/show_artist.html", artist=data)
+    if read_model.enabled:
+        artist_data = read_model.artist_page(artist_id, fresh=page_cache.shared) or {}
+    else:
+        artist_data = {}
+        data = Artist.query.get(artist_id)
+        if data:
+            past_shows, upcoming_shows = artist_shows(artist_id)
+            artist_data = Artist.details(data)
+            artist_data["past_shows"] = past_shows
+            artist_data["upcoming_shows"] = upcoming_shows
+            artist_data["past_shows_count"] = len(past_shows)
+            artist_data["upcoming_shows_count"] = len(upcoming_shows)
+
+    add_cache_tags(
+        *{
+            "venue:%d" % show["venue_id"]
+            for show in artist_data.get("past_shows", []) + artist_data.get("upcoming_shows", [])
+        }
+    )
+    return render_template("pages/show_artist.html", artist=artist_data)
 
 
 #  Update
@@ -484,13 +527,18 @@ def create_artist_form():
 
 @app.route("/artists/create", methods=["POST"])
 def create_artist_submission():
-    """insert form data as a new artist record in db 
+    """insert form data as a new artist record in db,
+    unless it looks like an artist already listed
     """
     form = ArtistForm(request.form)
     if form.is_submitted():
         print("Form successfully submitted")
 
     if form.validate_on_submit():
+        duplicates = duplicates_of(Artist, form)
+        if duplicates:
+            flash("Artist " + request.form["name"] + " looks like an artist already listed. Artist was not listed.")
+            return render_template("forms/new_artist.html", form=form, duplicates=duplicates)
         try:
             new_artist = Artist(
                 name=request.form["name"],
@@ -522,18 +570,53 @@ def create_artist_submission():
 
 
 @app.route("/shows")
+@read_only
+@cached_page("shows")
 def shows():
-    """display list of shows   
+    """display one page of shows,
+    'after' query parameter is the cursor of the next page.
     Returns:
         dictionary -- show details
     """
 
-    shows_data = {}
-    data = db.session.query(Musicshows).all()
+    try:
+        shows_data, next_cursor = show_listing(after=request.args.get("after"))
+    except ValueError:
+        abort(400)
 
-    shows_data = Musicshows.details(data)
+    return render_template(
+        "pages/shows.html", shows=shows_data, next_cursor=next_cursor
+    )
 
-    return render_template("pages/shows.html", shows=shows_data)
+
+@app.route("/shows/calendar")
+@read_only
+def shows_calendar():
+    """returns the shows of a date range by day or week, optionally of one city,
+    venue or artist. start, end, bucket and the filters are read from the
+    query string, see timeline.py; each day or week is cached on its own.
+    Returns:
+        list of dictionary -- buckets of shows
+    """
+    try:
+        start, end, bucket, filters = parse_range(request.args, default_days=7)
+        buckets = calendar(start, end, bucket, **filters)
+    except ValueError:
+        abort(400)
+    span = end - start + timedelta(days=1)
+    args = {name: value for name, value in filters.items() if value}
+    return render_template(
+        "pages/calendar.html",
+        buckets=buckets,
+        bucket=bucket,
+        filters=filters,
+        start=start,
+        end=end,
+        previous_url=url_for(
+            "shows_calendar", start=start - span, end=end - span, bucket=bucket, **args
+        ),
+        next_url=url_for("shows_calendar", start=start + span, end=end + span, bucket=bucket, **args),
+    )
 
 
 @app.route("/shows/create")
@@ -550,23 +633,106 @@ def create_shows():
 def create_show_submission():
     """called to create new show in db.
     upon submitting, insert form data as a new show
+    unless the venue or the artist is already booked at that time
     """
     form = ShowForm(request.form)
     if form.validate_on_submit():
+        # ids parsed by the form, a non-numeric id never reaches the database
+        venue_id, artist_id = form.venue_id.data, form.artist_id.data
+        if not (Venue.query.get(venue_id) and Artist.query.get(artist_id)):
+            flash("The venue or the artist is not listed. Show could not be listed.")
+            return render_template("pages/home.html")
+        conflict = find_conflict(venue_id, artist_id, form.start_time.data)
+        if conflict:
+            flash(describe(conflict, venue_id) + ". Show could not be listed.")
+            return render_template("pages/home.html")
         try:
             new_show = Musicshows(
-                artist_id=request.form["artist_id"],
-                venue_id=request.form["venue_id"],
-                start_time=request.form["start_time"],
+                artist_id=artist_id,
+                venue_id=venue_id,
+                start_time=form.start_time.data,
             )
             Musicshows.insert(new_show)
         except SQLAlchemyError as e:
             db.session.rollback()
             print(e)
             flash("An error occurred. Show could not be listed.")
+    else:
+        flash("Invalid " + ", ".join(sorted(form.errors)) + ". Show could not be listed.")
     return render_template("pages/home.html")
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+
+@app.route("/export/<any(venues, artists, shows):kind>.<any(csv, ndjson):format>")
+def export(kind, format):
+    """streams all venues, artists or shows as csv or ndjson.
+    Arguments:
+        kind {str} -- venues, artists or shows
+        format {str} -- csv or ndjson
+    Query Arguments:
+        city, state -- location of the venue or artist, for shows the venue's
+        start, end -- date range of the shows, YYYY-MM-DD
+    Returns:
+        response -- streamed file
+    """
+    try:
+        query = exporter.export_query(
+            kind,
+            city=request.args.get("city"),
+            state=request.args.get("state"),
+            start=exporter.parse_date(request.args.get("start")),
+            end=exporter.parse_date(request.args.get("end")),
+        )
+    except ValueError:
+        abort(400)
+
+    lines = exporter.csv_lines(query) if format == "csv" else exporter.ndjson_lines(query)
+    return Response(
+        lines,
+        mimetype=exporter.MIMETYPES[format],
+        headers={
+            "Content-Disposition": "attachment; filename={}.{}".format(kind, format)
+        },
+    )
+
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+
+@app.route("/metrics")
+def metrics():
+    """returns the page cache, connection pool, replica, group commit,
+    recommendation index, read model, purge and scheduler metrics of this worker
+    Returns:
+        json -- metrics by component
+    """
+    return jsonify(
+        {
+            "cache": page_cache.stats(),
+            "pool": pool_metrics.stats(),
+            "replicas": router.stats(),
+            "write_behind": models.write_queue.stats() if models.write_queue else None,
+            "recommendations": recommender.stats() if recommender else None,
+            "read_model": read_model.stats(),
+            "purge": purger.stats(),
+            "scheduler": scheduler.stats(),
+        }
+    )
+
+
+@app.route("/metrics/cache")
+def cache_metrics():
+    """returns hit/miss counters of the page cache of this worker
+    Returns:
+        json -- cache statistics
+    """
+    return jsonify(page_cache.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template("errors/404.html"), 404
@@ -587,6 +753,84 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info("errors")
 
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+
+@app.cli.command("rollover-show-counters")
+def rollover_show_counters():
+    """moves shows that have started from the upcoming to the past counters,
+    which the scheduler of each worker does every ROLLOVER_INTERVAL seconds;
+    run it from cron when the scheduler is off (SCHEDULER=0).
+    """
+    print("{} shows rolled over".format(counters.roll_over()))
+
+
+@app.cli.command("rebuild-show-counters")
+def rebuild_show_counters():
+    """recounts upcoming and past shows of all venues and artists
+    """
+    counters.rebuild()
+
+
+@app.cli.command("warm-templates")
+def warm_templates_command():
+    """compiles all templates into the bytecode cache, e.g. at deploy time
+    """
+    print("{} templates compiled".format(len(warm_templates(app))))
+
+
+@app.cli.command("geocode-venues")
+@click.option("--batch-size", default=geo.GEOCODE_BATCH, show_default=True)
+def geocode_venues(batch_size):
+    """places the venues without coordinates at their city, from the
+    bundled gazetteer, e.g. once after migration c7e9b1d3f5a2.
+    """
+    print("{} venues geocoded".format(geo.geocode_missing(batch_size)))
+
+
+@app.cli.command("find-duplicates")
+@click.argument("kind", type=click.Choice(["venues", "artists"]))
+def find_duplicates_command(kind):
+    """lists the clusters of duplicate venues or artists,
+    keying the rows that have no blocking keys yet.
+    """
+    clusters = dedup.cluster(Venue if kind == "venues" else Artist)
+    for entries in clusters:
+        print(" | ".join("{} {}".format(key, name) for key, name in entries))
+    print("{} clusters of duplicate {}".format(len(clusters), kind))
+
+
+@app.cli.command("purge-deleted")
+@click.option("--batch-size", default=None, type=int,
+              help="shows deleted per transaction (default: PURGE_BATCH_SIZE)")
+def purge_deleted(batch_size):
+    """removes the deleted venues and artists with all their shows,
+    in batches of shows each committed on its own.
+    """
+    if batch_size:
+        purger.batch_size = batch_size
+    removed = purger.run()
+    print("{} venues and artists purged, {} shows deleted".format(removed, purger.purged["shows"]))
+
+
+@app.cli.command("import-catalog")
+@click.argument("kind", type=click.Choice(["venues", "artists", "shows"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", type=click.Choice(["csv", "ndjson"]), default=None,
+              help="file format, guessed from the extension by default")
+@click.option("--batch-size", default=importer.BATCH_SIZE, show_default=True)
+def import_catalog(kind, path, format, batch_size):
+    """imports venues, artists or shows from a csv or ndjson file,
+    rows failing the form validation are reported and skipped.
+    """
+    report = importer.Importer(kind, batch_size).run(importer.read_rows(path, format))
+    for line, message in report.errors:
+        print("line {}: {}".format(line, message), file=sys.stderr)
+    print(report.summary())
+
+
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
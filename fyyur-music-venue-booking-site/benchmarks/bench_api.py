@@ -0,0 +1,34 @@
+"""
+Latency of the first and a deep page of /api/v1/artists and /api/v1/shows
+at 100k artists and 100k shows, and the page size with and without a
+sparse fieldset.
+    python benchmarks/bench_api.py
+Keyset pagination keeps deep pages at the cost of the first one.
+"""
+import json
+
+from common import reset_db, seed, timed, app
+
+
+def main():
+    reset_db()
+    seed(venues=2000, artists=100000, shows=100000)
+    client = app.test_client()
+
+    print("%-44s %10s %10s" % ("request", "ms", "bytes"))
+    for path in ("/api/v1/artists?limit=100", "/api/v1/shows?limit=100&fields[venue]=name"):
+        url = path
+        for _ in range(500):
+            url = json.loads(client.get(url).data)["next"]
+        for label, target in (("first page", path), ("page 501", url)):
+            size = len(client.get(target).data)
+            ms = timed(lambda: client.get(target))
+            print("%-44s %10.2f %10d" % (path.split("?")[0] + " " + label, ms, size))
+
+    for path in ("/api/v1/artists?limit=100", "/api/v1/artists?limit=100&fields=id,name"):
+        size = len(client.get(path).data)
+        print("%-44s %10.2f %10d" % (path, timed(lambda: client.get(path)), size))
+
+
+if __name__ == "__main__":
+    main()
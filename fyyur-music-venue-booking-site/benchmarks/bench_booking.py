@@ -0,0 +1,52 @@
+"""
+Cost of booking conflict checks at 100k existing shows: one find_conflict()
+against the database, a scan of all shows per check as a naive check
+would do, and validating a batch of 100k new shows with booking.Bookings.
+    python benchmarks/bench_booking.py
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import reset_db, seed, timed
+from models import db, Musicshows, SHOW_DURATION
+from booking import Bookings, find_conflict
+
+SHOWS = 100000
+
+
+def naive_conflict(venue_id, artist_id, start_time):
+    for show in db.session.query(Musicshows.venue_id, Musicshows.artist_id, Musicshows.start_time):
+        if (show.venue_id == venue_id or show.artist_id == artist_id) and abs(
+            show.start_time - start_time
+        ) < SHOW_DURATION:
+            return show
+    return None
+
+
+def main():
+    reset_db()
+    seed(venues=2000, artists=5000, shows=SHOWS)
+    rnd = random.Random(7)
+    now = datetime.now()
+    new_shows = [
+        (rnd.randint(1, 2000), rnd.randint(1, 5000), now + timedelta(hours=rnd.randint(0, 24 * 365)))
+        for _ in range(SHOWS)
+    ]
+
+    venue_id, artist_id, start_time = new_shows[0]
+    print("find_conflict:         %8.2f ms" % timed(lambda: find_conflict(venue_id, artist_id, start_time)))
+    print("naive scan:            %8.2f ms" % timed(lambda: naive_conflict(venue_id, artist_id, start_time), repeat=1))
+
+    start = time.perf_counter()
+    bookings = Bookings.load()
+    print("load 100k bookings:    %8.2f ms" % ((time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    conflicts = sum(1 for show in new_shows if bookings.book(*show))
+    elapsed = time.perf_counter() - start
+    print("validate 100k shows:   %8.2f ms, %d conflicts, %.1f us/show" % (
+        elapsed * 1000, conflicts, elapsed / SHOWS * 1e6))
+
+
+if __name__ == "__main__":
+    main()
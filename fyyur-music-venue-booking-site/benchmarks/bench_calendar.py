@@ -0,0 +1,47 @@
+"""
+Latency of a month of shows by day at 100k shows over two years: the
+range query of timeline.calendar() uncached and from the bucket cache,
+against loading every show and bucketing in Python.
+    python benchmarks/bench_calendar.py
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from common import reset_db, seed, timed
+from cache import page_cache
+from models import Musicshows
+from timeline import calendar
+
+SHOWS = 100000
+
+
+def naive_month(first, last):
+    days = defaultdict(list)
+    for show in Musicshows.query.all():
+        day = show.start_time.date()
+        if first <= day <= last:
+            days[day].append(show.id)
+    return days
+
+
+def main():
+    reset_db()
+    seed(venues=2000, artists=5000, shows=SHOWS)
+    first = date.today() + timedelta(days=30)
+    last = first + timedelta(days=29)
+
+    def uncached():
+        page_cache.invalidate("calendar")
+        calendar(first, last)
+
+    print("month by day, uncached:   %8.2f ms" % timed(uncached))
+    calendar(first, last)
+    print("month by day, cached:     %8.2f ms" % timed(lambda: calendar(first, last)))
+    print("month by week, uncached:  %8.2f ms" % timed(
+        lambda: (page_cache.invalidate("calendar"), calendar(first, last, "week"))
+    ))
+    print("load all shows:           %8.2f ms" % timed(lambda: naive_month(first, last), repeat=1))
+
+
+if __name__ == "__main__":
+    main()
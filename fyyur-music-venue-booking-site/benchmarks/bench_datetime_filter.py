@@ -0,0 +1,63 @@
+"""
+Render time of the show tiles' datetime filter on a 10k-show page,
+the former dateutil + babel filter against filters.format_datetime.
+    python benchmarks/bench_datetime_filter.py
+"""
+import random
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from common import app, timed
+import filters
+
+TEMPLATE = "{% for show in shows %}<h4>{{ show.start_time|datetime('full') }}</h4>{% endfor %}"
+
+
+def former_format_datetime(value, format="medium"):
+    date = dateutil.parser.parse(value)
+    if format == "full":
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == "medium":
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def render(template, filter, shows, cold=False):
+    if cold:
+        filters.format_cached.cache_clear()
+        filters.parse_datetime.cache_clear()
+    app.jinja_env.filters["datetime"] = filter
+    return template.render(shows=shows)
+
+
+def main():
+    rnd = random.Random(42)
+    start = datetime(2035, 1, 1, 20, 0)
+    # shows start on the hour, so a page repeats some times
+    times = [start + timedelta(hours=rnd.randint(0, 24 * 365)) for _ in range(10000)]
+    as_strings = [{"start_time": str(time)} for time in times]
+    as_datetimes = [{"start_time": time} for time in times]
+    cases = [
+        ("former filter, strings", former_format_datetime, as_strings, True),
+        ("fast filter, strings", filters.format_datetime, as_strings, True),
+        ("fast filter, datetimes", filters.format_datetime, as_datetimes, True),
+        ("fast filter, memoized", filters.format_datetime, as_datetimes, False),
+    ]
+
+    with app.app_context():
+        template = app.jinja_env.from_string(TEMPLATE)
+        assert render(template, former_format_datetime, as_strings) == render(
+            template, filters.format_datetime, as_datetimes
+        )
+
+        print("10k shows, ms per page")
+        for name, filter, shows, cold in cases:
+            ms = timed(lambda: render(template, filter, shows, cold), repeat=3)
+            print("%-24s %8.1f" % (name, ms))
+        app.jinja_env.filters["datetime"] = filters.format_datetime
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Duplicate detection of dedup.py at 1M venues, 1% of them duplicates of
+another venue: by name with another article and word order, or by phone
+number with a similar name. Times keying all rows, clustering the whole
+table, and the duplicate lookup of one new venue.
+    python benchmarks/bench_dedup.py [venues]
+"""
+import random
+import sys
+import time
+
+from common import reset_db, seed, timed
+from models import db, Venue
+import dedup
+
+VENUES = 1000000
+DUPLICATES = 0.01
+
+
+def main():
+    venues = int(sys.argv[1]) if len(sys.argv) > 1 else VENUES
+    reset_db()
+    start = time.perf_counter()
+    seed(venues=venues, artists=1, shows=0)
+    originals = {
+        row.id: row
+        for row in db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.phone)
+    }
+    rnd = random.Random(42)
+    copies = []
+    for i, key in enumerate(rnd.sample(range(1, venues + 1), int(venues * DUPLICATES))):
+        row = originals[key]
+        if i % 2:
+            name, phone = "{}, The".format(row.name), "%010d" % (venues + key)
+        else:
+            name, phone = row.name.replace("Venue", "Venues"), row.phone
+        copies.append(
+            dict(name=name, city=row.city, state=row.state, address="%d Side Street" % key,
+                 phone=phone, genres=["Jazz"])
+        )
+    del originals
+    db.session.execute(Venue.__table__.insert(), copies)
+    db.session.commit()
+    print("%-30s %8.1f s" % ("seed %d venues:" % (venues + len(copies)), time.perf_counter() - start))
+
+    seconds = timed(lambda: dedup.fill_keys(Venue), repeat=1) / 1000
+    print("%-30s %8.1f s" % ("fill keys:", seconds))
+    clusters = []
+    seconds = timed(lambda: clusters.extend(dedup.cluster(Venue)), repeat=1) / 1000
+    print("%-30s %8.1f s" % ("cluster the table:", seconds))
+    print("%-30s %8d (%d duplicates inserted)" % ("clusters found:", len(clusters), len(copies)))
+    new = {"name": "The Venue 4242", "city": "City 42", "state": "MD", "phone": "0000004242",
+           "address": "4242 Main St"}
+    ms = timed(lambda: dedup.find_duplicates(Venue, new), repeat=100)
+    print("%-30s %8.3f ms" % ("lookup of one new venue:", ms))
+
+
+if __name__ == "__main__":
+    main()
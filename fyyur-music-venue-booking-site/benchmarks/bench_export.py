@@ -0,0 +1,47 @@
+"""
+Peak memory and time of exporting 50k and 200k shows through
+/export/shows.csv, against loading the table with query(...).all() and
+serializing it as the html pages do.
+    python benchmarks/bench_export.py
+The export's peak should stay flat as the table grows.
+"""
+import time
+import tracemalloc
+
+from common import reset_db, seed, app
+from models import db, Musicshows
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size, elapsed, peak / 2 ** 20
+
+
+def load_all():
+    rows = [show.details() for show in db.session.query(Musicshows).all()]
+    db.session.expunge_all()
+    return len(rows)
+
+
+def stream_export():
+    response = app.test_client().get("/export/shows.csv")
+    # count the rows while consuming the stream, without keeping it
+    return sum(chunk.count(b"\n") for chunk in response.iter_encoded()) - 1
+
+
+def main():
+    print("%-8s %-8s %10s %10s %10s" % ("shows", "path", "rows", "ms", "peak MiB"))
+    for shows in (50000, 200000):
+        reset_db()
+        seed(venues=2000, artists=5000, shows=shows)
+        for name, fn in (("all()", load_all), ("export", stream_export)):
+            print("%-8d %-8s %10d %10.0f %10.1f" % ((shows, name) + measure(fn)))
+
+
+if __name__ == "__main__":
+    main()
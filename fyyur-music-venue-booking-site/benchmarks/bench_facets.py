@@ -0,0 +1,67 @@
+"""
+Latency of /artists/browse at 100k artists, with no filter and with one to
+four facets selected, uncached (the listing plus the one facet aggregate)
+and served from the page cache.
+    python benchmarks/bench_facets.py
+Exits with status 1 if a page misses its target in TARGETS_MS.
+"""
+import sys
+
+from common import reset_db, seed, timed, app
+from cache import page_cache
+
+ARTISTS = 100000
+
+PAGES = [
+    ("no filter", "/artists/browse"),
+    ("genre", "/artists/browse?genre=Jazz"),
+    ("genre, state", "/artists/browse?genre=Jazz&state=CA"),
+    ("genre, state, city", "/artists/browse?genre=Jazz&state=CA&city=City+4"),
+    ("all four", "/artists/browse?genre=Jazz&state=CA&city=City+4&seeking=yes"),
+]
+
+# (uncached, cached) milliseconds on the default in-memory sqlite database,
+# where json_each() stands in for the GIN index: every facet but genre
+# parses the genres of each row, so a genre filter costs the most
+TARGETS_MS = {
+    "no filter": (300, 2),
+    "genre": (600, 2),
+    "genre, state": (250, 2),
+    "genre, state, city": (50, 2),
+    "all four": (50, 2),
+}
+
+
+def uncached(client, path):
+    def request():
+        page_cache.invalidate("artists")
+        client.get(path)
+
+    return request
+
+
+def main():
+    reset_db()
+    seed(venues=100, artists=ARTISTS, shows=0)
+    client = app.test_client()
+
+    missed = []
+    print("%-22s %12s %12s %14s" % ("filters", "uncached ms", "cached ms", "target ms"))
+    for label, path in PAGES:
+        cold = timed(uncached(client, path))
+        client.get(path)
+        warm = timed(lambda: client.get(path))
+        cold_target, warm_target = TARGETS_MS[label]
+        ok = cold <= cold_target and warm <= warm_target
+        if not ok:
+            missed.append(label)
+        print(
+            "%-22s %12.2f %12.2f %8d / %-3d %s"
+            % (label, cold, warm, cold_target, warm_target, "ok" if ok else "MISSED")
+        )
+    if missed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Venues near a point at 100k venues spread over the continental US:
+`flask geocode-venues` and the build of the KD-tree of geo.py, then the
+latency of k-nearest and radius searches against a linear scan of all
+venues; fails if a search misses TARGET_MS at the median.
+    python benchmarks/bench_geo.py
+"""
+import random
+import sys
+import time
+
+from sqlalchemy import bindparam
+
+from common import reset_db, seed, timed
+from models import db, Venue
+import geo
+
+VENUES = 100000
+QUERIES = 1000
+TARGET_MS = 1.0
+
+
+def percentiles(fn, points):
+    times = []
+    for point in points:
+        start = time.perf_counter()
+        fn(point)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2], times[int(len(times) * 0.99)]
+
+
+def linear_scan(point, k=10):
+    xyz = geo.to_xyz(*point)
+    index = geo.get_index()
+    return sorted(
+        (sum((a - b) ** 2 for a, b in zip(geo.to_xyz(v[3], v[4]), xyz)), key)
+        for key, v in index.venues.items()
+    )[:k]
+
+
+def main():
+    reset_db()
+    seed(venues=VENUES, artists=1, shows=0)
+    print("%-28s %8.0f ms" % ("geocode %d venues:" % VENUES, timed(geo.geocode_missing, repeat=1)))
+
+    # the gazetteer places venues at their city; spread them as if they had
+    # been geocoded from their address
+    rnd = random.Random(42)
+    table = Venue.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam("venue_id"))
+        .values(latitude=bindparam("lat"), longitude=bindparam("lon")),
+        [
+            {"venue_id": i, "lat": rnd.uniform(25, 49), "lon": rnd.uniform(-124, -67)}
+            for i in range(1, VENUES + 1)
+        ],
+    )
+    db.session.commit()
+
+    def build():
+        geo.reset_index()
+        geo.get_index()
+
+    print("%-28s %8.0f ms" % ("build index:", timed(build, repeat=1)))
+    points = [(rnd.uniform(25, 49), rnd.uniform(-124, -67)) for _ in range(QUERIES)]
+    missed = False
+    for label, fn in (
+        ("10 nearest", lambda p: geo.nearest_venues(p[0], p[1], 10)),
+        ("50 nearest within 25 km", lambda p: geo.nearest_venues(p[0], p[1], 50, radius_km=25)),
+        ("50 nearest within 100 km", lambda p: geo.nearest_venues(p[0], p[1], 50, radius_km=100)),
+    ):
+        p50, p99 = percentiles(fn, points)
+        print("%-28s p50 %6.3f ms  p99 %6.3f ms" % (label + ":", p50, p99))
+        missed = missed or p50 > TARGET_MS
+    p50, p99 = percentiles(linear_scan, points[:5])
+    print("%-28s p50 %6.1f ms" % ("10 nearest, linear scan:", p50))
+    if missed:
+        print("a search missed its target of %.1f ms" % TARGET_MS)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Throughput of the bulk import: rows/s of importing 20k venues and 100k
+shows from csv with importer.Importer at several batch sizes, against
+one ORM insert and commit per row as the create forms do.
+One row in a hundred is invalid and reported.
+    python benchmarks/bench_import.py
+"""
+import csv
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from common import reset_db, seed, STATES, GENRES
+from models import db, Venue
+import importer
+
+VENUES = 20000
+SHOWS = 100000
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def venue_rows(n):
+    for i in range(n):
+        yield (
+            "Venue %d" % i,
+            "City %d" % (i % 50),
+            STATES[i % len(STATES)] if i % 100 else "XX",
+            "%d Main Street" % i,
+            "%010d" % i,
+            "https://example.com/%d.jpg" % i,
+            ",".join((GENRES[i % len(GENRES)], GENRES[(i + 7) % len(GENRES)])),
+            "https://www.facebook.com/%d" % i,
+            "https://example.com/%d" % i,
+            "true" if i % 2 else "false",
+            "Looking for local bands",
+        )
+
+
+def show_rows(n, venues, artists):
+    start = datetime(2026, 1, 1, 20)
+    for i in range(n):
+        yield (
+            i % artists + 1,
+            i % venues + 1 if i % 100 else venues + 1,
+            # 4 hours apart, no overlapping bookings
+            (start + timedelta(hours=4 * i)).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+
+def orm_import(path):
+    """one validated row at a time through the model, like create_venue_submission"""
+    validators = importer.form_validators(importer.VenueForm, importer.VENUE_FIELDS)
+    imported = 0
+    for _, row in importer.read_rows(path):
+        row["genres"] = importer.parse_genres(row["genres"])
+        if importer.validate(row, validators):
+            continue
+        row["seeking_talent"] = importer.parse_boolean(row["seeking_talent"])
+        Venue(**row).insert()
+        imported += 1
+    return imported
+
+
+def measure(fn):
+    reset_db()
+    start = time.perf_counter()
+    imported = fn()
+    elapsed = time.perf_counter() - start
+    return imported, imported / elapsed
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    venues_csv = os.path.join(directory, "venues.csv")
+    shows_csv = os.path.join(directory, "shows.csv")
+    write_csv(venues_csv, importer.VENUE_FIELDS, venue_rows(VENUES))
+    write_csv(shows_csv, ("artist_id", "venue_id", "start_time"), show_rows(SHOWS, 1000, 1000))
+
+    print("%-24s %10s %10s" % ("venues", "imported", "rows/s"))
+    print("%-24s %10d %10.0f" % (("orm, row by row",) + measure(lambda: orm_import(venues_csv))))
+    for batch_size in (100, 1000, 5000):
+        report = lambda: importer.Importer("venues", batch_size).run(
+            importer.read_rows(venues_csv)
+        ).imported
+        print("%-24s %10d %10.0f" % (("importer, batch %d" % batch_size,) + measure(report)))
+
+    print("%-24s %10s %10s" % ("shows", "imported", "rows/s"))
+    for batch_size in (100, 1000, 5000):
+        def report():
+            seed(venues=1000, artists=1000, shows=0)
+            return importer.Importer("shows", batch_size).run(
+                importer.read_rows(shows_csv)
+            ).imported
+        print("%-24s %10d %10.0f" % (("importer, batch %d" % batch_size,) + measure(report)))
+
+
+if __name__ == "__main__":
+    main()
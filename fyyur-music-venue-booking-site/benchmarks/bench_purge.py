@@ -0,0 +1,100 @@
+"""
+Deletion of a venue with 500k shows: the former delete of the venue and all
+its shows in one transaction, against the soft-delete of the request and the
+purge of purge.py. Prints the time musicshows stays locked, i.e. the longest
+transaction, of each; fails if the counters disagree with a recount after
+the purge.
+    python benchmarks/bench_purge.py
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import reset_db, seed, timed, app
+from models import db, Venue, Artist, Musicshows, bumped
+from purge import Purger
+import counters
+
+SHOWS = 500000
+BATCH_SIZE = 1000
+
+
+def add_shows(venue_id, artists, n):
+    now = datetime.now()
+    db.session.execute(
+        Musicshows.__table__.insert(),
+        [
+            {
+                "id": i + 1,
+                "venue_id": venue_id,
+                "artist_id": 1 + i % artists,
+                "start_time": now + timedelta(hours=i % (24 * 730) - 24 * 365),
+            }
+            for i in range(n)
+        ],
+    )
+    db.session.commit()
+    counters.rebuild()
+
+
+def delete_at_once(venue_id):
+    """the venue and its shows in one transaction, rolled back"""
+    db.session.query(Artist).filter(
+        Artist.id.in_(db.session.query(Musicshows.artist_id).filter(Musicshows.venue_id == venue_id))
+    ).update(bumped(Artist), synchronize_session=False)
+    db.session.execute(Musicshows.__table__.delete().where(Musicshows.venue_id == venue_id))
+    db.session.execute(Venue.__table__.delete().where(Venue.id == venue_id))
+    db.session.rollback()
+
+
+def counts():
+    return [
+        tuple(row)
+        for model in (Venue, Artist)
+        for row in db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count)
+        .order_by(model.id)
+    ]
+
+
+def main():
+    reset_db()
+    seed(venues=100, artists=10000, shows=0)
+    add_shows(1, 10000, SHOWS)
+    print("venue 1 has %d shows" % Musicshows.query.filter_by(venue_id=1).count())
+
+    ms = timed(lambda: delete_at_once(1), repeat=1)
+    print("%-36s %10.1f ms" % ("delete in one transaction (locked):", ms))
+
+    client = app.test_client()
+    ms = timed(lambda: client.delete("/venues/1"), repeat=1)
+    print("%-36s %10.1f ms" % ("soft-delete request:", ms))
+
+    purger = Purger(batch_size=BATCH_SIZE)
+    batches = []
+    purge_batch = purger.purge_batch
+
+    def timed_batch(*args):
+        start = time.perf_counter()
+        n = purge_batch(*args)
+        batches.append((time.perf_counter() - start) * 1000)
+        return n
+
+    purger.purge_batch = timed_batch
+    start = time.perf_counter()
+    purger.run()
+    total = (time.perf_counter() - start) * 1000
+    batches.sort()
+    print("%-36s %10.1f ms" % ("purge, total:", total))
+    print("%-36s %10d" % ("purge, transactions:", len(batches)))
+    print("%-36s %10.1f ms" % ("purge, median transaction:", batches[len(batches) // 2]))
+    print("%-36s %10.1f ms" % ("purge, longest transaction (locked):", batches[-1]))
+
+    purged = counts()
+    counters.rebuild(counters.ShowCounters.current().rolled_over_at)
+    if Musicshows.query.filter_by(venue_id=1).count() or counts() != purged:
+        print("the counters disagree with a recount after the purge")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
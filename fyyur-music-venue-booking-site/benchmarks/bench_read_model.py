@@ -0,0 +1,105 @@
+"""
+Memory per entity of the read model of readmodel.py against the ORM objects
+of the same rows, and latency of the venue and artist pages rendered from
+each, with 20k venues, 50k artists and 500k shows.
+    python benchmarks/bench_read_model.py
+"""
+import gc
+import random
+import tracemalloc
+
+from common import reset_db, seed, timed, app
+from cache import page_cache
+from models import db, Venue, Artist, Musicshows
+from queries import venue_shows, artist_shows
+from readmodel import read_model, VenueRecord, ArtistRecord, VENUE_FIELDS, ARTIST_FIELDS
+
+VENUES = 20000
+ARTISTS = 50000
+SHOWS = 500000
+
+
+def allocated(fn):
+    """bytes still allocated by what fn() returns or stores"""
+    gc.collect()
+    tracemalloc.start()
+    kept = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def orm_load(model):
+    db.session.remove()
+    return model.query.all()
+
+
+def read_model_load(kind):
+    def load():
+        if kind == "venues":
+            for values in read_model.entity_rows(Venue, VENUE_FIELDS):
+                read_model.store(read_model.venues, VenueRecord, values)
+        elif kind == "artists":
+            for values in read_model.entity_rows(Artist, ARTIST_FIELDS):
+                read_model.store(read_model.artists, ArtistRecord, values)
+        else:
+            for row in read_model.show_rows():
+                read_model.add_show(*row)
+
+    return load
+
+
+def orm_venue_page(venue_id):
+    data = Venue.query.get(venue_id).details()
+    data["past_shows"], data["upcoming_shows"] = venue_shows(venue_id)
+    return data
+
+
+def orm_artist_page(artist_id):
+    data = Artist.query.get(artist_id).details()
+    data["past_shows"], data["upcoming_shows"] = artist_shows(artist_id)
+    return data
+
+
+def main():
+    reset_db()
+    seed(venues=VENUES, artists=ARTISTS, shows=SHOWS)
+
+    print("memory per entity              ORM   read model")
+    read_model.clear()
+    kinds = (("venues", Venue, VENUES), ("artists", Artist, ARTISTS), ("shows", Musicshows, SHOWS))
+    for label, model, count in kinds:
+        orm = allocated(lambda: orm_load(model))
+        compact = allocated(read_model_load(label))
+        print("  %-10s %14d B %10d B" % (label, orm / count, compact / count))
+    db.session.remove()
+    read_model.reset()
+    ms = timed(lambda: (read_model.reset(), read_model.refresh()), repeat=1)
+    print("build the read model:        %8.0f ms" % ms)
+
+    rnd = random.Random(1)
+    venue_ids = [rnd.randint(1, VENUES) for _ in range(200)]
+    artist_ids = [rnd.randint(1, ARTISTS) for _ in range(200)]
+    pages = (
+        ("venue page data", orm_venue_page, read_model.venue_page, venue_ids),
+        ("artist page data", orm_artist_page, read_model.artist_page, artist_ids),
+    )
+    print("per page, mean of 200           ORM   read model")
+    for label, orm, compact, ids in pages:
+        orm_ms = timed(lambda: [orm(key) for key in ids], repeat=3) / len(ids)
+        compact_ms = timed(lambda: [compact(key) for key in ids], repeat=3) / len(ids)
+        print("  %-20s %8.3f ms %8.3f ms" % (label, orm_ms, compact_ms))
+
+    # whole requests, without the page cache
+    backend, page_cache.backend = page_cache.backend, None
+    client = app.test_client()
+    for enabled in (False, True):
+        read_model.enabled = enabled
+        ms = timed(lambda: [client.get("/venues/%d" % key) for key in venue_ids[:50]], repeat=3) / 50
+        print("  GET /venues/<id>, %-10s %8.3f ms" % ("read model" if enabled else "ORM", ms))
+    page_cache.backend = backend
+
+
+if __name__ == "__main__":
+    main()
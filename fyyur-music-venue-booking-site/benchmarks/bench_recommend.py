@@ -0,0 +1,99 @@
+"""
+Recommendation index over synthetic data: 20k venues, 100k artists and
+300k shows. Time of the full build, of an incremental refresh after 1000
+new shows, and latency of top-10 suggestions against scoring every
+candidate in Python.
+    python benchmarks/bench_recommend.py
+Needs numpy.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam
+
+from common import reset_db, seed, timed
+from models import db, Venue, Artist, Musicshows
+from recommend import Recommender, GENRE_WEIGHT, CITY_WEIGHT, STATE_WEIGHT
+
+VENUES = 20000
+ARTISTS = 100000
+SHOWS = 300000
+
+
+def naive_venues_for(artist_id, k=10):
+    """genre and location part of the score, one venue at a time"""
+    artist = db.session.query(Artist.genres, Artist.city, Artist.state).filter(Artist.id == artist_id).one()
+    genres = set(artist.genres or ())
+    scored = []
+    for venue in db.session.query(Venue.id, Venue.genres, Venue.city, Venue.state).filter(
+        Venue.seeking_talent == True  # noqa: E712
+    ):
+        score = GENRE_WEIGHT * len(genres & set(venue.genres or ())) / max(len(genres), 1)
+        score += CITY_WEIGHT * (venue.city == artist.city and venue.state == artist.state)
+        score += STATE_WEIGHT * (venue.state == artist.state)
+        scored.append((score, venue.id))
+    return sorted(scored, reverse=True)[:k]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    reset_db()
+    seed(venues=VENUES, artists=ARTISTS, shows=SHOWS)
+    # seed() writes every row in the same second, spread them over the
+    # past days as rows would be, so that a refresh does not re-read them all
+    day_ago = datetime.utcnow() - timedelta(days=1)
+    for model, count in ((Venue, VENUES), (Artist, ARTISTS)):
+        db.session.execute(
+            model.__table__.update()
+            .where(model.id == bindparam("key"))
+            .values(updated_at=bindparam("changed")),
+            [{"key": i, "changed": day_ago - timedelta(seconds=i)} for i in range(1, count + 1)],
+        )
+    db.session.commit()
+    index = Recommender()
+
+    start = time.perf_counter()
+    index.build()
+    print("build:                  %10.0f ms" % ((time.perf_counter() - start) * 1000))
+
+    # new shows bump their venue and artist, like Musicshows.update_counters()
+    rnd = random.Random(3)
+    shows = [
+        {"id": SHOWS + i, "venue_id": rnd.randint(1, VENUES), "artist_id": rnd.randint(1, ARTISTS),
+         "start_time": datetime.now() + timedelta(days=i)}
+        for i in range(1, 1001)
+    ]
+    db.session.execute(Musicshows.__table__.insert(), shows)
+    for model, key in ((Venue, "venue_id"), (Artist, "artist_id")):
+        db.session.query(model).filter(model.id.in_({show[key] for show in shows})).update(
+            {model.updated_at: datetime.utcnow()}, synchronize_session=False
+        )
+    db.session.commit()
+    start = time.perf_counter()
+    index.refresh(force=True)
+    print("refresh, 1000 shows:    %10.0f ms (builds: %d)"
+          % ((time.perf_counter() - start) * 1000, index.builds))
+
+    # seed() makes every third artist and every other venue seeking
+    artists = [3 * rnd.randint(1, ARTISTS // 3) for _ in range(1000)]
+    venues = [2 * rnd.randint(1, VENUES // 2) for _ in range(1000)]
+    for label, suggest, keys in (
+        ("venues_for", index.venues_for, artists),
+        ("artists_for", index.artists_for, venues),
+    ):
+        samples = []
+        for key in keys:
+            start = time.perf_counter()
+            suggest(key, 10)
+            samples.append((time.perf_counter() - start) * 1000)
+        print("%-23s p50 %6.2f ms   p99 %6.2f ms" % (label + ", top 10:", *percentiles(samples)))
+    print("naive venues_for:       %10.2f ms" % timed(lambda: naive_venues_for(artists[0]), repeat=3))
+
+
+if __name__ == "__main__":
+    main()
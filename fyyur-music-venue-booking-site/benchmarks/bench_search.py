@@ -0,0 +1,44 @@
+"""
+Latency of venue search at 100k venues: the former name ILIKE with one
+count query per result against search.search().
+'lookup ms' is the index lookup and ranking alone, without show counts.
+    python benchmarks/bench_search.py
+On sqlite this measures the in-process trigram index; point DATABASE_URL
+at a migrated postgres database to measure the pg_trgm path.
+"""
+from datetime import datetime
+
+from common import reset_db, seed, timed
+from models import db, Venue, Musicshows
+from search import search, get_index
+
+
+def ilike_search(term):
+    results = db.session.query(Venue).filter(Venue.name.ilike("%" + term + "%"))
+    return [
+        db.session.query(Musicshows)
+        .filter(Musicshows.venue_id == venue.id, Musicshows.start_time > datetime.now())
+        .count()
+        for venue in results
+    ]
+
+
+def main():
+    reset_db()
+    seed(venues=100000, artists=1000, shows=200000)
+    print("index build:  %.2f ms" % timed(lambda: get_index(Venue), repeat=1))
+
+    print(
+        "%-12s %8s %10s %10s %10s"
+        % ("term", "results", "ilike ms", "lookup ms", "search ms")
+    )
+    for term in ("Venue 4242", "Venue 999", "City 7", "jazz"):
+        count = search(Venue, term)["count"]
+        before = timed(lambda: ilike_search(term), repeat=1)
+        lookup = timed(lambda: get_index(Venue).search(term), repeat=3)
+        after = timed(lambda: search(Venue, term), repeat=3)
+        print("%-12s %8d %10.2f %10.2f %10.2f" % (term, count, before, lookup, after))
+
+
+if __name__ == "__main__":
+    main()
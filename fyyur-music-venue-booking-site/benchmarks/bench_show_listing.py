@@ -0,0 +1,26 @@
+"""
+Latency of the first and of a deep /shows page at 100k shows.
+    python benchmarks/bench_show_listing.py
+Keyset pagination keeps both pages at the same cost.
+"""
+from common import reset_db, seed, count_queries, timed
+from queries import show_listing
+
+
+def main():
+    reset_db()
+    seed(venues=2000, artists=5000, shows=100000)
+
+    cursor = None
+    for _ in range(1000):
+        _, cursor = show_listing(after=cursor)
+
+    with count_queries() as statements:
+        show_listing(after=cursor)
+    print("queries per page: %d" % len(statements))
+    print("first page:       %.2f ms" % timed(lambda: show_listing()))
+    print("page 1000:        %.2f ms" % timed(lambda: show_listing(after=cursor)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Boot time and first-request latency of a fresh worker, with and without
+the template bytecode cache and the boot-time warmup.
+    python benchmarks/bench_template_startup.py
+Every mode runs in a new python process, like a restarted gunicorn worker.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["/", "/venues/create", "/artists/create", "/shows/create", "/missing"]
+
+WORKER = """
+import json, time
+start = time.perf_counter()
+from app import app
+boot = time.perf_counter() - start
+client = app.test_client()
+first = []
+for path in %(pages)r:
+    start = time.perf_counter()
+    client.get(path)
+    first.append(time.perf_counter() - start)
+start = time.perf_counter()
+for path in %(pages)r:
+    client.get(path)
+warm = time.perf_counter() - start
+print(json.dumps([boot, sum(first), warm]))
+""" % {"pages": PAGES}
+
+
+def run_worker(cache_dir, warmup):
+    env = dict(
+        os.environ,
+        DATABASE_URL="sqlite://",
+        TEMPLATE_CACHE_DIR=cache_dir,
+        TEMPLATE_WARMUP="1" if warmup else "0",
+        PYTHONWARNINGS="ignore",
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return [seconds * 1000 for seconds in json.loads(output.splitlines()[-1])]
+
+
+def main():
+    cache_dir = tempfile.mkdtemp(prefix="fyyur-templates-")
+    modes = [
+        ("no bytecode cache", "", False),
+        ("bytecode cache, cold", cache_dir, False),
+        ("bytecode cache, warm", cache_dir, False),
+        ("cache + warmup", cache_dir, True),
+    ]
+    print("%-22s %10s %16s %16s" % ("mode", "boot ms", "first reqs ms", "warm reqs ms"))
+    for name, directory, warmup in modes:
+        boot, first, warm = run_worker(directory, warmup)
+        print("%-22s %10.1f %16.1f %16.1f" % (name, boot, first, warm))
+
+
+if __name__ == "__main__":
+    main()
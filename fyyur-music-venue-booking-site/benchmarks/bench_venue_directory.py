@@ -0,0 +1,30 @@
+"""
+Query count and latency of the /venues directory as the number of venues grows.
+    python benchmarks/bench_venue_directory.py
+Exits non-zero if the query count changes with the number of venues.
+"""
+import sys
+
+from common import reset_db, seed, count_queries, timed
+from queries import venue_directory
+
+
+def main():
+    counts = set()
+    print("%8s %8s %10s" % ("venues", "queries", "best ms"))
+    for venues in (10, 100, 1000, 5000):
+        ctx = reset_db()
+        seed(venues=venues, artists=100, shows=venues * 3)
+        with count_queries() as statements:
+            venue_directory()
+        counts.add(len(statements))
+        print("%8d %8d %10.2f" % (venues, len(statements), timed(venue_directory)))
+        ctx.pop()
+
+    if len(counts) != 1:
+        print("query count grows with the number of venues: %s" % sorted(counts))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Throughput of concurrent venue inserts, one commit per insert against
+the group commit queue (writebehind.py), with 16 threads submitting 100
+venues each. Runs on a sqlite file, commits are fsync'd.
+    python benchmarks/bench_write_behind.py
+Set DATABASE_URL to a migrated postgres database to measure it there.
+"""
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault(
+    "DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+)
+
+from common import reset_db, app
+from models import db, Venue
+from writebehind import GroupCommitQueue
+import models
+
+THREADS = 16
+INSERTS = 100
+
+
+def submitter(n):
+    with app.app_context():
+        for i in range(INSERTS):
+            Venue(
+                name="Venue %d-%d" % (n, i),
+                genres=["Jazz"],
+                address="1015 Folsom Street",
+                city="San Francisco",
+                state="CA",
+                phone="1234567890",
+                website_link="https://example.com",
+                facebook_link="https://www.facebook.com/example",
+                image_link="https://example.com/venue.jpg",
+            ).insert()
+        db.session.remove()
+
+
+def run():
+    threads = [threading.Thread(target=submitter, args=(n,)) for n in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return THREADS * INSERTS / (time.perf_counter() - start)
+
+
+def main():
+    reset_db().pop()
+    print("%-28s %10s %14s" % ("mode", "rows/s", "rows/commit"))
+    print("%-28s %10.0f %14.1f" % ("commit per insert", run(), 1))
+
+    for max_rows, max_delay in ((100, 0.002), (100, 0.005)):
+        reset_db().pop()
+        models.write_queue = GroupCommitQueue(app, max_rows=max_rows, max_delay=max_delay)
+        rate = run()
+        models.write_queue.stop()
+        stats = models.write_queue.stats()
+        models.write_queue = None
+        print("%-28s %10.0f %14.1f" % (
+            "group commit, %.0f ms" % (max_delay * 1000), rate, stats["rows_per_group"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Shared setup for the benchmark scripts in this folder.
+Benchmarks run against DATABASE_URL (an in-memory sqlite database by default),
+create the tables and seed synthetic venues, artists and shows.
+"""
+import os
+import sys
+import time
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SCHEDULER", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue, Artist, Musicshows
+from forms import state_choices, genre_choices
+import counters
+
+# sqlite cannot autoincrement a column of a composite primary key,
+# seed() assigns the show ids itself
+Musicshows.__table__.c.id.autoincrement = "auto"
+
+STATES = [state[0] for state in state_choices]
+GENRES = [genre[0] for genre in genre_choices]
+
+
+def reset_db():
+    """pushes an app context and recreates all tables"""
+    ctx = app.app_context()
+    ctx.push()
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    return ctx
+
+
+def seed(venues, artists, shows, cities=50, rnd=None):
+    """bulk inserts synthetic rows, ids start at 1 for every table"""
+    rnd = rnd or random.Random(42)
+    now = datetime.now()
+    db.session.execute(
+        Venue.__table__.insert(),
+        [
+            {
+                "id": i,
+                "name": "Venue %d" % i,
+                "city": "City %d" % (i % cities),
+                "state": STATES[i % len(STATES)],
+                "address": "%d Main Street" % i,
+                "phone": "%010d" % i,
+                "genres": rnd.sample(GENRES, 2),
+                "seeking_talent": i % 2 == 0,
+            }
+            for i in range(1, venues + 1)
+        ],
+    )
+    db.session.execute(
+        Artist.__table__.insert(),
+        [
+            {
+                "id": i,
+                "name": "Artist %d" % i,
+                "city": "City %d" % (i % cities),
+                "state": STATES[i % len(STATES)],
+                "phone": "%010d" % i,
+                "genres": rnd.sample(GENRES, 2),
+                "seeking_venue": i % 3 == 0,
+            }
+            for i in range(1, artists + 1)
+        ],
+    )
+    if shows:
+        db.session.execute(
+            Musicshows.__table__.insert(),
+            [
+                {
+                    "id": i,
+                    "venue_id": rnd.randint(1, venues),
+                    "artist_id": rnd.randint(1, artists),
+                    "start_time": now + timedelta(hours=rnd.randint(-24 * 365, 24 * 365)),
+                }
+                for i in range(1, shows + 1)
+            ],
+        )
+    db.session.commit()
+    counters.rebuild()
+
+
+@contextmanager
+def count_queries():
+    """collects every statement sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_engine()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def timed(fn, repeat=5):
+    """returns the best wall time of fn() in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,134 @@
+"""
+Detection of overlapping bookings.
+
+A show books its venue and its artist for [start_time, start_time +
+SHOW_DURATION). Two bookings of the same venue or artist overlap when
+their start times are less than SHOW_DURATION apart.
+
+find_conflict() checks one new show against the database with a range seek
+on the (venue_id, start_time) and (artist_id, start_time) indexes. On
+postgresql the exclusion constraints of migration a3e5c7f9b2d4 also reject
+overlaps committed concurrently, as an IntegrityError. Shows of deleted
+venues and artists book nothing, though the constraints still see them
+until purge.py removes them, upcoming shows first.
+
+Batches, e.g. a bulk import, are validated in memory with BookingIndex,
+which keeps the start times of each venue and artist sorted. All bookings
+have the same length, so the sorted starts are an interval index: a
+conflict is the nearest start on either side, found by bisection.
+"""
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from sqlalchemy import and_, or_
+
+from models import db, Musicshows, SHOW_DURATION, listed_shows
+
+
+def find_conflict(venue_id, artist_id, start_time):
+    """Returns the show overlapping a new show of the venue and artist at
+    start_time, None if both are free.
+    Arguments:
+        venue_id {int} -- venue id
+        artist_id {int} -- artist id
+        start_time {datetime} -- start of the new show
+    Returns:
+        Musicshows -- id, venue_id, artist_id and start_time of the conflict
+    """
+    window = and_(
+        Musicshows.start_time > start_time - SHOW_DURATION,
+        Musicshows.start_time < start_time + SHOW_DURATION,
+    )
+    return (
+        db.session.query(
+            Musicshows.id, Musicshows.venue_id, Musicshows.artist_id, Musicshows.start_time
+        )
+        .filter(
+            or_(
+                and_(Musicshows.venue_id == venue_id, window),
+                and_(Musicshows.artist_id == artist_id, window),
+            ),
+            listed_shows(),
+        )
+        .first()
+    )
+
+
+def conflict_message(who, start_time):
+    return "The {} is already booked for a show at {}".format(
+        who, start_time.strftime("%Y-%m-%d %H:%M")
+    )
+
+
+def describe(conflict, venue_id):
+    """error message for the show returned by find_conflict()"""
+    who = "venue" if conflict.venue_id == venue_id else "artist"
+    return conflict_message(who, conflict.start_time)
+
+
+class BookingIndex:
+    """sorted start times of the bookings of each venue or artist"""
+
+    def __init__(self):
+        self.starts = defaultdict(list)
+
+    def add(self, key, start_time):
+        insort(self.starts[key], start_time)
+
+    def conflict(self, key, start_time):
+        """returns the start of a booking of key overlapping one at start_time, or None"""
+        starts = self.starts.get(key)
+        if not starts:
+            return None
+        i = bisect_left(starts, start_time)
+        if i < len(starts) and starts[i] - start_time < SHOW_DURATION:
+            return starts[i]
+        if i > 0 and start_time - starts[i - 1] < SHOW_DURATION:
+            return starts[i - 1]
+        return None
+
+
+class Bookings:
+    """
+    Booking indexes of venues and artists, for validating many new shows
+    against each other and against the shows already in the database.
+    """
+
+    def __init__(self):
+        self.venues = BookingIndex()
+        self.artists = BookingIndex()
+
+    @classmethod
+    def load(cls):
+        """indexes all shows of the database, read in one streamed query"""
+        bookings = cls()
+        rows = (
+            db.session.query(Musicshows.venue_id, Musicshows.artist_id, Musicshows.start_time)
+            .filter(listed_shows())
+            .yield_per(10000)
+        )
+        for venue_id, artist_id, start_time in rows:
+            bookings.add(venue_id, artist_id, start_time)
+        return bookings
+
+    def add(self, venue_id, artist_id, start_time):
+        self.venues.add(venue_id, start_time)
+        self.artists.add(artist_id, start_time)
+
+    def check(self, venue_id, artist_id, start_time):
+        """returns an error message if the show overlaps a known booking, else None"""
+        for who, index, key in (
+            ("venue", self.venues, venue_id),
+            ("artist", self.artists, artist_id),
+        ):
+            other = index.conflict(key, start_time)
+            if other is not None:
+                return conflict_message(who, other)
+        return None
+
+    def book(self, venue_id, artist_id, start_time):
+        """checks the show and, if free, adds it; returns the error message or None"""
+        error = self.check(venue_id, artist_id, start_time)
+        if error is None:
+            self.add(venue_id, artist_id, start_time)
+        return error
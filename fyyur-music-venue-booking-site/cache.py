@@ -0,0 +1,324 @@
+"""
+Page cache for the read-only views.
+
+Rendered pages are stored under their request path and tagged with the
+entities they show, e.g. "venue:3" or "shows". Writes call invalidate()
+with the tags they affect, which bumps the tag's version; entries stored
+under an older version of any of their tags are treated as misses.
+
+Two backends are available, chosen with CACHE_BACKEND in config.py:
+"memory", a per-process LRU with TTL, and "redis", shared by all workers.
+With "memory" each gunicorn worker has its own cache and only sees the
+invalidations of its own writes; other workers serve their copy until
+CACHE_TTL expires.
+Any client with the get/set/mget/incr/scan_iter/unlink methods of redis-py
+can stand in for redis, e.g. LocalRedis in tests.
+
+With read replicas a page rendered right after an invalidation may come
+from a replica that has not replayed the write yet. For replica_lag seconds
+after a tag is bumped (READ_YOUR_WRITES, see routing.py) the tag is held:
+pages rendered on a replica are served but not stored under it. The redis backend only
+touches keys under its prefix, the database may be shared with other data.
+"""
+import json
+import math
+from fnmatch import fnmatchcase
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import g, request, session
+
+from routing import router
+
+
+class MemoryBackend:
+    """LRU of at most maxsize entries, each expiring ttl seconds after it is set"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # tag versions are never evicted, an evicted version would reset to 0
+        # and make entries stored before an invalidation valid again
+        self.tags = {}
+        # tag -> time.monotonic() until which it is held
+        self.holds = {}
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def versions(self, tags):
+        with self.lock:
+            return [self.tags.get(tag, 0) for tag in tags]
+
+    def bump(self, tag):
+        with self.lock:
+            self.tags[tag] = self.tags.get(tag, 0) + 1
+
+    def hold(self, tag, seconds):
+        with self.lock:
+            self.holds[tag] = time.monotonic() + seconds
+
+    def held(self, tags):
+        now = time.monotonic()
+        with self.lock:
+            return any(self.holds.get(tag, 0) > now for tag in tags)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+            self.holds.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# keys per SCAN step and per UNLINK of RedisBackend.clear()
+SCAN_COUNT = 500
+
+
+class RedisBackend:
+    """entries and tag versions kept in redis, shared by all workers"""
+
+    def __init__(self, client, ttl=60, prefix="fyyur:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + "page:" + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + "page:" + key, json.dumps(value), ex=self.ttl)
+
+    def versions(self, tags):
+        values = self.client.mget([self.prefix + "tag:" + tag for tag in tags])
+        return [int(value or 0) for value in values]
+
+    def bump(self, tag):
+        self.client.incr(self.prefix + "tag:" + tag)
+
+    def hold(self, tag, seconds):
+        self.client.set(self.prefix + "held:" + tag, 1, ex=math.ceil(seconds))
+
+    def held(self, tags):
+        return any(self.client.mget([self.prefix + "held:" + tag for tag in tags]))
+
+    def scan(self, pattern):
+        """keys matching pattern, read with SCAN so redis is never blocked
+        for the whole keyspace as with KEYS"""
+        return self.client.scan_iter(match=self.prefix + pattern, count=SCAN_COUNT)
+
+    def clear(self):
+        """deletes the entries and tag versions, and only those"""
+        keys = []
+        for key in self.scan("*"):
+            keys.append(key)
+            if len(keys) == SCAN_COUNT:
+                self.client.unlink(*keys)
+                keys = []
+        if keys:
+            self.client.unlink(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.scan("page:*"))
+
+
+class LocalRedis:
+    """in-process stand-in for a redis client, implements what RedisBackend uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value, expires = self.data.get(key, (None, None))
+            if expires is not None and expires < time.monotonic():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        with self.lock:
+            expires = None if ex is None else time.monotonic() + ex
+            self.data[key] = (value.encode() if isinstance(value, str) else value, expires)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def incr(self, key):
+        with self.lock:
+            value, expires = self.data.get(key, (b"0", None))
+            value = int(value) + 1
+            self.data[key] = (str(value).encode(), expires)
+            return value
+
+    def scan_iter(self, match="*", count=None):
+        with self.lock:
+            keys = [key for key in self.data if fnmatchcase(key, match)]
+        return iter(keys)
+
+    def unlink(self, *keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+class PageCache:
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.replica_lag = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shared(self):
+        """whether the invalidations of other workers reach this cache"""
+        return isinstance(self.backend, RedisBackend)
+
+    def get(self, key):
+        """returns the value stored under key, None if missing, expired or invalidated"""
+        entry = self.backend.get(key)
+        if entry is not None:
+            tags = list(entry["tags"])
+            if self.backend.versions(tags) == [entry["tags"][tag] for tag in tags]:
+                self.hits += 1
+                return entry["value"]
+        self.misses += 1
+        return None
+
+    def snapshot(self, tags):
+        """returns {tag: current version} for tags"""
+        tags = sorted(set(tags))
+        return dict(zip(tags, self.backend.versions(tags)))
+
+    def set(self, key, value, tags):
+        """stores value under key. tags maps each tag to the version read
+        before the value was computed, see snapshot(), so that an
+        invalidation racing with the computation is not lost.
+        Returns false if the value was read on a replica while one of
+        its tags is held, and was not stored."""
+        if self.replica_lag and g.get("replica") is not None and self.backend.held(list(tags)):
+            return False
+        self.backend.set(key, {"value": value, "tags": tags})
+        return True
+
+    def invalidate(self, *tags):
+        if not self.enabled:
+            return
+        for tag in tags:
+            self.backend.bump(tag)
+            if self.replica_lag:
+                self.backend.hold(tag, self.replica_lag)
+        self.invalidations += len(tags)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.enabled else None,
+            "entries": len(self.backend) if self.enabled else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.backend.evictions if self.enabled else 0,
+        }
+
+    def reset_stats(self):
+        self.hits = self.misses = self.invalidations = 0
+
+
+page_cache = PageCache()
+
+
+def init_cache(app):
+    """configures page_cache from the app config"""
+    backend = app.config.get("CACHE_BACKEND", "memory")
+    ttl = app.config.get("CACHE_TTL", 60)
+    if backend == "memory":
+        page_cache.backend = MemoryBackend(app.config.get("CACHE_MAXSIZE", 1024), ttl)
+    elif backend == "redis":
+        # optional dependency, only needed for the shared backend
+        import redis
+
+        client = redis.Redis.from_url(app.config["CACHE_REDIS_URL"])
+        page_cache.backend = RedisBackend(client, ttl)
+    else:
+        page_cache.backend = None
+    # replicas may lag behind the primary by up to the read-your-writes window
+    page_cache.replica_lag = app.config.get("READ_YOUR_WRITES", 5) if app.config.get("REPLICA_BINDS") else 0
+    return page_cache
+
+
+def add_cache_tags(*tags):
+    """tags the page being rendered with entities known only after querying"""
+    g.setdefault("cache_tags", []).extend(tags)
+
+
+def cached_page(*tags):
+    """Caches the rendered page of a GET view under its path and query string.
+    tags are formatted with the view arguments, e.g. "venue:{venue_id}".
+    Pages are not cached while the user has flashed messages waiting, nor
+    served from the cache right after the user wrote while replicas are
+    configured: the cached page may come from a replica that lagged. Pages
+    rendered on a replica right after an invalidation are not cached, see
+    PageCache.set().
+    Under conditional_page() the key includes the ETag of the entity, the
+    page served always matches the version it is sent with.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not page_cache.enabled or session.get("_flashes"):
+                return view(**kwargs)
+            if router.replicas and router.recently_wrote():
+                return view(**kwargs)
+
+            key = request.full_path
+            if "page_etag" in g:
+                key = "%s#%s" % (key, g.page_etag)
+            page = page_cache.get(key)
+            if page is not None:
+                return page
+
+            versions = page_cache.snapshot(tag.format(**kwargs) for tag in tags)
+            g.cache_tags = []
+            page = view(**kwargs)
+            if isinstance(page, str):
+                versions.update(page_cache.snapshot(g.cache_tags))
+                page_cache.set(key, page, versions)
+            return page
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,70 @@
+"""
+Conditional GET for the venue and artist pages.
+
+The ETag of a page is the version of its entity and Last-Modified its
+updated_at, see models.Versioned. Both are read with one primary key
+lookup before the view runs; a client holding the current version gets
+304 Not Modified without the page being queried or rendered.
+Pages split their shows into past and upcoming when rendered, and a copy
+stays current until the next counter roll-over bumps the versions of the
+entities whose shows it moved: a show may be listed as upcoming for up to
+ROLLOVER_INTERVAL after it started.
+The ETag is left in g.page_etag for cached_page(), which caches the page
+under it, so a 200 never pairs an ETag with a body of an older version.
+"""
+from functools import wraps
+
+from flask import Response, g, make_response, request, session
+
+from models import db
+
+
+def page_validators(model, key):
+    """returns (etag, last_modified) of the page of the entity, None if it does not exist"""
+    row = db.session.query(model.version, model.updated_at).filter(model.id == key).first()
+    if row is None:
+        return None
+    etag = "{}-{}-{}".format(model.__tablename__, key, row.version)
+    # http dates have a precision of one second
+    return etag, row.updated_at.replace(microsecond=0)
+
+
+def is_fresh(etag, last_modified):
+    """true if the client's copy is current, If-None-Match wins over If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return last_modified <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional_page(model, key):
+    """Answers conditional GETs of the view with 304 when the entity, whose
+    id is the view argument key, has not changed.
+    Pages are always rendered while the user has flashed messages waiting.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if session.get("_flashes"):
+                return view(**kwargs)
+            validators = page_validators(model, kwargs[key])
+            if validators is None:
+                return view(**kwargs)
+
+            etag, last_modified = validators
+            g.page_etag = etag
+            if is_fresh(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(**kwargs))
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # browsers revalidate on every visit instead of guessing freshness
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,8 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie. Every worker needs the same key to read the
+# cookies of the others, set SECRET_KEY in the environment; the random
+# default only suits a single worker.
+SECRET_KEY = os.environ.get("SECRET_KEY") or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -7,5 +10,109 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
 
 # Connect to a local postgresql database server:  DATABASE URL -->
-SQLALCHEMY_DATABASE_URI = "postgres://{}:{}@{}/{}".format('jaishree','password','localhost:5432','fyyur')
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    "DATABASE_URL",
+    "postgres://{}:{}@{}/{}".format('jaishree','password','localhost:5432','fyyur'),
+)
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Connection pool of each worker. A worker holds at most
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, size gunicorn's workers so
+# that workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays below postgres'
+# max_connections. Usage is served at /metrics, see poolmetrics.py.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+# seconds after which a connection is replaced, below server/proxy idle timeouts
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+# test connections on checkout, drops the ones closed by a postgres restart
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+# sqlite (the test suite) uses a single static connection or none
+if SQLALCHEMY_DATABASE_URI.startswith("postgres"):
+    SQLALCHEMY_ENGINE_OPTIONS.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        # psycopg2 sends executemany() as pages of multi-row
+        # INSERT ... VALUES, used by the bulk import, see importer.py
+        executemany_mode="values",
+    )
+
+# Read replicas, comma separated urls in DATABASE_REPLICA_URLS. Read-only
+# views query them, picked "round_robin" or "least_loaded"; a client reads
+# from the primary for READ_YOUR_WRITES seconds after a write, and pages read
+# on a replica are not cached for as long after an invalidation. See routing.py
+REPLICA_BINDS = []
+SQLALCHEMY_BINDS = {}
+for i, url in enumerate(filter(None, os.environ.get("DATABASE_REPLICA_URLS", "").split(","))):
+    REPLICA_BINDS.append("replica%d" % i)
+    SQLALCHEMY_BINDS["replica%d" % i] = url.strip()
+REPLICA_STRATEGY = os.environ.get("REPLICA_STRATEGY", "round_robin")
+READ_YOUR_WRITES = 5
+# the read-your-writes stamp lives in the session cookie, which any worker
+# must be able to read
+if REPLICA_BINDS and not os.environ.get("SECRET_KEY"):
+    raise RuntimeError("DATABASE_REPLICA_URLS needs a SECRET_KEY shared by all workers")
+
+# Profile the SQL of every request: query count, time, slowest statements
+# and repeated statements go to the log and the X-SQL-Profile header.
+# See profiler.py.
+SQL_PROFILE = os.environ.get("SQL_PROFILE", "0") == "1"
+SQL_PROFILE_SLOWEST = 3
+
+# Page cache of the read-only views, see cache.py
+# "memory" (per worker), "redis" (shared, needs the redis package) or "none"
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL = 60
+CACHE_MAXSIZE = 1024
+
+# Compiled templates are cached as bytecode in this folder, shared by all
+# workers and restarts. An empty value disables the cache.
+TEMPLATE_CACHE_DIR = os.environ.get(
+    "TEMPLATE_CACHE_DIR", os.path.join(basedir, ".template_cache")
+)
+# Compile all templates when the app boots instead of on first request
+TEMPLATE_WARMUP = os.environ.get("TEMPLATE_WARMUP", "1") == "1"
+
+# Group commit of inserts, see writebehind.py. Submissions wait for their
+# group of at most WRITE_BEHIND_MAX_ROWS rows, collected for at most
+# WRITE_BEHIND_MAX_DELAY seconds, to be committed.
+WRITE_BEHIND = os.environ.get("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_MAX_ROWS = 100
+WRITE_BEHIND_MAX_DELAY = 0.005
+
+# Venue/artist recommendations (needs numpy), see recommend.py. The
+# in-memory index picks up changes at most this many seconds apart.
+RECOMMEND_REFRESH = 5
+
+# Venue and artist pages render from an in-memory read model of the catalog
+# instead of ORM objects, see readmodel.py. Changes of other workers are
+# picked up at most READ_MODEL_REFRESH seconds apart.
+READ_MODEL = os.environ.get("READ_MODEL", "0") == "1"
+READ_MODEL_REFRESH = 5
+
+# The in-memory index of venues near a point, see geo.py, picks up the
+# changes of other workers at most this many seconds apart.
+GEO_REFRESH = 5
+
+# Background jobs of each worker, see scheduler.py. The home page lists are
+# recomputed every DASHBOARD_INTERVAL seconds, see dashboard.py.
+SCHEDULER = os.environ.get("SCHEDULER", "1") == "1"
+DASHBOARD_INTERVAL = 60
+# started shows move from the upcoming to the past counters of their venue
+# and artist every ROLLOVER_INTERVAL seconds, see counters.py
+ROLLOVER_INTERVAL = 300
+
+# Deleted venues and artists are hidden at once and removed with their shows
+# by a background job every PURGE_INTERVAL seconds, see purge.py. Shows are
+# deleted PURGE_BATCH_SIZE per transaction, at most PURGE_MAX_BATCHES per run.
+PURGE_INTERVAL = 60
+PURGE_BATCH_SIZE = 1000
+PURGE_MAX_BATCHES = 100
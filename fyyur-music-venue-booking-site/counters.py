@@ -0,0 +1,106 @@
+"""
+Maintenance of the upcoming/past show counters stored on Venue and Artist.
+
+Musicshows.update_counters() counts every new show when it is inserted.
+Shows of a deleted venue or artist leave the counters of the other side on
+deletion (models.uncount_shows()) and are no longer counted afterwards.
+Shows then move from upcoming to past as time passes; roll_over() moves the
+shows that started since the last run. It runs every ROLLOVER_INTERVAL
+seconds on the scheduler of each worker (see init_counters()), or from cron
+with `flask rollover-show-counters` when the scheduler is off. rebuild()
+recounts everything from scratch.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, func, select
+
+from cache import page_cache
+from models import db, Venue, Artist, Musicshows, ShowCounters, bumped, listed_shows
+
+COUNTED = ((Venue, Musicshows.venue_id), (Artist, Musicshows.artist_id))
+
+
+def roll_over(now=None):
+    """Moves shows that started since the previous roll-over
+    from the upcoming to the past counters.
+    Keyword Arguments:
+        now {datetime} -- new watermark (default: now)
+    Returns:
+        int -- number of shows moved
+    """
+    if now is None:
+        now = datetime.now()
+    state = ShowCounters.current(lock="update")
+    if now <= state.rolled_over_at:
+        db.session.commit()
+        return 0
+
+    moved = 0
+    for model, key in COUNTED:
+        rows = (
+            db.session.query(key, func.count(Musicshows.id))
+            .filter(
+                Musicshows.start_time > state.rolled_over_at,
+                Musicshows.start_time <= now,
+                # shows of deleted entries left the counters on deletion
+                listed_shows(),
+            )
+            .group_by(key)
+            .all()
+        )
+        if not rows:
+            continue
+        table = model.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam("key"))
+            .values(
+                upcoming_shows_count=table.c.upcoming_shows_count - bindparam("n"),
+                past_shows_count=table.c.past_shows_count + bindparam("n"),
+                **bumped(table.c)
+            ),
+            [{"key": key_id, "n": n} for key_id, n in rows],
+        )
+        if model is Venue:
+            moved = sum(n for _, n in rows)
+
+    state.rolled_over_at = now
+    db.session.commit()
+    page_cache.invalidate("venues")
+    return moved
+
+
+def count_shows(*conditions):
+    """correlated subquery counting the shows matching conditions"""
+    return select([func.count(Musicshows.id)]).where(and_(*conditions)).as_scalar()
+
+
+def rebuild(now=None):
+    """Recounts the upcoming and past shows of every venue and artist.
+    Keyword Arguments:
+        now {datetime} -- new watermark (default: now)
+    """
+    if now is None:
+        now = datetime.now()
+    state = ShowCounters.current(lock="update")
+    for model, key in COUNTED:
+        db.session.query(model).update(
+            {
+                model.upcoming_shows_count: count_shows(
+                    key == model.id, Musicshows.start_time > now, listed_shows()
+                ),
+                model.past_shows_count: count_shows(
+                    key == model.id, Musicshows.start_time <= now, listed_shows()
+                ),
+                **bumped(model),
+            },
+            synchronize_session=False,
+        )
+    state.rolled_over_at = now
+    db.session.commit()
+    page_cache.invalidate("venues")
+
+
+def init_counters(app, scheduler):
+    """schedules the roll-over of the show counters"""
+    scheduler.every(app.config.get("ROLLOVER_INTERVAL", 300), roll_over, "rollover")
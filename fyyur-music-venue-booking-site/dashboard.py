@@ -0,0 +1,107 @@
+"""
+Snapshot of the home page aggregates, precomputed by the scheduler.
+
+Every DASHBOARD_INTERVAL seconds refresh() computes
+    trending -- venues with the most shows in the next TRENDING_DAYS days
+    artists  -- the most recently listed artists
+    shows    -- the next shows of the coming 7 days
+and swaps them in as one snapshot. The home page only reads the snapshot,
+it sends no query; until the first refresh it shows none of the lists.
+Each worker keeps its own snapshot.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from models import db, Venue, Artist, Musicshows
+
+TRENDING_DAYS = 14
+TRENDING_VENUES = 6
+RECENT_ARTISTS = 6
+WEEK_SHOWS = 10
+
+
+def trending_venues(now, limit=TRENDING_VENUES):
+    shows = func.count(Musicshows.id).label("num_upcoming_shows")
+    rows = (
+        db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.image_link, shows)
+        .join(Musicshows, Musicshows.venue_id == Venue.id)
+        .filter(Musicshows.start_time >= now, Musicshows.start_time < now + timedelta(days=TRENDING_DAYS))
+        .group_by(Venue.id, Venue.name, Venue.city, Venue.state, Venue.image_link)
+        .order_by(shows.desc(), Venue.id)
+        .limit(limit)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
+def recent_artists(limit=RECENT_ARTISTS):
+    rows = (
+        db.session.query(Artist.id, Artist.name, Artist.city, Artist.state, Artist.image_link)
+        .order_by(Artist.id.desc())
+        .limit(limit)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
+def week_shows(now, limit=WEEK_SHOWS):
+    rows = (
+        db.session.query(
+            Musicshows.start_time,
+            Musicshows.venue_id,
+            Venue.name.label("venue_name"),
+            Musicshows.artist_id,
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+        )
+        .join(Venue, Venue.id == Musicshows.venue_id)
+        .join(Artist, Artist.id == Musicshows.artist_id)
+        .filter(Musicshows.start_time >= now, Musicshows.start_time < now + timedelta(days=7))
+        .order_by(Musicshows.start_time, Musicshows.id)
+        .limit(limit)
+        .all()
+    )
+    return [row._asdict() for row in rows]
+
+
+class Dashboard:
+    def __init__(self):
+        self.snapshot = None
+        self.lock = threading.Lock()
+
+    def refresh(self, now=None):
+        """Computes a new snapshot and swaps it in.
+        Keyword Arguments:
+            now {datetime} -- start of the upcoming windows (default: now)
+        Returns:
+            dictionary -- the snapshot
+        """
+        if now is None:
+            now = datetime.now()
+        snapshot = {
+            "trending": trending_venues(now),
+            "trending_days": TRENDING_DAYS,
+            "artists": recent_artists(),
+            "shows": week_shows(now),
+            "computed_at": now,
+        }
+        db.session.commit()
+        with self.lock:
+            self.snapshot = snapshot
+        return snapshot
+
+    def get(self):
+        """the latest snapshot, None before the first refresh"""
+        with self.lock:
+            return self.snapshot
+
+
+dashboard = Dashboard()
+
+
+def init_dashboard(app, scheduler):
+    """schedules the refresh of the snapshot"""
+    scheduler.every(app.config.get("DASHBOARD_INTERVAL", 60), dashboard.refresh, "dashboard")
+    return dashboard
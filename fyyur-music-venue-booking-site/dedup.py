@@ -0,0 +1,245 @@
+"""
+Duplicate detection of venues and artists.
+
+Names, phone numbers and addresses are normalized into blocking keys, kept
+in indexed columns of venue and artist (migration e3b5d7f9a1c4):
+    name_key    -- words of the name without articles, punctuation and word
+                   order, with the city and state: "The Musical Hop" and
+                   "Musical Hop, The" in San Francisco are both
+                   "hop musical|san francisco|CA"
+    phone_key   -- digits of the phone number, without the country code
+    address_key -- street address of a venue with the usual abbreviations,
+                   with the city and state
+Keys are set on flush and by the bulk import. Two entries are duplicates if
+they share their name key, or share their phone or address key and have
+names with a trigram similarity (see search.py) of NAME_SIMILARITY or more.
+
+find_duplicates() reads the candidates of a new entry with one query per key
+index, before it is created. cluster() groups the duplicates of a
+whole table: a GROUP BY of each key column finds the shared keys, only the
+rows holding one are read, and they are merged into clusters with a
+union-find.
+"""
+import re
+import unicodedata
+from itertools import groupby
+
+from sqlalchemy import bindparam, event, func
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Artist
+from search import similarity
+
+NAME_SIMILARITY = 0.5
+# entries sharing a phone or address key beyond this many are not compared,
+# such keys are placeholders rather than evidence, e.g. a booking agency's
+# phone number
+MAX_BLOCK = 50
+# rows per UPDATE of fill_keys()
+KEY_BATCH = 5000
+
+ARTICLES = {"the", "a", "an", "and"}
+ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "av": "ave", "road": "rd", "boulevard": "blvd",
+    "drive": "dr", "lane": "ln", "place": "pl", "court": "ct", "square": "sq",
+    "highway": "hwy", "parkway": "pkwy", "terrace": "ter", "suite": "ste",
+    "north": "n", "south": "s", "east": "e", "west": "w", "saint": "st",
+}
+WORDS = re.compile(r"[a-z0-9]+")
+
+
+def words(text):
+    """lowercased words of text, accents and punctuation removed"""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return WORDS.findall(text.replace("&", " and ").lower())
+
+
+def place(city, state):
+    return "{}|{}".format(" ".join(words(city)), state or "")
+
+
+def name_core(name):
+    """words of a name without articles, "Musical Hop, The" is "musical hop" """
+    return " ".join(word for word in words(name) if word not in ARTICLES)
+
+
+def name_key(name, city, state):
+    core = sorted(name_core(name).split())
+    return "{}|{}".format(" ".join(core), place(city, state)) if core else None
+
+
+def phone_key(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    return digits if len(digits) >= 7 else None
+
+
+def address_key(address, city, state):
+    street = [ABBREVIATIONS.get(word, word) for word in words(address)]
+    return "{}|{}".format(" ".join(street), place(city, state)) if street else None
+
+
+def key_columns(model):
+    if model is Venue:
+        return ("name_key", "phone_key", "address_key")
+    return ("name_key", "phone_key")
+
+
+def blocking_keys(model, values):
+    """Returns the blocking keys of a venue or artist.
+    Arguments:
+        model -- Venue or Artist
+        values {dictionary} -- name, city, state, phone and, for venues, address
+    Returns:
+        dictionary -- key column: key, None for fields without a usable key
+    """
+    keys = {
+        "name_key": name_key(values.get("name"), values.get("city"), values.get("state")),
+        "phone_key": phone_key(values.get("phone")),
+    }
+    if model is Venue:
+        keys["address_key"] = address_key(values.get("address"), values.get("city"), values.get("state"))
+    return keys
+
+
+def entity_values(entity):
+    return {field: getattr(entity, field, None) for field in ("name", "city", "state", "phone", "address")}
+
+
+@event.listens_for(Session, "before_flush")
+def set_keys(session, flush_context, instances):
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, (Venue, Artist)):
+            for column, key in blocking_keys(type(entity), entity_values(entity)).items():
+                setattr(entity, column, key)
+
+
+def matches(shared_name, a, b):
+    """whether two entries sharing a key are duplicates"""
+    return shared_name or similarity(name_core(a), name_core(b)) >= NAME_SIMILARITY
+
+
+def find_duplicates(model, values):
+    """Returns the existing entries a new venue or artist duplicates.
+    Arguments:
+        model -- Venue or Artist
+        values {dictionary} -- fields of the new entry, see blocking_keys()
+    Returns:
+        list of tuple -- (id, name) of the duplicates
+    """
+    keys = {column: key for column, key in blocking_keys(model, values).items() if key}
+    duplicates = {}
+    for column, key in keys.items():
+        query = (
+            db.session.query(model.id, model.name)
+            .filter(getattr(model, column) == key)
+            .order_by(model.id)
+        )
+        if column == "name_key":
+            rows = query.all()
+        else:
+            # as in cluster(), an oversized phone or address block is skipped
+            rows = query.limit(MAX_BLOCK + 1).all()
+            if len(rows) > MAX_BLOCK:
+                continue
+        for row in rows:
+            if matches(column == "name_key", row.name, values.get("name")):
+                duplicates[row.id] = row.name
+    return sorted(duplicates.items())
+
+
+def fill_keys(model, batch_size=KEY_BATCH):
+    """sets the keys of the rows written without them, e.g. before migration
+    e3b5d7f9a1c4 or by bulk inserts; returns the number of rows keyed"""
+    table = model.__table__
+    columns = key_columns(model)
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("entity_id"))
+        .values({column: bindparam("new_" + column) for column in columns})
+    )
+    fields = [getattr(model, field) for field in ("name", "city", "state", "phone")]
+    if model is Venue:
+        fields.append(Venue.address)
+    keyed, after = 0, 0
+    while True:
+        rows = (
+            db.session.query(model.id, *fields)
+            .filter(model.name_key.is_(None), model.id > after)
+            .order_by(model.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        after = rows[-1].id
+        values = []
+        for row in rows:
+            keys = blocking_keys(model, row._asdict())
+            values.append(dict({"new_" + c: keys[c] for c in columns}, entity_id=row.id))
+        db.session.execute(update, values)
+        db.session.commit()
+        keyed += len(values)
+    return keyed
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        self.parent.setdefault(key, key)
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def groups(self):
+        groups = {}
+        for key in self.parent:
+            groups.setdefault(self.find(key), []).append(key)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+
+def cluster(model):
+    """Groups the duplicates of a whole table, keying rows without keys first.
+    Arguments:
+        model -- Venue or Artist
+    Returns:
+        list of list -- (id, name) of the entries of each cluster of two or
+        more duplicates, ordered by id
+    """
+    fill_keys(model)
+    clusters = UnionFind()
+    names = {}
+    for column in key_columns(model):
+        column = getattr(model, column)
+        shared = (
+            db.session.query(column)
+            .filter(column.isnot(None))
+            .group_by(column)
+            .having(func.count() > 1)
+        )
+        rows = (
+            db.session.query(column.label("key"), model.id, model.name)
+            .filter(column.in_(shared))
+            .order_by(column, model.id)
+        )
+        for _, group in groupby(rows, key=lambda row: row.key):
+            group = list(group)
+            if column.key != "name_key" and len(group) > MAX_BLOCK:
+                continue
+            for i, row in enumerate(group):
+                names[row.id] = row.name
+                for other in group[:i]:
+                    if matches(column.key == "name_key", row.name, other.name):
+                        clusters.union(row.id, other.id)
+    return [[(key, names[key]) for key in group] for group in sorted(clusters.groups())]
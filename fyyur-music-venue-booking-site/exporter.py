@@ -0,0 +1,135 @@
+"""
+Streaming export of venues, artists and shows as csv or ndjson.
+
+Rows are read from a server-side cursor (stream_results) in chunks of
+EXPORT_CHUNK and written to the response as they arrive, so memory stays
+the same whatever the size of the table. Venue and artist files have the
+columns read by importer.py and can be imported again.
+    /export/venues.csv?state=CA
+    /export/shows.ndjson?start=2026-10-01&end=2026-11-01
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, exists, select
+
+from importer import VENUE_FIELDS, ARTIST_FIELDS
+from models import db, Venue, Artist, Musicshows
+
+EXPORT_CHUNK = 1000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+MIMETYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def parse_date(value):
+    """parses the start/end filters, YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS"""
+    return datetime.fromisoformat(value) if value else None
+
+
+def export_query(kind, city=None, state=None, start=None, end=None):
+    """Builds the select of one export.
+    Arguments:
+        kind {str} -- venues, artists or shows
+    Keyword Arguments:
+        city, state {str} -- location of the venue or artist, for shows the venue's
+        start, end {datetime} -- shows starting in [start, end); venues and
+            artists having such a show
+    Returns:
+        Select -- rows ordered by id, columns named as in the export
+    """
+    if kind == "shows":
+        model = Venue
+        columns = [
+            Musicshows.id,
+            Musicshows.venue_id,
+            Venue.name.label("venue_name"),
+            Musicshows.artist_id,
+            Artist.name.label("artist_name"),
+            Musicshows.start_time,
+        ]
+        query = (
+            select(columns)
+            .select_from(Musicshows.__table__.join(Venue).join(Artist))
+            .where(and_(Venue.deleted_at.is_(None), Artist.deleted_at.is_(None)))
+            .order_by(Musicshows.id)
+        )
+    else:
+        model = Venue if kind == "venues" else Artist
+        fields = VENUE_FIELDS if kind == "venues" else ARTIST_FIELDS
+        columns = [model.id] + [getattr(model, field) for field in fields]
+        query = select(columns).where(model.deleted_at.is_(None)).order_by(model.id)
+
+    if city:
+        query = query.where(model.city == city)
+    if state:
+        query = query.where(model.state == state)
+
+    window = []
+    if start:
+        window.append(Musicshows.start_time >= start)
+    if end:
+        window.append(Musicshows.start_time < end)
+    if window and kind == "shows":
+        query = query.where(and_(*window))
+    elif window:
+        key = Musicshows.venue_id if kind == "venues" else Musicshows.artist_id
+        query = query.where(exists().where(and_(key == model.id, *window)))
+    return query
+
+
+def stream_rows(query, chunk=EXPORT_CHUNK):
+    """yields lists of at most chunk rows of query from a server-side cursor.
+    Uses its own connection, the response is streamed after the request
+    context, and the session with it, is gone."""
+    connection = db.get_engine().connect()
+    try:
+        result = connection.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(chunk)
+            if not rows:
+                break
+            yield rows
+    finally:
+        connection.close()
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.strftime(TIME_FORMAT)
+    return value
+
+
+def csv_value(value):
+    """genres and booleans in the form read back by importer.py"""
+    if isinstance(value, list):
+        return ",".join(value)
+    if isinstance(value, bool):
+        return str(value).lower()
+    return export_value(value)
+
+
+def csv_lines(query):
+    """yields the csv export of query, one chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(query.c.keys())
+    for rows in stream_rows(query):
+        for row in rows:
+            writer.writerow([csv_value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # no rows, only the header
+        yield buffer.getvalue()
+
+
+def ndjson_lines(query):
+    """yields the ndjson export of query, one chunk of rows at a time"""
+    for rows in stream_rows(query):
+        yield "".join(
+            json.dumps({key: export_value(value) for key, value in row.items()}) + "\n"
+            for row in rows
+        )
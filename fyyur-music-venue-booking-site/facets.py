@@ -0,0 +1,197 @@
+"""
+Faceted browse of venues and artists by genre, city, state and whether
+they are seeking talent or a venue.
+
+A page is two queries: the matching rows, paginated with a keyset on
+(name, id), and the counts of every facet value in one UNION ALL
+aggregate. Facets are counted disjunctively: each facet applies the
+filters of the others but not its own, so picking a state still lists the
+counts of the other states.
+On postgresql genres are filtered with @> on the GIN index of genres and
+counted with unnest(); sqlite stores them as JSON and uses json_each().
+City and state filters use the (state, city) indexes.
+Pages are cached with the "venues"/"artists" tags, see app.py.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from flask import url_for
+from sqlalchemy import and_, case, exists, func, literal, literal_column, select, tuple_, union_all
+
+from models import db, Venue, Artist
+
+FACETS = ("genre", "city", "state", "seeking")
+BROWSE_PER_PAGE = 30
+# values listed per facet, most frequent first
+FACET_VALUES = 20
+
+
+def seeking_column(model):
+    return model.seeking_talent if model is Venue else model.seeking_venue
+
+
+def is_postgres():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def json_genres(model):
+    return func.json_each(model.genres).alias("genre")
+
+
+def genre_filter(model, genre):
+    if is_postgres():
+        return model.genres.contains([genre])
+    genres = json_genres(model)
+    return exists(
+        select([literal_column("1")])
+        .select_from(genres)
+        .where(literal_column("genre.value") == genre)
+    )
+
+
+def conditions(model, filters, skip=None):
+    """where clauses of the filters, except the one of facet skip"""
+    clauses = [model.deleted_at.is_(None)]
+    if filters.get("genre") and skip != "genre":
+        clauses.append(genre_filter(model, filters["genre"]))
+    for name in ("city", "state"):
+        if filters.get(name) and skip != name:
+            clauses.append(getattr(model, name) == filters[name])
+    if filters.get("seeking") is not None and skip != "seeking":
+        clauses.append(seeking_column(model) == filters["seeking"])
+    return and_(*clauses)
+
+
+def genre_counts(model, where):
+    """select of (facet, value, n) counting each genre of the matching rows"""
+    if is_postgres():
+        genres = (
+            select([func.unnest(model.genres).label("value")]).where(where).alias("genres")
+        )
+        value = genres.c.value
+        query = select([literal("genre").label("facet"), value, func.count().label("n")])
+        return query.select_from(genres).group_by(value)
+    value = literal_column("genre.value")
+    return (
+        select([literal("genre").label("facet"), value.label("value"), func.count().label("n")])
+        .select_from(model.__table__)
+        .select_from(json_genres(model))
+        .where(where)
+        .group_by(value)
+    )
+
+
+def facet_counts(model, filters):
+    """Counts the rows of every facet value, in one query.
+    Returns:
+        tuple -- (number of rows matching all filters,
+                  {facet: [(value, count)], most frequent first})
+    """
+    seeking = case([(seeking_column(model) == True, "yes")], else_="no")  # noqa: E712
+    branches = [
+        select([literal("total").label("facet"), literal("").label("value"), func.count().label("n")])
+        .select_from(model.__table__)
+        .where(conditions(model, filters)),
+        genre_counts(model, conditions(model, filters, skip="genre")),
+    ]
+    for facet, column in (("city", model.city), ("state", model.state), ("seeking", seeking)):
+        branches.append(
+            select([literal(facet).label("facet"), column.label("value"), func.count().label("n")])
+            .where(conditions(model, filters, skip=facet))
+            .group_by(column)
+        )
+
+    total = 0
+    counts = {facet: [] for facet in FACETS}
+    for facet, value, n in db.session.execute(union_all(*branches)):
+        if facet == "total":
+            total = n
+        elif value is not None:
+            counts[facet].append((value, n))
+    for facet in FACETS:
+        counts[facet] = sorted(counts[facet], key=lambda item: (-item[1], item[0]))[:FACET_VALUES]
+    return total, counts
+
+
+def encode_cursor(name, key):
+    return urlsafe_b64encode(json.dumps([name, key]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """inverse of encode_cursor, raises ValueError on malformed cursors"""
+    try:
+        name, key = json.loads(urlsafe_b64decode(cursor.encode()))
+        return str(name), int(key)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError("malformed cursor") from e
+
+
+def browse(model, filters, after=None, limit=BROWSE_PER_PAGE):
+    """Returns one page of the venues or artists matching the filters,
+    ordered by name, and the facet counts.
+    Arguments:
+        model -- Venue or Artist
+        filters {dict} -- genre, city, state (str) and seeking (bool), all optional
+    Keyword Arguments:
+        after {str} -- cursor of the previous page
+        limit {int} -- rows per page
+    Returns:
+        dictionary -- data, next_cursor, total and facets
+    """
+    query = db.session.query(model.id, model.name, model.city, model.state).filter(
+        conditions(model, filters)
+    )
+    if after:
+        query = query.filter(tuple_(model.name, model.id) > tuple_(*decode_cursor(after)))
+    rows = query.order_by(model.name, model.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].name, rows[-1].id)
+    total, counts = facet_counts(model, filters)
+    return {
+        "data": [row._asdict() for row in rows],
+        "next_cursor": next_cursor,
+        "total": total,
+        "facets": counts,
+    }
+
+
+def parse_filters(args):
+    """reads the filters from the query string"""
+    seeking = args.get("seeking")
+    return {
+        "genre": args.get("genre") or None,
+        "city": args.get("city") or None,
+        "state": args.get("state") or None,
+        "seeking": None if seeking in (None, "") else seeking in ("1", "yes", "true"),
+    }
+
+
+def query_args(filters):
+    args = {name: value for name, value in filters.items() if value is not None}
+    if "seeking" in args:
+        args["seeking"] = "yes" if args["seeking"] else "no"
+    return args
+
+
+def facet_links(endpoint, filters, counts):
+    """Links of the facet values of a browse page, each toggling its filter.
+    Returns:
+        dictionary -- {facet: [{value, count, selected, url}]}
+    """
+    links = {}
+    for facet in FACETS:
+        selected = query_args(filters).get(facet)
+        links[facet] = []
+        for value, n in counts[facet]:
+            args = query_args(filters)
+            if value == selected:
+                del args[facet]
+            else:
+                args[facet] = value
+            links[facet].append(
+                {"value": value, "count": n, "selected": value == selected, "url": url_for(endpoint, **args)}
+            )
+    return links
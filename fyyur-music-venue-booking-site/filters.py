@@ -0,0 +1,48 @@
+"""
+Jinja filters.
+
+format_datetime is called for every show rendered, so it skips parsing
+for datetime values, keeps the compiled babel pattern of each
+(format, locale) and remembers the strings of recently formatted times.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+PATTERNS = {
+    "full": "EEEE MMMM, d, y 'at' h:mma",
+    "medium": "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+    return babel.dates.parse_pattern(format), Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+    return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=8192)
+def format_cached(value, format, locale):
+    pattern, locale = compiled_pattern(format, locale)
+    if value.tzinfo is None:
+        # babel treats naive datetimes as UTC
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format="medium", locale=None):
+    """formats a datetime, or a string holding one, with a babel pattern.
+    'full' and 'medium' are the site's own patterns, any other format is
+    passed to babel as is."""
+    if not isinstance(value, datetime):
+        value = parse_datetime(value)
+    if format in ("long", "short"):
+        return babel.dates.format_datetime(value, format, locale=locale or babel.dates.LC_TIME)
+    return format_cached(value, PATTERNS.get(format, format), locale or babel.dates.LC_TIME)
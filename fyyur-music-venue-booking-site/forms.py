@@ -2,6 +2,7 @@ from datetime import datetime
 from flask_wtf import FlaskForm
 from wtforms import (
     StringField,
+    IntegerField,
     SelectField,
     SelectMultipleField,
     DateTimeField,
@@ -89,8 +90,8 @@ genre_choices = [
 
 
 class ShowForm(FlaskForm):
-    artist_id = StringField("artist_id", validators=[DataRequired()])
-    venue_id = StringField("venue_id", validators=[DataRequired()])
+    artist_id = IntegerField("artist_id", validators=[DataRequired()])
+    venue_id = IntegerField("venue_id", validators=[DataRequired()])
     start_time = DateTimeField(
         "start_time", validators=[DataRequired()], default=datetime.today()
     )
@@ -142,6 +143,8 @@ class VenueForm(FlaskForm):
     seeking_description = StringField(
         "seeking_description", validators=[DataRequired(), length]
     )
+    # lists the entry even if it looks like a duplicate, see dedup.py
+    allow_duplicate = BooleanField("allow_duplicate")
 
 
 class ArtistForm(FlaskForm):
@@ -169,4 +172,6 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField(
         "seeking_description", validators=[DataRequired(), length]
     )
+    # lists the entry even if it looks like a duplicate, see dedup.py
+    allow_duplicate = BooleanField("allow_duplicate")
 
@@ -0,0 +1,399 @@
+"""
+Venues near a point: offline geocoding and an in-memory spatial index.
+
+Venues are placed at their city with the bundled gazetteer,
+data/gazetteer.csv, which lists major US cities and the center of every
+state as the fallback for other cities; no network service is called.
+New venues and venues moving to another city are geocoded on flush,
+`flask geocode-venues` fills in the coordinates of existing rows.
+
+Searches run on a KD-tree of the venues' positions on the unit sphere,
+where the straight line distance grows with the great-circle distance, so
+radius and k-nearest searches skip every subtree farther than the current
+bound. The tree is built with one query on the first search. Venues written
+afterwards are applied on commit, like the trigram index of search.py: they
+go to a small overlay that is scanned linearly, and the tree is rebuilt
+from memory once REBUILD_AFTER venues have changed.
+Commits of other workers are picked up at most GEO_REFRESH seconds apart:
+venues changed since the last refresh (by updated_at) are applied the same
+way, and a venue count that disagrees with the index, e.g. after a purge,
+rebuilds it with one query.
+"""
+import csv
+import heapq
+import math
+import os
+import re
+import time
+from datetime import timedelta
+
+from sqlalchemy import bindparam, event, func, inspect
+from sqlalchemy.orm import Session
+
+from models import db, Venue
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+# mean radius of the earth
+EARTH_KM = 6371.0088
+# points per leaf of the KD-tree
+LEAF_SIZE = 16
+# changed venues kept in the overlay before the tree is rebuilt
+REBUILD_AFTER = 1000
+# rows per UPDATE of `flask geocode-venues`
+GEOCODE_BATCH = 1000
+# venues updated this long before the last change seen are read again, in
+# case their transaction committed after it
+OVERLAP = timedelta(seconds=1)
+
+# abbreviations at the start of city names
+PREFIXES = (
+    (re.compile(r"^st\b\.?\s*"), "saint "),
+    (re.compile(r"^ft\b\.?\s*"), "fort "),
+    (re.compile(r"^mt\b\.?\s*"), "mount "),
+)
+SPACES = re.compile(r"\s+")
+
+
+def normalize(city):
+    """lowercased city name with abbreviations spelled out, "St. Louis" is "saint louis" """
+    city = SPACES.sub(" ", (city or "").strip().lower())
+    for prefix, replacement in PREFIXES:
+        city = prefix.sub(replacement, city)
+    return city.replace(".", "")
+
+
+class Gazetteer:
+    """coordinates of cities by (normalized city, state), and of states"""
+
+    def __init__(self, path=GAZETTEER):
+        self.cities = {}
+        self.states = {}
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["latitude"]), float(row["longitude"]))
+                if row["city"]:
+                    self.cities[(normalize(row["city"]), row["state"])] = point
+                else:
+                    self.states[row["state"]] = point
+
+    def locate(self, city, state):
+        """(latitude, longitude) of the city, of its state if the city is not
+        listed, (None, None) if neither is known"""
+        return self.cities.get((normalize(city), state)) or self.states.get(state) or (None, None)
+
+
+_gazetteer = None
+
+
+def geocode(city, state):
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer()
+    return _gazetteer.locate(city, state)
+
+
+def to_xyz(latitude, longitude):
+    """position on the unit sphere"""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord(km):
+    """straight line distance on the unit sphere of a great-circle distance"""
+    return 2 * math.sin(min(km / EARTH_KM, math.pi) / 2)
+
+
+def great_circle_km(d2):
+    """great-circle distance of a squared straight line distance"""
+    return 2 * EARTH_KM * math.asin(min(1.0, math.sqrt(d2) / 2))
+
+
+class KDTree:
+    """
+    Static KD-tree of (key, (x, y, z)) points. Inner nodes are
+    (axis, split, lower, upper) tuples, leaves lists of up to LEAF_SIZE points.
+    """
+
+    def __init__(self, points):
+        self.root = self.build(list(points)) if points else []
+
+    def build(self, points):
+        if len(points) <= LEAF_SIZE:
+            return points
+        # split along the axis the points spread the most on
+        spreads = [
+            max(p[1][axis] for p in points) - min(p[1][axis] for p in points) for axis in range(3)
+        ]
+        axis = spreads.index(max(spreads))
+        points.sort(key=lambda p: p[1][axis])
+        middle = len(points) // 2
+        return (axis, points[middle][1][axis], self.build(points[:middle]), self.build(points[middle:]))
+
+    def nearest(self, point, k, bound=float("inf"), skip=()):
+        """Returns up to k (squared distance, key) pairs, nearest first.
+        Arguments:
+            point {tuple} -- x, y, z on the unit sphere
+            k {int} -- number of points
+        Keyword Arguments:
+            bound {float} -- squared distance, farther points are left out
+            skip {set} -- keys to leave out
+        """
+        qx, qy, qz = point
+        heap = []  # (-squared distance, key) of the k nearest so far
+        # (node, squared distance from the point to the node's side of the split)
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, gap = stack.pop()
+            if gap > bound:
+                continue
+            if isinstance(node, list):
+                for key, (x, y, z) in node:
+                    d2 = (x - qx) ** 2 + (y - qy) ** 2 + (z - qz) ** 2
+                    if d2 <= bound and key not in skip:
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-d2, key))
+                        elif -d2 > heap[0][0]:
+                            heapq.heapreplace(heap, (-d2, key))
+                        if len(heap) == k:
+                            bound = min(bound, -heap[0][0])
+                continue
+            axis, split, lower, upper = node
+            diff = point[axis] - split
+            near, far = (lower, upper) if diff < 0 else (upper, lower)
+            # the near side is searched first, it usually shrinks the bound
+            # enough to skip the far side
+            stack.append((far, max(gap, diff * diff)))
+            stack.append((near, gap))
+        return sorted((-d2, key) for d2, key in heap)
+
+
+class GeoIndex:
+    """venues and their positions, searched with a KD-tree and an overlay
+    of the venues written since it was built"""
+
+    def __init__(self, venues):
+        """venues -- iterable of (id, name, city, state, latitude, longitude, updated_at)"""
+        self.venues = {}
+        self.changed_since = None
+        for key, name, city, state, latitude, longitude, updated_at in venues:
+            if latitude is not None and longitude is not None:
+                self.venues[key] = (name, city, state, latitude, longitude)
+            self.seen(updated_at)
+        self.rebuild()
+        self.checked_at = time.monotonic()
+
+    def seen(self, updated_at):
+        if self.changed_since is None or updated_at > self.changed_since:
+            self.changed_since = updated_at
+
+    def rebuild(self):
+        self.tree = KDTree([(key, to_xyz(v[3], v[4])) for key, v in self.venues.items()])
+        self.overlay = {}
+        # keys whose point in the tree is outdated
+        self.stale = set()
+
+    def add(self, key, name, city, state, latitude, longitude):
+        if latitude is None or longitude is None:
+            self.remove(key)
+            return
+        self.venues[key] = (name, city, state, latitude, longitude)
+        self.overlay[key] = to_xyz(latitude, longitude)
+        self.stale.add(key)
+        self.changed()
+
+    def remove(self, key):
+        if self.venues.pop(key, None) is not None:
+            self.overlay.pop(key, None)
+            self.stale.add(key)
+            self.changed()
+
+    def changed(self):
+        if len(self.stale) > REBUILD_AFTER:
+            self.rebuild()
+
+    def nearest(self, latitude, longitude, k, radius_km=None):
+        """Returns the k venues nearest to a point, nearest first.
+        Arguments:
+            latitude, longitude {float} -- the point
+            k {int} -- number of venues
+        Keyword Arguments:
+            radius_km {float} -- farther venues are left out
+        Returns:
+            list of dictionary -- venues with their distance in km
+        """
+        point = to_xyz(latitude, longitude)
+        bound = chord(radius_km) ** 2 if radius_km is not None else float("inf")
+        found = self.tree.nearest(point, k, bound, self.stale)
+        for key, (x, y, z) in self.overlay.items():
+            d2 = (x - point[0]) ** 2 + (y - point[1]) ** 2 + (z - point[2]) ** 2
+            if d2 <= bound:
+                found.append((d2, key))
+        found = heapq.nsmallest(k, found)
+        results = []
+        for d2, key in found:
+            name, city, state, lat, lon = self.venues[key]
+            results.append(
+                {
+                    "id": key,
+                    "name": name,
+                    "city": city,
+                    "state": state,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "distance_km": round(great_circle_km(d2), 3),
+                }
+            )
+        return results
+
+    def __len__(self):
+        return len(self.venues)
+
+
+_index = None
+# seconds between refreshes of the index, see init_geo()
+refresh_interval = 5
+
+LOCATION_FIELDS = ("name", "city", "state", "latitude", "longitude")
+
+
+def venue_rows(since=None):
+    """(id, location fields, updated_at) of the venues, of those changed
+    since a time including the deleted ones, whose location is None"""
+    fields = [getattr(Venue, field) for field in LOCATION_FIELDS]
+    if since is None:
+        return db.session.query(Venue.id, *fields, Venue.updated_at)
+    query = (
+        db.session.query(Venue.id, *fields, Venue.updated_at, Venue.deleted_at)
+        .execution_options(include_deleted=True)
+        .filter(Venue.updated_at >= since - OVERLAP)
+    )
+    return [
+        (key, *(location if deleted_at is None else [None] * len(location)), updated_at)
+        for key, *location, updated_at, deleted_at in query
+    ]
+
+
+def refresh(index):
+    """Applies the venues changed since the index last saw a change.
+    Returns:
+        bool -- false if the index disagrees with the venue count and
+                must be rebuilt
+    """
+    for key, name, city, state, latitude, longitude, updated_at in venue_rows(index.changed_since):
+        location = (name, city, state, latitude, longitude)
+        if latitude is None or longitude is None:
+            index.remove(key)
+        elif index.venues.get(key) != location:
+            index.add(key, *location)
+        index.seen(updated_at)
+    index.checked_at = time.monotonic()
+    placed = (
+        db.session.query(func.count(Venue.id))
+        .filter(Venue.latitude.isnot(None), Venue.longitude.isnot(None))
+        .scalar()
+    )
+    return placed == len(index)
+
+
+def get_index():
+    """returns the spatial index of the venues, building it with one query if
+    needed and refreshing it if it was last checked refresh_interval ago"""
+    global _index
+    if _index is not None and time.monotonic() - _index.checked_at >= refresh_interval:
+        if not refresh(_index):
+            _index = None
+    if _index is None:
+        _index = GeoIndex(venue_rows())
+    return _index
+
+
+def reset_index():
+    """forgets the in-process index, it is rebuilt on the next search"""
+    global _index
+    _index = None
+
+
+def nearest_venues(latitude, longitude, k, radius_km=None):
+    return get_index().nearest(latitude, longitude, k, radius_km)
+
+
+def moved(venue):
+    state = inspect(venue)
+    changed = lambda name: state.attrs[name].history.has_changes()
+    return (changed("city") or changed("state")) and not changed("latitude")
+
+
+@event.listens_for(Session, "before_flush")
+def geocode_venues(session, flush_context, instances):
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, Venue) and (
+            (entity.latitude is None and entity.longitude is None) or moved(entity)
+        ):
+            entity.latitude, entity.longitude = geocode(entity.city, entity.state)
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+    pending = session.info.setdefault("geo_pending", [])
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, Venue) and entity.deleted_at is None:
+            pending.append((entity.id, tuple(getattr(entity, field) for field in LOCATION_FIELDS)))
+    for entity in list(session.dirty) + list(session.deleted):
+        if isinstance(entity, Venue) and (entity in session.deleted or entity.deleted_at):
+            pending.append((entity.id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_changes(session):
+    for key, location in session.info.pop("geo_pending", []):
+        if _index is None:
+            continue
+        if location is None:
+            _index.remove(key)
+        else:
+            _index.add(key, *location)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("geo_pending", None)
+
+
+def geocode_missing(batch_size=GEOCODE_BATCH):
+    """geocodes the venues without coordinates, batch_size rows per UPDATE;
+    returns the number of venues placed"""
+    table = Venue.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("venue_id"))
+        .values(latitude=bindparam("lat"), longitude=bindparam("lon"))
+    )
+    placed, after = 0, 0
+    while True:
+        rows = (
+            db.session.query(Venue.id, Venue.city, Venue.state)
+            .filter(Venue.latitude.is_(None), Venue.id > after)
+            .order_by(Venue.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        after = rows[-1].id
+        values = []
+        for row in rows:
+            latitude, longitude = geocode(row.city, row.state)
+            if latitude is not None:
+                values.append({"venue_id": row.id, "lat": latitude, "lon": longitude})
+        if values:
+            db.session.execute(update, values)
+        db.session.commit()
+        placed += len(values)
+    reset_index()
+    return placed
+
+
+def init_geo(app):
+    """sets how often the index picks up the commits of other workers"""
+    global refresh_interval
+    refresh_interval = app.config.get("GEO_REFRESH", 5)
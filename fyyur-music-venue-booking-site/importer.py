@@ -0,0 +1,289 @@
+"""
+Bulk import of venues, artists and shows from CSV or NDJSON files.
+
+Rows are validated with the validators declared on VenueForm, ArtistForm
+and ShowForm, shows also against overlapping bookings (booking.py), then
+written with one executemany() INSERT per batch, which psycopg2 sends as
+multi-row INSERT ... VALUES (see config.py). Invalid rows are reported
+with their line number and skipped, the rest of the batch is still
+imported.
+    flask import-catalog venues venues.csv
+"""
+import csv
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, func
+from sqlalchemy.exc import SQLAlchemyError
+from wtforms.validators import DataRequired, StopValidation, ValidationError
+
+import dedup
+import geo
+import search
+from booking import Bookings
+from cache import page_cache
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Musicshows, ShowCounters, bumped
+from readmodel import read_model
+
+BATCH_SIZE = 1000
+
+VENUE_FIELDS = (
+    "name", "city", "state", "address", "phone", "image_link", "genres",
+    "facebook_link", "website_link", "seeking_talent", "seeking_description",
+)
+ARTIST_FIELDS = (
+    "name", "city", "state", "phone", "image_link", "genres",
+    "facebook_link", "website_link", "seeking_venue", "seeking_description",
+)
+BOOLEAN_FIELDS = ("seeking_talent", "seeking_venue")
+
+
+class RowField:
+    """the part of a wtforms field that the validators use"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.raw_data = [data]
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+    def ngettext(self, singular, plural, n):
+        return singular if n == 1 else plural
+
+
+def form_validators(form_class, fields):
+    """returns {field name: validators declared on the form}.
+    Checkboxes keep all but DataRequired: the form requires them only
+    because an unchecked box is missing from the posted data."""
+    validators = {}
+    for name in fields:
+        declared = getattr(form_class, name).kwargs.get("validators", [])
+        if name in BOOLEAN_FIELDS:
+            declared = [v for v in declared if not isinstance(v, DataRequired)]
+        validators[name] = declared
+    return validators
+
+
+def validate(row, validators):
+    """runs the validators on the row, returns {field: error message}"""
+    errors = {}
+    for name, field_validators in validators.items():
+        field = RowField(name, row.get(name))
+        for validator in field_validators:
+            try:
+                validator(None, field)
+            except (ValidationError, StopValidation) as e:
+                errors[name] = str(e) or "This field is required."
+                break
+    return errors
+
+
+def parse_boolean(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y", "on")
+
+
+def parse_genres(value):
+    if isinstance(value, list):
+        return value
+    return [genre.strip() for genre in (value or "").split(",") if genre.strip()]
+
+
+def read_rows(path, format=None):
+    """yields (line number, row dict) from a .csv or .ndjson/.jsonl file
+    without loading it whole"""
+    if format is None:
+        format = "csv" if path.endswith(".csv") else "ndjson"
+    with open(path, newline="") as f:
+        if format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.imported = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return "{} {} imported, {} rejected, {:.0f} rows/s".format(
+            self.imported, self.kind, len(self.errors), self.rows_per_second
+        )
+
+
+class Importer:
+    """validates rows of one kind and inserts them batch by batch"""
+
+    def __init__(self, kind, batch_size=BATCH_SIZE):
+        self.kind = kind
+        self.batch_size = batch_size
+        self.report = ImportReport(kind)
+        # page cache tags of the venues and artists whose pages change
+        self.tags = set()
+        if kind == "venues":
+            self.model = Venue
+            self.validators = form_validators(VenueForm, VENUE_FIELDS)
+        elif kind == "artists":
+            self.model = Artist
+            self.validators = form_validators(ArtistForm, ARTIST_FIELDS)
+        elif kind == "shows":
+            self.model = Musicshows
+            self.validators = form_validators(ShowForm, ("artist_id", "venue_id"))
+            self.venue_ids = {key for key, in db.session.query(Venue.id)}
+            self.artist_ids = {key for key, in db.session.query(Artist.id)}
+            # postgres assigns show ids from musicshows_id_seq, as for the
+            # show form; sqlite cannot autoincrement a column of a composite
+            # primary key, so ids are numbered here from the current maximum
+            if db.session.get_bind().dialect.name == "postgresql":
+                self.next_show_id = None
+            else:
+                self.next_show_id = (db.session.query(func.max(Musicshows.id)).scalar() or 0) + 1
+            self.watermark = ShowCounters.current().rolled_over_at
+            self.bookings = Bookings.load()
+        else:
+            raise ValueError("unknown kind {}, expected venues, artists or shows".format(kind))
+        if self.model is not Musicshows:
+            # pages of ids requested before the import are cached empty
+            self.last_id = db.session.query(func.max(self.model.id)).scalar() or 0
+
+    def convert(self, row):
+        """returns the column values of a valid row, raises ValueError otherwise"""
+        if self.model is Musicshows:
+            return self.convert_show(row)
+        row = dict(row)
+        row["genres"] = parse_genres(row.get("genres"))
+        errors = validate(row, self.validators)
+        if errors:
+            raise ValueError("; ".join("%s: %s" % item for item in sorted(errors.items())))
+        values = {name: row.get(name) for name in self.validators}
+        for name in BOOLEAN_FIELDS:
+            if name in values:
+                values[name] = parse_boolean(values[name])
+        if self.model is Venue:
+            values["latitude"], values["longitude"] = geo.geocode(values["city"], values["state"])
+        values.update(dedup.blocking_keys(self.model, values))
+        return values
+
+    def convert_show(self, row):
+        row = {name: str(row.get(name) or "").strip() for name in ("artist_id", "venue_id", "start_time")}
+        errors = validate(row, self.validators)
+        try:
+            start_time = datetime.strptime(row["start_time"], ShowForm.start_time.kwargs.get("format", "%Y-%m-%d %H:%M:%S"))
+        except ValueError:
+            errors["start_time"] = "Not a valid datetime value"
+        if not errors:
+            for name, known in (("venue_id", self.venue_ids), ("artist_id", self.artist_ids)):
+                if not row[name].isdigit() or int(row[name]) not in known:
+                    errors[name] = "No such %s" % name[:-3]
+        if not errors:
+            conflict = self.bookings.book(int(row["venue_id"]), int(row["artist_id"]), start_time)
+            if conflict:
+                errors["start_time"] = conflict
+        if errors:
+            raise ValueError("; ".join("%s: %s" % item for item in sorted(errors.items())))
+        values = {
+            "venue_id": int(row["venue_id"]),
+            "artist_id": int(row["artist_id"]),
+            "start_time": start_time,
+        }
+        if self.next_show_id is not None:
+            values["id"] = self.next_show_id
+            self.next_show_id += 1
+        return values
+
+    def run(self, rows):
+        """imports (line number, row) pairs, returns the ImportReport"""
+        batch = []
+        for line, row in rows:
+            try:
+                batch.append((line, self.convert(row)))
+            except ValueError as e:
+                self.report.error(line, str(e))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+        read_model.reset()
+        if self.kind == "shows":
+            page_cache.invalidate("shows", "venues", "calendar", *sorted(self.tags))
+        else:
+            prefix = "venue:%d" if self.model is Venue else "artist:%d"
+            new_ids = db.session.query(self.model.id).filter(self.model.id > self.last_id)
+            db.session.commit()
+            page_cache.invalidate(self.kind, *[prefix % key for key, in new_ids])
+            search.reset_indexes()
+            geo.reset_index()
+        self.report.elapsed = time.perf_counter() - self.report.started
+        return self.report
+
+    def write(self, batch):
+        """inserts the batch in one executemany(); if the database rejects
+        it, inserts row by row to find and report the offending rows"""
+        table = self.model.__table__
+        try:
+            db.session.execute(table.insert(), [values for _, values in batch])
+            self.count_shows([values for _, values in batch])
+            db.session.commit()
+            self.report.imported += len(batch)
+            return
+        except SQLAlchemyError:
+            db.session.rollback()
+
+        for line, values in batch:
+            try:
+                db.session.execute(table.insert(), values)
+                self.count_shows([values])
+                db.session.commit()
+                self.report.imported += 1
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                self.report.error(line, str(e.orig if hasattr(e, "orig") else e))
+
+    def count_shows(self, shows):
+        """adds imported shows to the show counters, see Musicshows.update_counters"""
+        if self.model is not Musicshows:
+            return
+        for model, key in ((Venue, "venue_id"), (Artist, "artist_id")):
+            counts = {}
+            for show in shows:
+                upcoming = show["start_time"] > self.watermark
+                entry = counts.setdefault(show[key], [0, 0])
+                entry[0 if upcoming else 1] += 1
+            self.tags.update("%s:%d" % (model.__tablename__, key_id) for key_id in counts)
+            table = model.__table__
+            db.session.execute(
+                table.update()
+                .where(table.c.id == bindparam("key"))
+                .values(
+                    upcoming_shows_count=table.c.upcoming_shows_count + bindparam("upcoming"),
+                    past_shows_count=table.c.past_shows_count + bindparam("past"),
+                    **bumped(table.c)
+                ),
+                [
+                    {"key": key_id, "upcoming": upcoming, "past": past}
+                    for key_id, (upcoming, past) in counts.items()
+                ],
+            )
@@ -0,0 +1,35 @@
+"""exclusion constraints against overlapping bookings of venues and artists
+
+Shows book their venue and artist for 3 hours, models.SHOW_DURATION.
+Fails if the table already has overlapping bookings.
+
+Revision ID: a3e5c7f9b2d4
+Revises: f2c6a8e4d1b9
+Create Date: 2026-10-18 15:10:52.208816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e5c7f9b2d4'
+down_revision = 'f2c6a8e4d1b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            "ALTER TABLE musicshows ADD CONSTRAINT musicshows_{column}_no_overlap "
+            "EXCLUDE USING gist ({column} WITH =, "
+            "tsrange(start_time, start_time + interval '3 hours') WITH &&)"
+            .format(column=column)
+        )
+
+
+def downgrade():
+    for column in ('venue_id', 'artist_id'):
+        op.execute("ALTER TABLE musicshows DROP CONSTRAINT musicshows_{}_no_overlap".format(column))
@@ -0,0 +1,26 @@
+"""state and city indexes of venue and artist for the faceted browse
+
+Revision ID: b4d6f8a1c3e5
+Revises: a3e5c7f9b2d4
+Create Date: 2026-10-18 16:02:37.514290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d6f8a1c3e5'
+down_revision = 'a3e5c7f9b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist'):
+        op.create_index('ix_{}_state_city'.format(table), table, ['state', 'city'], unique=False)
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index('ix_{}_state_city'.format(table), table_name=table)
@@ -0,0 +1,24 @@
+"""index musicshows for keyset pagination of /shows
+
+Revision ID: b5e1c3a7d2f4
+Revises: 87e74c2fc779
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1c3a7d2f4'
+down_revision = '87e74c2fc779'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_musicshows_start_time_id', 'musicshows', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_musicshows_start_time_id', table_name='musicshows')
@@ -0,0 +1,31 @@
+"""trigram and genre indexes for venue and artist search
+
+Revision ID: c3d9e8f1a6b2
+Revises: b5e1c3a7d2f4
+Create Date: 2026-10-18 11:02:17.530962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9e8f1a6b2'
+down_revision = 'b5e1c3a7d2f4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('venue', 'artist'):
+        for column in ('name', 'city', 'state'):
+            op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column], unique=False, postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+        op.create_index('ix_{}_genres'.format(table), table, ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index('ix_{}_genres'.format(table), table_name=table)
+        for column in ('name', 'city', 'state'):
+            op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
@@ -0,0 +1,27 @@
+"""latitude and longitude of venues for the venues near a point search
+
+Revision ID: c7e9b1d3f5a2
+Revises: b4d6f8a1c3e5
+Create Date: 2026-10-18 18:21:09.624815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e9b1d3f5a2'
+down_revision = 'b4d6f8a1c3e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    # existing venues are geocoded with `flask geocode-venues`
+
+
+def downgrade():
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
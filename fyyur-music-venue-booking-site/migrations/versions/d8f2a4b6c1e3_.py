@@ -0,0 +1,46 @@
+"""upcoming and past show counters on venue and artist
+
+Revision ID: d8f2a4b6c1e3
+Revises: c3d9e8f1a6b2
+Create Date: 2026-10-18 12:20:05.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2a4b6c1e3'
+down_revision = 'c3d9e8f1a6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('show_counters',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_over_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # count the existing shows, as of the time stored in show_counters
+    op.execute("INSERT INTO show_counters (id, rolled_over_at) VALUES (1, now())")
+    for table in ('venue', 'artist'):
+        op.execute(
+            "UPDATE {table} SET "
+            "upcoming_shows_count = (SELECT count(*) FROM musicshows m "
+            "WHERE m.{table}_id = {table}.id AND m.start_time > (SELECT rolled_over_at FROM show_counters)), "
+            "past_shows_count = (SELECT count(*) FROM musicshows m "
+            "WHERE m.{table}_id = {table}.id AND m.start_time <= (SELECT rolled_over_at FROM show_counters))"
+            .format(table=table)
+        )
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_table('show_counters')
@@ -0,0 +1,34 @@
+"""soft-delete of venues and artists
+
+Revision ID: d9f1b3c5e7a2
+Revises: e3b5d7f9a1c4
+Create Date: 2026-10-18 21:12:40.581207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f1b3c5e7a2'
+down_revision = 'e3b5d7f9a1c4'
+branch_labels = None
+depends_on = None
+
+TABLES = ('venue', 'artist')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        # only the deleted rows, read by the purge job
+        op.create_index(
+            'ix_{}_deleted_at'.format(table), table, ['deleted_at'], unique=False,
+            postgresql_where=sa.text('deleted_at IS NOT NULL'),
+        )
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index('ix_{}_deleted_at'.format(table), table_name=table)
+        op.drop_column(table, 'deleted_at')
@@ -0,0 +1,26 @@
+"""index musicshows by venue and artist for the show pages
+
+Revision ID: e1a7c9d3b5f2
+Revises: d8f2a4b6c1e3
+Create Date: 2026-10-18 13:05:44.671203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1a7c9d3b5f2'
+down_revision = 'd8f2a4b6c1e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_musicshows_venue_id_start_time', 'musicshows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_musicshows_artist_id_start_time', 'musicshows', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_musicshows_artist_id_start_time', table_name='musicshows')
+    op.drop_index('ix_musicshows_venue_id_start_time', table_name='musicshows')
@@ -0,0 +1,37 @@
+"""blocking keys of venues and artists for the duplicate detection
+
+Revision ID: e3b5d7f9a1c4
+Revises: c7e9b1d3f5a2
+Create Date: 2026-10-18 19:47:52.103386
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b5d7f9a1c4'
+down_revision = 'c7e9b1d3f5a2'
+branch_labels = None
+depends_on = None
+
+KEYS = {
+    'venue': ('name_key', 'phone_key', 'address_key'),
+    'artist': ('name_key', 'phone_key'),
+}
+
+
+def upgrade():
+    for table, columns in KEYS.items():
+        for column in columns:
+            length = 20 if column == 'phone_key' else None
+            op.add_column(table, sa.Column(column, sa.String(length=length), nullable=True))
+            op.create_index('ix_{}_{}'.format(table, column), table, [column], unique=False)
+    # existing rows are keyed by `flask find-duplicates`
+
+
+def downgrade():
+    for table, columns in KEYS.items():
+        for column in columns:
+            op.drop_index('ix_{}_{}'.format(table, column), table_name=table)
+            op.drop_column(table, column)
@@ -0,0 +1,28 @@
+"""row versions on venue, artist and musicshows for conditional GETs
+
+Revision ID: f2c6a8e4d1b9
+Revises: e1a7c9d3b5f2
+Create Date: 2026-10-18 14:42:17.390561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6a8e4d1b9'
+down_revision = 'e1a7c9d3b5f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venue', 'artist', 'musicshows'):
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False))
+
+
+def downgrade():
+    for table in ('venue', 'artist', 'musicshows'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -1,11 +1,38 @@
 import os
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Boolean, ARRAY
-from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    Float,
+    DateTime,
+    ForeignKey,
+    Boolean,
+    ARRAY,
+    JSON,
+    Index,
+    DDL,
+    event,
+    inspect,
+    text,
+    and_,
+    bindparam,
+    case,
+    func,
+    select,
+)
+from sqlalchemy.orm import Query
+from routing import RoutingSQLAlchemy
 from flask_migrate import Migrate
+from cache import page_cache
 import json
 
 
-db = SQLAlchemy()
+# routes the queries of read-only views to the replicas, see routing.py
+db = RoutingSQLAlchemy()
+
+# genres are a postgres ARRAY; sqlite (used by the test suite) stores them as JSON
+Genres = ARRAY(String(50)).with_variant(JSON(), "sqlite")
 
 
 def setup_db(app):
@@ -13,10 +40,9 @@ def setup_db(app):
     binds a flask application and a SQLAlchemy service
     """
     app.config.from_object("config")
-    db = SQLAlchemy(app)
-    migrate = Migrate(app, db)
     db.app = app
     db.init_app(app)
+    Migrate(app, db)
     return db
 
     """
@@ -29,6 +55,118 @@ def setup_db(app):
     """
 
 
+def search_indexes(table):
+    """trigram GIN indexes used by search.py on postgresql"""
+    return tuple(
+        Index(
+            "ix_{}_{}_trgm".format(table, column),
+            column,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+        for column in ("name", "city", "state")
+    ) + (Index("ix_{}_genres".format(table), "genres", postgresql_using="gin"),)
+
+
+def facet_indexes(table):
+    """btree index for the city and state filters of facets.py"""
+    return (Index("ix_{}_state_city".format(table), "state", "city"),)
+
+
+def deleted_indexes(table):
+    """index of the soft-deleted rows, for the purge job of purge.py"""
+    return (
+        Index(
+            "ix_{}_deleted_at".format(table),
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
+
+
+def dedup_indexes(table, *columns):
+    """btree indexes of the blocking keys of dedup.py"""
+    return tuple(Index("ix_{}_{}".format(table, column), column) for column in columns)
+
+
+class Versioned:
+    """
+    Row version and time of the last change (UTC) of an entity, used as the
+    ETag and Last-Modified of its page, see conditional.py.
+    Bumped by the write methods of the entity and by every write that
+    changes what its page shows, e.g. a new show or a renamed artist.
+    """
+
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(), nullable=False, default=datetime.utcnow)
+
+    def touch(self):
+        self.version = self.version + 1
+        self.updated_at = datetime.utcnow()
+
+
+class SoftDeletable:
+    """
+    Time a venue or artist was deleted (UTC). Deleted rows are hidden from
+    ORM queries at once, see hide_deleted(), and removed with their shows
+    later by the purge job of purge.py. Their shows leave the counters of
+    the other side on deletion, and queries of shows skip them with
+    listed_shows().
+    """
+
+    deleted_at = Column(DateTime(), nullable=True)
+
+
+@event.listens_for(Query, "before_compile", retval=True, bake_ok=True)
+def hide_deleted(query):
+    """adds deleted_at IS NULL for every venue and artist a query selects
+    from, unless it runs with execution_options(include_deleted=True).
+    Core selects, e.g. of facets.py and exporter.py, add it themselves."""
+    if query._execution_options.get("include_deleted"):
+        return query
+    hidden = set()
+    for description in query.column_descriptions:
+        entity = description["entity"]
+        if entity is None or entity in hidden:
+            continue
+        if issubclass(inspect(entity).mapper.class_, SoftDeletable):
+            hidden.add(entity)
+            query = query.enable_assertions(False).filter(entity.deleted_at.is_(None))
+    return query
+
+
+def bumped(columns):
+    """values bumping the version in a bulk UPDATE,
+    columns is the model or the .c of its table"""
+    return {"version": columns.version + 1, "updated_at": datetime.utcnow()}
+
+
+def touch_related(model, key, condition):
+    """bumps the venues or artists whose id is the key of the shows
+    matching condition, in the current transaction"""
+    db.session.query(model).filter(
+        model.id.in_(db.session.query(key).filter(condition))
+    ).update(bumped(model), synchronize_session=False)
+
+
+# group commit queue of the inserts, set by writebehind.init_write_behind()
+# when WRITE_BEHIND is on
+write_queue = None
+
+
+def save(entity):
+    """Inserts a new entity: stages it in the session, commits, then
+    invalidates the cached pages showing it. With the write-behind queue the
+    insert is committed together with those of other requests; the call
+    still returns only once it is committed, and raises if it failed."""
+    if write_queue is not None:
+        write_queue.submit(entity).result()
+        return
+    entity.stage()
+    db.session.commit()
+    page_cache.invalidate(*entity.cache_tags())
+
+
 # All models, their relationships and properties
 
 """
@@ -38,8 +176,14 @@ Extends the base SQLAlchemy model
 """
 
 
-class Venue(db.Model):
+class Venue(Versioned, SoftDeletable, db.Model):
     __tablename__ = "venue"
+    __table_args__ = (
+        search_indexes("venue")
+        + facet_indexes("venue")
+        + dedup_indexes("venue", "name_key", "phone_key", "address_key")
+        + deleted_indexes("venue")
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -52,7 +196,16 @@ class Venue(db.Model):
     website_link = Column(String(500))
     seeking_talent = Column(Boolean)
     seeking_description = Column(String(100))
-    genres = Column(ARRAY(String(50)), nullable=True)
+    genres = Column(Genres, nullable=True)
+    # position of the city, set from the gazetteer of geo.py
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # blocking keys of dedup.py, set on flush
+    name_key = Column(String, nullable=True)
+    phone_key = Column(String(20), nullable=True)
+    address_key = Column(String, nullable=True)
+    upcoming_shows_count = Column(Integer, nullable=False, default=0)
+    past_shows_count = Column(Integer, nullable=False, default=0)
     shows = db.relationship("Musicshows", backref="venue", lazy="dynamic")
 
     def __init__(
@@ -82,15 +235,28 @@ class Venue(db.Model):
         self.image_link = image_link
 
     def insert(self):
+        save(self)
+
+    def stage(self):
         db.session.add(self)
-        db.session.commit()
+
+    def cache_tags(self):
+        return ("venues", "venue:%d" % self.id)
 
     def update(self):
+        self.touch()
+        touch_related(Artist, Musicshows.artist_id, Musicshows.venue_id == self.id)
         db.session.commit()
+        page_cache.invalidate("venues", "venue:%d" % self.id, "shows", "calendar")
 
     def delete(self):
-        db.session.delete(self)
+        """soft-deletes the venue, its shows are removed by purge.py"""
+        venue_id = self.id
+        self.deleted_at = datetime.utcnow()
+        self.touch()
+        uncount_shows(Artist, Musicshows.artist_id, Musicshows.venue_id == venue_id)
         db.session.commit()
+        page_cache.invalidate("venues", "venue:%d" % venue_id, "shows", "calendar")
 
     def short(self):
         return {
@@ -131,8 +297,14 @@ Extends the base SQLAlchemy model
 """
 
 
-class Artist(db.Model):
+class Artist(Versioned, SoftDeletable, db.Model):
     __tablename__ = "artist"
+    __table_args__ = (
+        search_indexes("artist")
+        + facet_indexes("artist")
+        + dedup_indexes("artist", "name_key", "phone_key")
+        + deleted_indexes("artist")
+    )
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
@@ -144,7 +316,12 @@ class Artist(db.Model):
     website_link = Column(String(500))
     seeking_venue = Column(Boolean)
     seeking_description = Column(String(100))
-    genres = Column(ARRAY(String(50)), nullable=True)
+    genres = Column(Genres, nullable=True)
+    # blocking keys of dedup.py, set on flush
+    name_key = Column(String, nullable=True)
+    phone_key = Column(String(20), nullable=True)
+    upcoming_shows_count = Column(Integer, nullable=False, default=0)
+    past_shows_count = Column(Integer, nullable=False, default=0)
     shows = db.relationship("Musicshows", backref="artist", lazy="dynamic")
 
     def __init__(
@@ -172,11 +349,28 @@ class Artist(db.Model):
         self.image_link = image_link
 
     def insert(self):
+        save(self)
+
+    def stage(self):
         db.session.add(self)
-        db.session.commit()
+
+    def cache_tags(self):
+        return ("artists", "artist:%d" % self.id)
 
     def update(self):
+        self.touch()
+        touch_related(Venue, Musicshows.venue_id, Musicshows.artist_id == self.id)
+        db.session.commit()
+        page_cache.invalidate("artists", "artist:%d" % self.id, "shows", "calendar")
+
+    def delete(self):
+        """soft-deletes the artist, its shows are removed by purge.py"""
+        artist_id = self.id
+        self.deleted_at = datetime.utcnow()
+        self.touch()
+        uncount_shows(Venue, Musicshows.venue_id, Musicshows.artist_id == artist_id)
         db.session.commit()
+        page_cache.invalidate("artists", "artist:%d" % artist_id, "shows", "calendar")
 
     def short(self):
         return {
@@ -209,8 +403,13 @@ Extends the base SQLAlchemy model
 """
 
 
-class Musicshows(db.Model):
+class Musicshows(Versioned, db.Model):
     __tablename__ = "musicshows"
+    __table_args__ = (
+        Index("ix_musicshows_start_time_id", "start_time", "id"),
+        Index("ix_musicshows_venue_id_start_time", "venue_id", "start_time"),
+        Index("ix_musicshows_artist_id_start_time", "artist_id", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     artist_id = Column(Integer, ForeignKey("artist.id"), primary_key=True)
@@ -223,8 +422,35 @@ class Musicshows(db.Model):
         self.start_time = start_time
 
     def insert(self):
+        save(self)
+
+    def stage(self):
         db.session.add(self)
-        db.session.commit()
+        self.update_counters()
+
+    def cache_tags(self):
+        return (
+            "shows",
+            "venues",
+            "venue:%d" % self.venue_id,
+            "artist:%d" % self.artist_id,
+            "calendar:%s" % self.start_time.date().isoformat(),
+        )
+
+    def update_counters(self):
+        """adds this show to the upcoming or past show counters
+        of its venue and artist and bumps their versions,
+        in the current transaction"""
+        column = (
+            "upcoming_shows_count"
+            if self.start_time > ShowCounters.watermark()
+            else "past_shows_count"
+        )
+        for model, key in ((Venue, self.venue_id), (Artist, self.artist_id)):
+            db.session.query(model).filter(model.id == key).update(
+                {column: getattr(model, column) + 1, **bumped(model)},
+                synchronize_session=False,
+            )
 
     def details(self):
         return {
@@ -252,3 +478,103 @@ class Musicshows(db.Model):
             "start_time": self.start_time.strftime("%m/%d/%Y, %H:%M:%S"),
         }
 
+
+
+def listed_shows():
+    """where clause of the shows whose venue and artist are not deleted, for
+    queries of shows that select no Venue or Artist entity (see hide_deleted())"""
+    return and_(
+        Musicshows.venue_id.notin_(select([Venue.id]).where(Venue.deleted_at.isnot(None))),
+        Musicshows.artist_id.notin_(select([Artist.id]).where(Artist.deleted_at.isnot(None))),
+    )
+
+
+def uncount_shows(model, key, condition):
+    """takes the shows matching condition off the upcoming and past counters
+    of the venues or artists whose id is their key, and bumps their versions,
+    in the current transaction"""
+    watermark = ShowCounters.watermark()
+    rows = (
+        db.session.query(
+            key,
+            func.sum(case([(Musicshows.start_time > watermark, 1)], else_=0)),
+            func.count(Musicshows.id),
+        )
+        .filter(condition)
+        .group_by(key)
+        .all()
+    )
+    if not rows:
+        return
+    table = model.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam("key"))
+        .values(
+            upcoming_shows_count=table.c.upcoming_shows_count - bindparam("upcoming"),
+            past_shows_count=table.c.past_shows_count - bindparam("past"),
+            **bumped(table.c)
+        ),
+        [
+            {"key": key_id, "upcoming": upcoming, "past": n - upcoming}
+            for key_id, upcoming, n in rows
+        ],
+    )
+
+
+# A show books its venue and artist for SHOW_DURATION from its start time.
+# On postgresql exclusion constraints reject overlapping bookings, see
+# booking.py and migration a3e5c7f9b2d4, which must use the same duration.
+SHOW_DURATION = timedelta(hours=3)
+
+event.listen(
+    Musicshows.__table__,
+    "after_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
+for column in ("venue_id", "artist_id"):
+    event.listen(
+        Musicshows.__table__,
+        "after_create",
+        DDL(
+            "ALTER TABLE musicshows ADD CONSTRAINT musicshows_{column}_no_overlap "
+            "EXCLUDE USING gist ({column} WITH =, "
+            "tsrange(start_time, start_time + interval '{hours} hours') WITH &&)".format(
+                column=column, hours=int(SHOW_DURATION.total_seconds() // 3600)
+            )
+        ).execute_if(dialect="postgresql"),
+    )
+
+
+"""
+ShowCounters
+A single row holding the time up to which the upcoming/past show counters
+of venues and artists are accurate. Shows starting after rolled_over_at are
+counted as upcoming, see counters.py for the job that moves it forward.
+"""
+
+
+class ShowCounters(db.Model):
+    __tablename__ = "show_counters"
+
+    id = Column(Integer, primary_key=True)
+    rolled_over_at = Column(DateTime(), nullable=False)
+
+    @classmethod
+    def current(cls, lock=None):
+        """returns the counter state row, creating it on a fresh database.
+        lock="read" blocks roll-overs until the transaction ends,
+        lock="update" blocks inserts of shows as well."""
+        query = db.session.query(cls)
+        if lock:
+            query = query.with_for_update(read=lock == "read")
+        state = query.get(1)
+        if state is None:
+            state = cls(id=1, rolled_over_at=datetime.now())
+            db.session.add(state)
+            db.session.flush()
+        return state
+
+    @classmethod
+    def watermark(cls):
+        return cls.current(lock="read").rolled_over_at
@@ -0,0 +1,153 @@
+"""
+Connection pool metrics of this worker, served at /metrics.
+
+checkout   -- how long requests wait for a connection, the last
+              LATENCY_SAMPLES checkouts give the percentiles
+saturation -- connections in use against what the pool may open
+              (pool_size + max_overflow), and checkouts that timed out
+churn      -- DBAPI connections opened, closed and invalidated; with a
+              sized pool these stay flat, a steady rise means connections
+              are recycled or dropped faster than they are reused
+
+SQLAlchemy has no event before a checkout, so the wait is timed by
+wrapping the pool's checkout methods.
+"""
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+LATENCY_SAMPLES = 1000
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pool = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.monotonic()
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_count = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self.waits = deque(maxlen=LATENCY_SAMPLES)
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.connects = 0
+            self.closes = 0
+            self.invalidations = 0
+
+    def instrument(self, engine):
+        """starts collecting the metrics of the engine's pool"""
+        pool = self.pool = engine.pool
+        # the engine checks out through both
+        pool.connect = self.timed(pool.connect)
+        pool.unique_connection = self.timed(pool.unique_connection)
+        event.listen(pool, "checkout", self.on_checkout)
+        event.listen(pool, "checkin", self.on_checkin)
+        event.listen(pool, "connect", self.on_connect)
+        event.listen(pool, "close", self.on_close)
+        event.listen(pool, "invalidate", self.on_invalidate)
+
+    def timed(self, checkout):
+        def timed_checkout():
+            start = time.perf_counter()
+            try:
+                return checkout()
+            except PoolTimeout:
+                with self.lock:
+                    self.timeouts += 1
+                raise
+            finally:
+                self.record_wait(time.perf_counter() - start)
+
+        return timed_checkout
+
+    def record_wait(self, seconds):
+        with self.lock:
+            self.wait_count += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.waits.append(seconds)
+
+    def on_checkout(self, dbapi_connection, record, proxy):
+        with self.lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, dbapi_connection, record):
+        with self.lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def on_connect(self, dbapi_connection, record):
+        with self.lock:
+            self.connects += 1
+
+    def on_close(self, dbapi_connection, record):
+        with self.lock:
+            self.closes += 1
+
+    def on_invalidate(self, dbapi_connection, record, exception):
+        with self.lock:
+            self.invalidations += 1
+
+    def capacity(self):
+        """connections the pool may open, None for pools without a limit"""
+        size = getattr(self.pool, "size", None)
+        overflow = getattr(self.pool, "_max_overflow", None)
+        if size is None or overflow is None:
+            return None
+        return size() + max(overflow, 0)
+
+    def stats(self):
+        capacity = self.capacity()
+        with self.lock:
+            waits = list(self.waits)
+            minutes = max(time.monotonic() - self.started, 1e-9) / 60
+            return {
+                "pool": type(self.pool).__name__ if self.pool is not None else None,
+                "checkout": {
+                    "count": self.checkouts,
+                    "wait_ms_avg": self.wait_total / self.wait_count * 1000 if self.wait_count else 0.0,
+                    "wait_ms_p50": percentile(waits, 0.5) * 1000,
+                    "wait_ms_p99": percentile(waits, 0.99) * 1000,
+                    "wait_ms_max": self.wait_max * 1000,
+                },
+                "saturation": {
+                    "in_use": self.in_use,
+                    "peak_in_use": self.peak_in_use,
+                    "capacity": capacity,
+                    "utilization": self.in_use / capacity if capacity else None,
+                    "peak_utilization": self.peak_in_use / capacity if capacity else None,
+                    "timeouts": self.timeouts,
+                },
+                "churn": {
+                    "connects": self.connects,
+                    "closes": self.closes,
+                    "invalidations": self.invalidations,
+                    "connects_per_minute": self.connects / minutes,
+                },
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+def init_pool_metrics(app, db):
+    """instruments the pool of the app's engine"""
+    pool_metrics.instrument(db.get_engine(app))
+    return pool_metrics
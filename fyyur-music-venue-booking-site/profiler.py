@@ -0,0 +1,132 @@
+"""
+Per-request SQL profile, on with SQL_PROFILE (config.py).
+
+Every statement a request sends, to the primary or a replica, is timed with
+the engine's cursor events. After the request the profile is
+
+    queries    -- number of statements
+    db_ms      -- time spent in them
+    slowest    -- the SQL_PROFILE_SLOWEST slowest, with their time
+    duplicates -- statements sent more than once, by fingerprint (the
+                  statement with literals and IN lists collapsed), the
+                  usual sign of an N+1 loop
+
+It is logged as one JSON line on the app logger and summed up in the
+X-SQL-Profile response header, e.g. "queries=3; db_ms=1.42; duplicates=0".
+"""
+import json
+import re
+import time
+from collections import Counter
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HEADER = "X-SQL-Profile"
+STATEMENT_CHARS = 300
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PARAMETER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+IN_LISTS = re.compile(
+    r"\bIN\s*\(\s*{0}(?:\s*,\s*{0})*\s*\)".format(PARAMETER), re.IGNORECASE
+)
+SPACES = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """statement with its literals, parameter lists and spacing normalized"""
+    statement = LITERALS.sub("?", statement)
+    statement = IN_LISTS.sub("IN (...)", statement)
+    return SPACES.sub(" ", statement).strip()
+
+
+class Profile:
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.statements.append((statement, seconds))
+
+    def summary(self, slowest=3):
+        counts = Counter(fingerprint(statement) for statement, _ in self.statements)
+        ranked = sorted(self.statements, key=lambda item: item[1], reverse=True)
+        return {
+            "queries": len(self.statements),
+            "db_ms": round(sum(seconds for _, seconds in self.statements) * 1000, 3),
+            "slowest": [
+                {"ms": round(seconds * 1000, 3), "statement": fingerprint(statement)[:STATEMENT_CHARS]}
+                for statement, seconds in ranked[:slowest]
+            ],
+            "duplicates": [
+                {"count": n, "statement": statement[:STATEMENT_CHARS]}
+                for statement, n in counts.most_common()
+                if n > 1
+            ],
+        }
+
+
+def current_profile():
+    try:
+        return g.get("sql_profile")
+    except RuntimeError:  # outside of an app context
+        return None
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and current_profile() is not None:
+        context.sql_profile_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    start = getattr(context, "sql_profile_start", None)
+    if profile is not None and start is not None:
+        profile.record(statement, time.perf_counter() - start)
+
+
+class Profiler:
+    def __init__(self):
+        self.app = None
+        # summary of the last profiled request of this worker
+        self.last = None
+
+    def start(self):
+        if self.app.config.get("SQL_PROFILE"):
+            g.sql_profile = Profile()
+
+    def finish(self, response):
+        profile = g.pop("sql_profile", None)
+        if profile is None:
+            return response
+        summary = self.last = profile.summary(self.app.config.get("SQL_PROFILE_SLOWEST", 3))
+        response.headers[HEADER] = "queries={}; db_ms={:.2f}; duplicates={}".format(
+            summary["queries"], summary["db_ms"], len(summary["duplicates"])
+        )
+        self.app.logger.info(
+            json.dumps(
+                dict(
+                    event="sql_profile",
+                    method=request.method,
+                    path=request.full_path.rstrip("?"),
+                    endpoint=request.endpoint,
+                    status=response.status_code,
+                    **summary
+                )
+            )
+        )
+        return response
+
+
+profiler = Profiler()
+
+
+def init_profiler(app):
+    """times the statements of every engine and profiles the requests"""
+    profiler.app = app
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    app.before_request(profiler.start)
+    app.after_request(profiler.finish)
+    return profiler
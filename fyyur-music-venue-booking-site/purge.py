@@ -0,0 +1,134 @@
+"""
+Purge of deleted venues and artists.
+
+Venue.delete() and Artist.delete() only set deleted_at and take the entry's
+shows off the counters of the other side: the entry and its shows disappear
+at once (see hide_deleted() and listed_shows() in models.py) and the request
+deletes no row of musicshows, however many shows the entry has. The purge
+job then removes its shows, upcoming ones first, in batches of
+PURGE_BATCH_SIZE rows each deleted and committed in its own short
+transaction, so a venue with a million shows never holds locks on
+musicshows for long. Once no show is left the entry itself is deleted.
+
+The job runs every PURGE_INTERVAL seconds on the scheduler of each worker
+(see scheduler.py) and stops after PURGE_MAX_BATCHES batches, leaving the
+rest to the next run; `flask purge-deleted` purges everything at once.
+Workers may purge concurrently: each batch is read FOR UPDATE SKIP LOCKED,
+so workers do not wait on each other's batches, and an entry is deleted
+only once no show of it is left, otherwise the next run deletes it.
+"""
+import threading
+
+from sqlalchemy import exists
+
+from models import db, Venue, Artist, Musicshows
+
+# (model, key of its shows)
+PURGED = ((Venue, Musicshows.venue_id), (Artist, Musicshows.artist_id))
+
+
+class Purger:
+    def __init__(self, batch_size=1000, max_batches=100):
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.lock = threading.Lock()
+        self.purged = {"venues": 0, "artists": 0, "shows": 0, "batches": 0}
+
+    def deleted(self, model):
+        """ids of the deleted entries of model, oldest deletion first"""
+        return [
+            row.id
+            for row in db.session.query(model.id)
+            .execution_options(include_deleted=True)
+            .filter(model.deleted_at.isnot(None))
+            .order_by(model.deleted_at, model.id)
+        ]
+
+    def purge_batch(self, key, entity_id):
+        """Deletes up to batch_size shows of one entry and commits.
+        Arguments:
+            key -- column of the shows holding the entry's id
+            entity_id {int} -- id of the deleted venue or artist
+        Returns:
+            int -- number of shows deleted, 0 if none was free to delete
+        """
+        rows = (
+            db.session.query(Musicshows.id)
+            .filter(key == entity_id)
+            # upcoming shows first, they still hold bookings (see booking.py);
+            # the order of the (venue_id or artist_id, start_time) index
+            .order_by(Musicshows.start_time.desc())
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if rows:
+            table = Musicshows.__table__
+            db.session.execute(table.delete().where(table.c.id.in_([row.id for row in rows])))
+        db.session.commit()
+        return len(rows)
+
+    def purge_entity(self, model, key, entity_id, budget):
+        """Deletes the shows of one entry, then the entry once it has none.
+        Returns:
+            tuple -- (whether the entry is gone, batches left of budget)
+        """
+        while True:
+            if budget is not None and budget <= 0:
+                return False, budget
+            n = self.purge_batch(key, entity_id)
+            if not n:
+                break
+            self.purged["shows"] += n
+            self.purged["batches"] += 1
+            if budget is not None:
+                budget -= 1
+        # an empty batch may also mean that another worker holds the last
+        # shows, which still reference the entry until it commits
+        left = db.session.query(exists().where(key == entity_id)).scalar()
+        if left:
+            db.session.commit()
+            return False, budget
+        table = model.__table__
+        db.session.execute(
+            table.delete().where(table.c.id == entity_id).where(table.c.deleted_at.isnot(None))
+        )
+        db.session.commit()
+        self.purged[model.__tablename__ + "s"] += 1
+        return True, budget
+
+    def run(self, max_batches=None):
+        """Purges the deleted venues and artists.
+        Keyword Arguments:
+            max_batches {int} -- batches of shows deleted before stopping,
+                None for no limit (default: no limit)
+        Returns:
+            int -- number of venues and artists removed
+        """
+        budget = max_batches
+        removed = 0
+        with self.lock:
+            for model, key in PURGED:
+                for entity_id in self.deleted(model):
+                    gone, budget = self.purge_entity(model, key, entity_id, budget)
+                    removed += gone
+                    if budget is not None and budget <= 0:
+                        return removed
+        return removed
+
+    def scheduled_run(self):
+        return self.run(self.max_batches)
+
+    def stats(self):
+        return dict(self.purged, batch_size=self.batch_size)
+
+
+purger = Purger()
+
+
+def init_purge(app, scheduler):
+    """schedules the purge of the deleted venues and artists"""
+    purger.batch_size = app.config.get("PURGE_BATCH_SIZE", 1000)
+    purger.max_batches = app.config.get("PURGE_MAX_BATCHES", 100)
+    scheduler.every(app.config.get("PURGE_INTERVAL", 60), purger.scheduled_run, "purge")
+    return purger
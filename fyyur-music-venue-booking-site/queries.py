@@ -0,0 +1,191 @@
+"""
+Read-side queries used by the controllers in app.py.
+Each function builds its result from a fixed number of SQL statements,
+independent of how many rows are involved.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import tuple_
+
+from models import db, Venue, Artist, Musicshows
+
+SHOWS_PER_PAGE = 60
+
+
+def venue_directory():
+    """Returns venues grouped by (city, state) along with
+    the number of upcoming shows of each venue.
+    Show counts are read from the counters maintained on Venue,
+    so the whole directory comes from a single scan of the venue table.
+    Returns:
+        list of dictionary -- areas, each with a list of venues
+    """
+    rows = (
+        db.session.query(
+            Venue.id,
+            Venue.name,
+            Venue.city,
+            Venue.state,
+            Venue.upcoming_shows_count.label("num_upcoming_shows"),
+        )
+        .order_by(Venue.city, Venue.state, Venue.name, Venue.id)
+        .all()
+    )
+
+    data = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        data.append(
+            {
+                "city": city,
+                "state": state,
+                "venues": [
+                    {
+                        "id": venue.id,
+                        "name": venue.name,
+                        "num_upcoming_shows": venue.num_upcoming_shows,
+                    }
+                    for venue in venues
+                ],
+            }
+        )
+    return data
+
+
+def encode_cursor(start_time, show_id):
+    """builds the opaque keyset cursor pointing after the given show"""
+    return "{}_{}".format(start_time.isoformat(), show_id)
+
+
+def decode_cursor(cursor):
+    """inverse of encode_cursor, raises ValueError on malformed cursors"""
+    start_time, show_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+def show_listing(after=None, limit=SHOWS_PER_PAGE):
+    """Returns one page of shows ordered by (start_time, id).
+    Venue and artist columns are joined in, so a page costs one query
+    whatever its size, and the keyset condition lets the database seek
+    straight to the page instead of skipping OFFSET rows.
+    Keyword Arguments:
+        after {str} -- cursor returned with the previous page (default: first page)
+        limit {int} -- shows per page
+    Returns:
+        tuple -- (list of dictionary -- shows, cursor of the next page or None)
+    """
+    query = (
+        db.session.query(
+            Musicshows.id,
+            Musicshows.start_time,
+            Musicshows.venue_id,
+            Venue.name.label("venue_name"),
+            Musicshows.artist_id,
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+        )
+        .join(Venue, Venue.id == Musicshows.venue_id)
+        .join(Artist, Artist.id == Musicshows.artist_id)
+    )
+    if after:
+        query = query.filter(
+            tuple_(Musicshows.start_time, Musicshows.id) > tuple_(*decode_cursor(after))
+        )
+    rows = query.order_by(Musicshows.start_time, Musicshows.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].start_time, rows[-1].id)
+
+    shows = [
+        {
+            "venue_id": row.venue_id,
+            "venue_name": row.venue_name,
+            "artist_id": row.artist_id,
+            "artist_name": row.artist_name,
+            "artist_image_link": row.artist_image_link,
+            "start_time": row.start_time,
+        }
+        for row in rows
+    ]
+    return shows, next_cursor
+
+
+def split_shows(shows, current_time):
+    """splits shows ordered by start_time into (past, upcoming)"""
+    times = [show["start_time"] for show in shows]
+    past = shows[: bisect_left(times, current_time)]
+    upcoming = shows[bisect_right(times, current_time) :]
+    return past, upcoming
+
+
+def venue_shows(venue_id, current_time=None):
+    """Returns the past and upcoming shows of a venue, with artist details.
+    Both come from one scan of the (venue_id, start_time) index.
+    Arguments:
+        venue_id {int} -- venue id
+    Keyword Arguments:
+        current_time {datetime} -- shows after this are upcoming (default: now)
+    Returns:
+        tuple -- (past shows, upcoming shows), lists of dictionary
+    """
+    if current_time is None:
+        current_time = datetime.now()
+    rows = (
+        db.session.query(
+            Musicshows.start_time,
+            Musicshows.artist_id,
+            Artist.name,
+            Artist.image_link,
+        )
+        .join(Artist, Artist.id == Musicshows.artist_id)
+        .filter(Musicshows.venue_id == venue_id)
+        .order_by(Musicshows.start_time)
+    )
+    shows = [
+        {
+            "artist_id": row.artist_id,
+            "artist_name": row.name,
+            "artist_image_link": row.image_link,
+            "start_time": row.start_time,
+        }
+        for row in rows
+    ]
+    return split_shows(shows, current_time)
+
+
+def artist_shows(artist_id, current_time=None):
+    """Returns the past and upcoming shows of an artist, with venue details.
+    Both come from one scan of the (artist_id, start_time) index.
+    Arguments:
+        artist_id {int} -- artist id
+    Keyword Arguments:
+        current_time {datetime} -- shows after this are upcoming (default: now)
+    Returns:
+        tuple -- (past shows, upcoming shows), lists of dictionary
+    """
+    if current_time is None:
+        current_time = datetime.now()
+    rows = (
+        db.session.query(
+            Musicshows.start_time,
+            Musicshows.venue_id,
+            Venue.name,
+            Venue.image_link,
+        )
+        .join(Venue, Venue.id == Musicshows.venue_id)
+        .filter(Musicshows.artist_id == artist_id)
+        .order_by(Musicshows.start_time)
+    )
+    shows = [
+        {
+            "venue_id": row.venue_id,
+            "venue_name": row.name,
+            "venue_image_link": row.image_link,
+            "start_time": row.start_time,
+        }
+        for row in rows
+    ]
+    return split_shows(shows, current_time)
@@ -0,0 +1,354 @@
+"""
+Compact in-memory read model of the catalog, on with READ_MODEL (config.py).
+
+The venue and artist pages render from it without building ORM objects.
+Venues and artists are __slots__ records holding the fields of their page,
+with repeated strings (cities, states, genres) shared. Shows are four
+parallel arrays of integers: id, venue id, artist id and start time in
+microseconds. Each record keeps the rows of its shows ordered by start
+time, so its past and upcoming shows are split with one bisection.
+
+The model is built with three queries on first use and follows the writes:
+    - commits of this worker are applied as they happen, from the session
+      events, like the trigram index of search.py
+    - every READ_MODEL_REFRESH seconds the venues and artists other workers
+      changed are reread by updated_at and their new shows by id, like the
+      recommendation index; row counts that still disagree with the
+      database after that mean deletes, and rebuild the model
+Bulk imports reset it. Each worker keeps its own model. With the shared
+page cache, a page is rendered after another worker invalidated it and is
+then cached under the new tag versions, so those renders refresh the model
+first (see show_venue() in app.py).
+"""
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from models import db, Venue, Artist, Musicshows
+
+VENUE_FIELDS = (
+    "id", "name", "genres", "address", "city", "state", "phone", "website_link",
+    "facebook_link", "seeking_talent", "seeking_description", "image_link",
+)
+ARTIST_FIELDS = (
+    "id", "name", "genres", "city", "state", "phone", "website_link",
+    "facebook_link", "seeking_venue", "seeking_description", "image_link",
+)
+# fields of the artist (venue) of each show on a venue (artist) page
+SHOW_FIELDS = ("name", "image_link")
+SHARED_FIELDS = ("city", "state")
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# rows changed within this margin before the last refresh are read again
+OVERLAP = timedelta(seconds=1)
+CHUNK = 10000
+
+
+def to_micros(start_time):
+    return (start_time - EPOCH) // MICROSECOND
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class Record:
+    """fields of a venue or artist page, and the rows of its shows"""
+
+    __slots__ = ("starts", "rows")
+    FIELDS = ()
+
+    def __init__(self):
+        self.starts = array("q")
+        self.rows = array("l")
+
+    def details(self):
+        details = {field: getattr(self, field) for field in self.FIELDS}
+        details["genres"] = list(self.genres)
+        return details
+
+    def add_show(self, start, row):
+        if not self.starts or start >= self.starts[-1]:
+            self.starts.append(start)
+            self.rows.append(row)
+        else:
+            i = bisect_right(self.starts, start)
+            self.starts.insert(i, start)
+            self.rows.insert(i, row)
+
+    def remove_show(self, row):
+        for i, other in enumerate(self.rows):
+            if other == row:
+                del self.starts[i]
+                del self.rows[i]
+                return
+
+    def split(self, now):
+        """rows of the past and of the upcoming shows"""
+        now = to_micros(now)
+        return self.rows[: bisect_left(self.starts, now)], self.rows[bisect_right(self.starts, now) :]
+
+
+class VenueRecord(Record):
+    __slots__ = VENUE_FIELDS
+    FIELDS = VENUE_FIELDS
+
+
+class ArtistRecord(Record):
+    __slots__ = ARTIST_FIELDS
+    FIELDS = ARTIST_FIELDS
+
+
+class ReadModel:
+    def __init__(self, refresh_interval=5):
+        self.enabled = False
+        self.refresh_interval = refresh_interval
+        self.lock = threading.RLock()
+        self.builds = 0
+        self.refreshes = 0
+        self.clear()
+
+    def clear(self):
+        self.venues = {}
+        self.artists = {}
+        self.show_ids = array("q")
+        self.show_venues = array("q")
+        self.show_artists = array("q")
+        self.show_starts = array("q")
+        # rows of the deleted shows are kept, with venue and artist 0
+        self.deleted_shows = 0
+        self.shared = {}
+        self.changed_since = None
+        self.last_show = 0
+        self.checked_at = None
+
+    def reset(self):
+        """forgets the model, it is rebuilt on next use"""
+        with self.lock:
+            self.clear()
+
+    def share(self, value):
+        """one copy of equal strings and genre lists"""
+        if isinstance(value, list):
+            value = tuple(sys.intern(item) for item in value)
+        elif isinstance(value, str):
+            value = sys.intern(value)
+        return self.shared.setdefault(value, value)
+
+    def store(self, records, record_class, values):
+        """writes a venue or artist from {field: value}"""
+        record = records.get(values["id"])
+        if record is None:
+            record = records[values["id"]] = record_class()
+        for field in record_class.FIELDS:
+            value = values[field]
+            if field == "genres":
+                value = self.share(value or [])
+            elif field in SHARED_FIELDS:
+                value = self.share(value)
+            setattr(record, field, value)
+        updated_at = values.get("updated_at")
+        if updated_at is not None and (self.changed_since is None or updated_at > self.changed_since):
+            self.changed_since = updated_at
+
+    def add_show(self, key, venue_id, artist_id, start_time):
+        row = len(self.show_ids)
+        start = to_micros(start_time)
+        self.show_ids.append(key)
+        self.show_venues.append(venue_id)
+        self.show_artists.append(artist_id)
+        self.show_starts.append(start)
+        for record in (self.venues.get(venue_id), self.artists.get(artist_id)):
+            if record is not None:
+                record.add_show(start, row)
+        self.last_show = max(self.last_show, key)
+
+    def remove_show(self, key, venue_id, artist_id):
+        venue = self.venues.get(venue_id)
+        for row in venue.rows if venue is not None else range(len(self.show_ids)):
+            if self.show_ids[row] == key:
+                for record in (venue, self.artists.get(artist_id)):
+                    if record is not None:
+                        record.remove_show(row)
+                self.show_venues[row] = self.show_artists[row] = 0
+                self.deleted_shows += 1
+                return
+
+    def entity_rows(self, model, fields, since=None):
+        query = db.session.query(*[getattr(model, field) for field in fields], model.updated_at)
+        if since is not None:
+            query = query.filter(model.updated_at >= since - OVERLAP)
+        for row in query.yield_per(CHUNK):
+            yield dict(zip(fields + ("updated_at",), row))
+
+    def show_rows(self):
+        return (
+            db.session.query(Musicshows.id, Musicshows.venue_id, Musicshows.artist_id, Musicshows.start_time)
+            .filter(Musicshows.id > self.last_show)
+            .order_by(Musicshows.start_time, Musicshows.id)
+            .yield_per(CHUNK)
+        )
+
+    def load(self, since=None):
+        for values in self.entity_rows(Venue, VENUE_FIELDS, since):
+            self.store(self.venues, VenueRecord, values)
+        for values in self.entity_rows(Artist, ARTIST_FIELDS, since):
+            self.store(self.artists, ArtistRecord, values)
+        for row in self.show_rows():
+            self.add_show(*row)
+
+    def build(self):
+        """loads all venues, artists and shows"""
+        self.clear()
+        self.load()
+        self.builds += 1
+        self.checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """builds the model, or brings it up to date if it was last checked
+        more than refresh_interval seconds ago"""
+        with self.lock:
+            if self.checked_at is None:
+                return self.build()
+            if not force and time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            self.load(self.changed_since)
+            self.refreshes += 1
+            self.checked_at = time.monotonic()
+            counts = db.session.query(
+                db.session.query(func.count(Venue.id)).as_scalar(),
+                db.session.query(func.count(Artist.id)).as_scalar(),
+                db.session.query(func.count(Musicshows.id)).as_scalar(),
+            ).one()
+            if tuple(counts) != (len(self.venues), len(self.artists), len(self.show_ids) - self.deleted_shows):
+                self.build()
+
+    def shows(self, rows, other, fields):
+        """show dictionaries of rows, with the fields of their artist or venue"""
+        records = self.artists if other == "artist" else self.venues
+        ids = self.show_artists if other == "artist" else self.show_venues
+        shows = []
+        for row in rows:
+            record = records.get(ids[row])
+            if record is not None:
+                show = {other + "_" + field: getattr(record, field) for field in fields}
+                show[other + "_id"] = record.id
+                show["start_time"] = from_micros(self.show_starts[row])
+                shows.append(show)
+        return shows
+
+    def page(self, kind, key, now=None, fresh=False):
+        """details of a venue or artist with its past and upcoming shows,
+        read after a refresh if fresh"""
+        self.refresh(force=fresh)
+        # looked up after the refresh, a rebuild replaces the records
+        record = (self.venues if kind == "venue" else self.artists).get(key)
+        if record is None:
+            return None
+        other = "artist" if kind == "venue" else "venue"
+        past, upcoming = record.split(now or datetime.now())
+        data = record.details()
+        data["past_shows"] = self.shows(past, other, SHOW_FIELDS)
+        data["upcoming_shows"] = self.shows(upcoming, other, SHOW_FIELDS)
+        data["past_shows_count"] = len(data["past_shows"])
+        data["upcoming_shows_count"] = len(data["upcoming_shows"])
+        return data
+
+    def venue_page(self, venue_id, now=None, fresh=False):
+        """Returns what the venue page shows, as show_venue() builds it from
+        the ORM: Venue.details() with the past and upcoming shows.
+        Arguments:
+            venue_id {int} -- venue id
+        Keyword Arguments:
+            now {datetime} -- shows after this are upcoming (default: now)
+            fresh {bool} -- pick up the changes of other workers first,
+                rather than up to refresh_interval seconds late
+        Returns:
+            dictionary -- venue details, None for an unknown venue
+        """
+        return self.page("venue", venue_id, now, fresh)
+
+    def artist_page(self, artist_id, now=None, fresh=False):
+        """same as venue_page(), for the artist page"""
+        return self.page("artist", artist_id, now, fresh)
+
+    def apply(self, changes):
+        with self.lock:
+            if self.checked_at is None:
+                return
+            for kind, key, values in changes:
+                if kind == "show":
+                    if values is None:
+                        self.remove_show(key[0], key[1], key[2])
+                    else:
+                        self.add_show(key, *values)
+                    continue
+                records, record_class = (
+                    (self.venues, VenueRecord) if kind == "venue" else (self.artists, ArtistRecord)
+                )
+                if values is None:
+                    records.pop(key, None)
+                else:
+                    self.store(records, record_class, values)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "venues": len(self.venues),
+            "artists": len(self.artists),
+            "shows": len(self.show_ids) - self.deleted_shows,
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+        }
+
+
+read_model = ReadModel()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+    pending = session.info.setdefault("read_model_pending", [])
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, (Venue, Artist)) and entity.deleted_at is not None:
+            # soft-deleted, its shows are left in place until purged
+            pending.append((type(entity).__name__.lower(), entity.id, None))
+        elif isinstance(entity, Venue):
+            pending.append(("venue", entity.id, {f: getattr(entity, f) for f in VENUE_FIELDS}))
+        elif isinstance(entity, Artist):
+            pending.append(("artist", entity.id, {f: getattr(entity, f) for f in ARTIST_FIELDS}))
+    for entity in session.new:
+        if isinstance(entity, Musicshows):
+            pending.append(("show", entity.id, (entity.venue_id, entity.artist_id, entity.start_time)))
+    for entity in session.deleted:
+        if isinstance(entity, Venue):
+            pending.append(("venue", entity.id, None))
+        elif isinstance(entity, Artist):
+            pending.append(("artist", entity.id, None))
+        elif isinstance(entity, Musicshows):
+            pending.append(("show", (entity.id, entity.venue_id, entity.artist_id), None))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_changes(session):
+    changes = session.info.pop("read_model_pending", [])
+    if changes and read_model.enabled:
+        # venues and artists first, so that new shows find them
+        changes.sort(key=lambda change: change[0] == "show")
+        read_model.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("read_model_pending", None)
+
+
+def init_read_model(app):
+    read_model.enabled = app.config.get("READ_MODEL", False)
+    read_model.refresh_interval = app.config.get("READ_MODEL_REFRESH", 5)
+    return read_model
@@ -0,0 +1,272 @@
+"""
+Venue and artist recommendations, needs numpy (optional dependency).
+
+Artists seeking a venue are suggested venues seeking talent, and the
+other way round, ranked by
+
+    GENRE_WEIGHT   * share of the entity's genres the candidate plays
+  + CITY_WEIGHT    * same city, STATE_WEIGHT * same state
+  + HISTORY_WEIGHT * share of the candidate's past shows in those genres
+
+The index keeps one row per venue and per artist in numpy arrays: a 0/1
+genre vector, city and state codes, and the co-booking counts, i.e. how
+many shows the venue (artist) had with artists (venues) of each genre.
+A suggestion scores all candidates with one matrix-vector product and
+picks the top k with argpartition.
+
+The index is built on first use and refreshed at most every
+RECOMMEND_REFRESH seconds: venues and artists changed since the last
+refresh (by updated_at) are rewritten and new shows (by id) are added to
+the co-booking counts. Deletes, and shows committed after a show with a
+higher id, make the row counts disagree with the database, which rebuilds
+the index.
+Co-booking counts use the genres an artist or venue had when the show was
+indexed.
+"""
+import threading
+import time
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, see README
+    np = None
+
+from sqlalchemy import func
+
+from forms import genre_choices
+from models import db, Venue, Artist, Musicshows
+
+GENRES = [choice[0] for choice in genre_choices]
+
+GENRE_WEIGHT = 1.0
+CITY_WEIGHT = 0.5
+STATE_WEIGHT = 0.25
+HISTORY_WEIGHT = 0.5
+
+# rows written in the same instant as the watermark may commit after it
+OVERLAP = timedelta(seconds=1)
+CHUNK = 10000
+
+
+class Entities:
+    """index rows of the venues or the artists, arrays grow by doubling"""
+
+    ARRAYS = {
+        "genres": ("float32", len(GENRES)),
+        "bookings": ("float32", len(GENRES)),
+        "shows": ("float32", None),
+        "city": ("int32", None),
+        "state": ("int32", None),
+        "seeking": ("bool", None),
+    }
+
+    def __init__(self, capacity=1024):
+        self.rows = {}
+        self.ids = []
+        self.names = []
+        self.places = []
+        self.size = 0
+        for name, (dtype, width) in self.ARRAYS.items():
+            shape = (capacity, width) if width else capacity
+            setattr(self, name, np.zeros(shape, dtype))
+
+    def grow(self):
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((len(old) * 2,) + old.shape[1:], old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def row(self, key):
+        """row of id key, appended if it is new"""
+        row = self.rows.get(key)
+        if row is None:
+            if self.size == len(self.seeking):
+                self.grow()
+            row = self.rows[key] = self.size
+            self.ids.append(key)
+            self.names.append(None)
+            self.places.append(None)
+            self.size += 1
+        return row
+
+
+class Recommender:
+    def __init__(self, refresh=5):
+        self.refresh_interval = refresh
+        self.lock = threading.Lock()
+        self.builds = 0
+        self.refreshes = 0
+        self.clear()
+
+    def clear(self):
+        self.genre_columns = {genre: i for i, genre in enumerate(GENRES)}
+        self.place_codes = {}
+        self.venues = Entities()
+        self.artists = Entities()
+        self.changed_since = None
+        self.last_show = 0
+        self.show_count = 0
+        self.checked_at = None
+
+    def code(self, place):
+        return self.place_codes.setdefault(place, len(self.place_codes))
+
+    def store(self, entities, rows):
+        """writes rows of (id, name, city, state, genres, seeking, updated_at)"""
+        for key, name, city, state, genres, seeking, updated_at in rows:
+            row = entities.row(key)
+            entities.names[row] = name
+            entities.places[row] = (city, state)
+            entities.city[row] = self.code(("city", city, state))
+            entities.state[row] = self.code(("state", state))
+            entities.seeking[row] = bool(seeking)
+            entities.genres[row] = 0
+            for genre in genres or ():
+                column = self.genre_columns.get(genre)
+                if column is not None:
+                    entities.genres[row, column] = 1
+            if self.changed_since is None or updated_at > self.changed_since:
+                self.changed_since = updated_at
+
+    def book(self, shows):
+        """adds the shows, as (id, venue_id, artist_id) rows, to the co-booking counts"""
+        if not shows:
+            return
+        self.last_show = max(self.last_show, max(show[0] for show in shows))
+        self.show_count += len(shows)
+        shows = [show for show in shows if show[1] in self.venues.rows and show[2] in self.artists.rows]
+        if not shows:
+            return
+        venues = np.fromiter((self.venues.rows[show[1]] for show in shows), np.int64, len(shows))
+        artists = np.fromiter((self.artists.rows[show[2]] for show in shows), np.int64, len(shows))
+        np.add.at(self.venues.bookings, venues, self.artists.genres[artists])
+        np.add.at(self.artists.bookings, artists, self.venues.genres[venues])
+        np.add.at(self.venues.shows, venues, 1)
+        np.add.at(self.artists.shows, artists, 1)
+
+    def entity_rows(self, model, since=None):
+        seeking = model.seeking_talent if model is Venue else model.seeking_venue
+        query = db.session.query(
+            model.id, model.name, model.city, model.state, model.genres, seeking, model.updated_at
+        )
+        if since is not None:
+            query = query.filter(model.updated_at >= since - OVERLAP)
+        return query.yield_per(CHUNK)
+
+    def show_rows(self):
+        query = db.session.query(Musicshows.id, Musicshows.venue_id, Musicshows.artist_id)
+        return query.filter(Musicshows.id > self.last_show).order_by(Musicshows.id).yield_per(CHUNK)
+
+    def add_shows(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == CHUNK:
+                self.book(chunk)
+                chunk = []
+        self.book(chunk)
+
+    def build(self):
+        """indexes all venues, artists and shows"""
+        self.clear()
+        self.store(self.venues, self.entity_rows(Venue))
+        self.store(self.artists, self.entity_rows(Artist))
+        self.add_shows(self.show_rows())
+        self.builds += 1
+        self.checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """builds the index, or brings it up to date if it was last checked
+        more than refresh_interval seconds ago"""
+        with self.lock:
+            if self.checked_at is None:
+                return self.build()
+            if not force and time.monotonic() - self.checked_at < self.refresh_interval:
+                return
+            since = self.changed_since
+            self.store(self.venues, self.entity_rows(Venue, since))
+            self.store(self.artists, self.entity_rows(Artist, since))
+            self.add_shows(self.show_rows())
+            self.refreshes += 1
+            self.checked_at = time.monotonic()
+            counts = db.session.query(
+                db.session.query(func.count(Venue.id)).as_scalar(),
+                db.session.query(func.count(Artist.id)).as_scalar(),
+                db.session.query(func.count(Musicshows.id)).as_scalar(),
+            ).one()
+            if tuple(counts) != (self.venues.size, self.artists.size, self.show_count):
+                self.build()
+
+    def suggest(self, source, candidates, key, k):
+        """top k candidates for the entity key of source, see the module docstring"""
+        row = source.rows.get(key)
+        if row is None:
+            return None
+        if not source.seeking[row]:
+            return []
+        n = candidates.size
+        genres = source.genres[row]
+        score = GENRE_WEIGHT * (candidates.genres[:n] @ genres) / max(genres.sum(), 1)
+        score += CITY_WEIGHT * (candidates.city[:n] == source.city[row])
+        score += STATE_WEIGHT * (candidates.state[:n] == source.state[row])
+        history = (candidates.bookings[:n] @ genres) / np.maximum(candidates.shows[:n], 1)
+        score += HISTORY_WEIGHT * np.minimum(history, 1)
+        score[~candidates.seeking[:n]] = -np.inf
+
+        k = min(k, int(candidates.seeking[:n].sum()))
+        if k <= 0:
+            return []
+        best = np.argpartition(-score, k - 1)[:k]
+        best = best[np.argsort(-score[best], kind="stable")]
+        return [
+            {
+                "id": candidates.ids[i],
+                "name": candidates.names[i],
+                "city": candidates.places[i][0],
+                "state": candidates.places[i][1],
+                "score": round(float(score[i]), 4),
+            }
+            for i in best
+        ]
+
+    def venues_for(self, artist_id, k=10):
+        """Returns the k venues seeking talent that best suit the artist.
+        Arguments:
+            artist_id {int} -- artist id
+        Keyword Arguments:
+            k {int} -- number of suggestions
+        Returns:
+            list -- id, name, city, state and score of the venues, best first;
+                    empty if the artist is not seeking a venue, None if unknown
+        """
+        self.refresh()
+        with self.lock:
+            return self.suggest(self.artists, self.venues, artist_id, k)
+
+    def artists_for(self, venue_id, k=10):
+        """the k artists seeking a venue that best suit the venue, like venues_for()"""
+        self.refresh()
+        with self.lock:
+            return self.suggest(self.venues, self.artists, venue_id, k)
+
+    def stats(self):
+        return {
+            "venues": self.venues.size,
+            "artists": self.artists.size,
+            "last_show": self.last_show,
+            "shows": self.show_count,
+            "builds": self.builds,
+            "refreshes": self.refreshes,
+        }
+
+
+# None without numpy
+recommender = Recommender() if np is not None else None
+
+
+def init_recommendations(app):
+    if recommender is not None:
+        recommender.refresh_interval = app.config.get("RECOMMEND_REFRESH", 5)
+    return recommender
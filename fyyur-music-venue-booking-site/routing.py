@@ -0,0 +1,128 @@
+"""
+Routing of read-only views to read replicas.
+
+Replicas are SQLALCHEMY_BINDS entries listed in REPLICA_BINDS (config.py).
+Views decorated with read_only() run their queries on one replica, picked
+per request with REPLICA_STRATEGY: "round_robin", or "least_loaded", the
+replica with the fewest read-only requests in flight in this worker.
+Everything else, and every flush, uses the primary.
+
+Replicas lag behind the primary, so for READ_YOUR_WRITES seconds after a
+client's write (a POST, PUT, PATCH or DELETE to a view that is not
+read_only) its requests read from the primary and skip the page cache: a
+venue shows up in /venues right after it was created. The time of the
+write is kept in the session cookie, so all workers must share SECRET_KEY.
+"""
+import threading
+import time
+from functools import wraps
+from itertools import count
+
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import orm
+
+WROTE_AT = "_wrote_at"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+class RoutingSession(SignallingSession):
+    """session sending the queries of read-only views to their replica"""
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get("replica") if has_app_context() else None
+        if replica is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    def __init__(self, replicas=(), strategy="round_robin", stickiness=5):
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.stickiness = stickiness
+        self.in_flight = {replica: 0 for replica in self.replicas}
+        self.turn = count()
+        self.lock = threading.Lock()
+
+    def configure(self, replicas, strategy="round_robin", stickiness=5):
+        with self.lock:
+            self.replicas = list(replicas)
+            self.strategy = strategy
+            self.stickiness = stickiness
+            self.in_flight = {replica: 0 for replica in self.replicas}
+
+    def acquire(self):
+        """returns the replica for a read-only request, None for the primary"""
+        if not self.replicas or self.recently_wrote():
+            return None
+        with self.lock:
+            if self.strategy == "least_loaded":
+                replica = min(self.replicas, key=lambda r: self.in_flight[r])
+            else:
+                replica = self.replicas[next(self.turn) % len(self.replicas)]
+            self.in_flight[replica] += 1
+        return replica
+
+    def release(self, replica):
+        if replica is None:
+            return
+        with self.lock:
+            if replica in self.in_flight:
+                self.in_flight[replica] -= 1
+
+    def recently_wrote(self):
+        """whether the client wrote within the last stickiness seconds"""
+        wrote_at = session.get(WROTE_AT)
+        return wrote_at is not None and time.time() - wrote_at < self.stickiness
+
+    def stats(self):
+        with self.lock:
+            return {
+                "replicas": list(self.replicas),
+                "strategy": self.strategy,
+                "in_flight": dict(self.in_flight),
+            }
+
+
+router = ReplicaRouter()
+
+
+def read_only(view):
+    """runs the queries of the view on a replica"""
+
+    @wraps(view)
+    def wrapper(**kwargs):
+        replica = g.replica = router.acquire()
+        try:
+            return view(**kwargs)
+        finally:
+            g.replica = None
+            router.release(replica)
+
+    wrapper.read_only = True
+    return wrapper
+
+
+def remember_writes(response):
+    """after_request hook starting the read-your-writes window of the client"""
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method in WRITE_METHODS and not getattr(view, "read_only", False):
+        session[WROTE_AT] = time.time()
+    return response
+
+
+def init_routing(app):
+    """configures the router from REPLICA_BINDS and hooks the write tracking"""
+    router.configure(
+        app.config.get("REPLICA_BINDS", []),
+        app.config.get("REPLICA_STRATEGY", "round_robin"),
+        app.config.get("READ_YOUR_WRITES", 5),
+    )
+    app.after_request(remember_writes)
+    return router
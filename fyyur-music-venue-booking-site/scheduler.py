@@ -0,0 +1,113 @@
+"""
+Periodic jobs of this worker, run by one background thread.
+
+Jobs are registered with every() and run inside an app context, one at a
+time, first when the scheduler starts and then every interval seconds. A
+failing job is logged and retried at its next run. The thread starts with
+the first request a worker serves (SCHEDULER in config.py), so flask
+commands and migrations do not run the jobs.
+"""
+import logging
+import threading
+import time
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, name, interval, fn):
+        self.name = name
+        self.interval = interval
+        self.fn = fn
+        self.next_run = 0.0
+        self.runs = 0
+        self.failures = 0
+        self.last_ms = None
+        self.last_error = None
+
+
+class Scheduler:
+    def __init__(self):
+        self.app = None
+        self.jobs = []
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def every(self, interval, fn, name=None):
+        """runs fn every interval seconds"""
+        self.jobs.append(Job(name or fn.__name__, interval, fn))
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="scheduler", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.stopped.set()
+            thread.join()
+
+    def run_job(self, job):
+        start = time.perf_counter()
+        try:
+            job.fn()
+        except Exception as e:
+            db.session.rollback()
+            job.failures += 1
+            job.last_error = repr(e)
+            logger.exception("scheduled job %s failed", job.name)
+        finally:
+            db.session.remove()
+            job.runs += 1
+            job.last_ms = (time.perf_counter() - start) * 1000
+            job.next_run = time.monotonic() + job.interval
+
+    def run_pending(self):
+        """runs the jobs that are due, returns the seconds until the next one"""
+        for job in self.jobs:
+            if job.next_run <= time.monotonic():
+                self.run_job(job)
+        if not self.jobs:
+            return 60.0
+        return max(0.0, min(job.next_run for job in self.jobs) - time.monotonic())
+
+    def run(self):
+        with self.app.app_context():
+            while not self.stopped.is_set():
+                self.stopped.wait(self.run_pending())
+
+    def stats(self):
+        return {
+            "running": self.thread is not None,
+            "jobs": {
+                job.name: {
+                    "interval": job.interval,
+                    "runs": job.runs,
+                    "failures": job.failures,
+                    "last_ms": job.last_ms,
+                    "last_error": job.last_error,
+                }
+                for job in self.jobs
+            },
+        }
+
+
+scheduler = Scheduler()
+
+
+def init_scheduler(app):
+    """starts the scheduler with the first request if SCHEDULER is on"""
+    scheduler.app = app
+    if app.config.get("SCHEDULER"):
+        app.before_request(scheduler.start)
+    return scheduler
@@ -0,0 +1,196 @@
+"""
+Search over venues and artists by name, city, state and genre.
+
+On postgresql the search runs as ILIKE filters backed by pg_trgm GIN indexes
+(see migration c3d9e8f1a6b2) and is ranked with similarity().
+Other databases, i.e. sqlite in the test suite, use an in-process trigram
+index that is built on the first search and kept in sync on commit.
+Upcoming show counts of the results are read in bulk from the show counters.
+"""
+from collections import defaultdict
+
+from sqlalchemy import case, desc, event, func, or_
+from sqlalchemy.orm import Session
+
+from forms import genre_choices
+from models import db, Venue, Artist
+
+SEARCH_FIELDS = ("name", "city", "state")
+GENRES = {genre[1].lower(): genre[1] for genre in genre_choices}
+# ids per IN (...) list, stays below sqlite's limit of bound parameters
+COUNT_BATCH = 500
+
+
+def trigrams(text):
+    """returns the set of 3-character substrings of the lowercased, padded text"""
+    padded = "  " + text.lower() + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """share of common trigrams, same measure as pg_trgm's similarity()"""
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class NgramIndex:
+    """
+    Inverted index from trigram to the ids of the documents containing it.
+    A document is the list of searchable fields of one row.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.documents = {}
+
+    def add(self, key, name, fields):
+        self.remove(key)
+        fields = [field.lower() for field in fields if field]
+        self.documents[key] = (name, fields)
+        for field in fields:
+            for gram in trigrams(field):
+                self.postings[gram].add(key)
+
+    def remove(self, key):
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        for field in document[1]:
+            for gram in trigrams(field):
+                self.postings[gram].discard(key)
+
+    def search(self, term):
+        """returns (id, name) of documents having a field that contains term,
+        best match first"""
+        term = term.lower()
+        # the padding trigrams only match at the start of a field
+        grams = {gram for gram in trigrams(term) if not gram.startswith(" ")}
+        grams.discard(term[-2:] + " ")
+        if grams:
+            # intersect starting from the rarest trigram
+            postings = sorted((self.postings.get(g, set()) for g in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = self.documents.keys()
+
+        ranked = []
+        for key in candidates:
+            name, fields = self.documents[key]
+            if any(term in field for field in fields):
+                in_name = term in name.lower()
+                ranked.append((not in_name, -similarity(name, term), name, key))
+        ranked.sort()
+        return [(key, name) for _, _, name, key in ranked]
+
+
+_indexes = {}
+
+
+def search_fields(entity):
+    return [getattr(entity, field) for field in SEARCH_FIELDS] + list(
+        entity.genres or []
+    )
+
+
+def get_index(model):
+    """returns the trigram index of model, building it with one query if needed"""
+    index = _indexes.get(model)
+    if index is None:
+        index = NgramIndex()
+        columns = [getattr(model, field) for field in SEARCH_FIELDS]
+        for row in db.session.query(model.id, model.genres, *columns):
+            index.add(row.id, row.name, search_fields(row))
+        _indexes[model] = index
+    return index
+
+
+def reset_indexes():
+    """forgets the in-process indexes, they are rebuilt on the next search"""
+    _indexes.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_changes(session, flush_context):
+    pending = session.info.setdefault("search_pending", [])
+    for entity in list(session.new) + list(session.dirty):
+        if isinstance(entity, (Venue, Artist)) and entity.deleted_at is None:
+            pending.append((type(entity), entity.id, entity.name, search_fields(entity)))
+    # soft-deleted entries leave the index as deleted ones do
+    for entity in list(session.dirty) + list(session.deleted):
+        if isinstance(entity, (Venue, Artist)) and (entity in session.deleted or entity.deleted_at):
+            pending.append((type(entity), entity.id, None, None))
+
+
+@event.listens_for(Session, "after_commit")
+def apply_changes(session):
+    for model, key, name, fields in session.info.pop("search_pending", []):
+        index = _indexes.get(model)
+        if index is None:
+            continue
+        if fields is None:
+            index.remove(key)
+        else:
+            index.add(key, name, fields)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    session.info.pop("search_pending", None)
+
+
+def postgres_search(model, term):
+    """returns (id, name) of matching rows using the pg_trgm indexes"""
+    pattern = "%" + term + "%"
+    conditions = [getattr(model, field).ilike(pattern) for field in SEARCH_FIELDS]
+    genre = GENRES.get(term.lower())
+    if genre:
+        conditions.append(model.genres.contains([genre]))
+    rows = (
+        db.session.query(model.id, model.name)
+        .filter(or_(*conditions))
+        .order_by(
+            case([(model.name.ilike(pattern), 0)], else_=1),
+            desc(func.similarity(model.name, term)),
+            model.name,
+        )
+        .all()
+    )
+    return [(row.id, row.name) for row in rows]
+
+
+def upcoming_show_counts(model, ids):
+    """returns {id: number of upcoming shows} for the given venue or artist ids,
+    read from their show counters, one query per COUNT_BATCH ids"""
+    counts = {}
+    for start in range(0, len(ids), COUNT_BATCH):
+        counts.update(
+            db.session.query(model.id, model.upcoming_shows_count).filter(
+                model.id.in_(ids[start : start + COUNT_BATCH])
+            )
+        )
+    return counts
+
+
+def search(model, term):
+    """Returns venues or artists matching the search term, best match first.
+    Arguments:
+        model -- Venue or Artist
+        term {str} -- search term, matched against name, city, state and genres
+    Returns:
+        dictionary -- count and data, the format of the search templates
+    """
+    term = term.strip()
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        results = postgres_search(model, term)
+    else:
+        results = get_index(model).search(term)
+
+    counts = upcoming_show_counts(model, [key for key, _ in results])
+    return {
+        "count": len(results),
+        "data": [
+            {"id": key, "name": name, "num_upcoming_shows": counts.get(key, 0)}
+            for key, name in results
+        ],
+    }
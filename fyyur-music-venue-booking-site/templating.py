@@ -0,0 +1,39 @@
+"""
+Template compilation settings.
+
+Jinja compiles a template to python code the first time it is rendered.
+The bytecode cache stores the compiled code on disk so a restarted worker
+only has to load it, and warm_templates() does the loading at boot so no
+request pays for it.
+"""
+import os
+
+from jinja2 import FileSystemBytecodeCache
+
+TEMPLATE_FOLDERS = ("pages/", "forms/", "layouts/", "errors/")
+
+
+def init_templates(app):
+    """enables the bytecode cache and, if configured, warms up the templates.
+    Call after all filters are registered, compiling checks that they exist."""
+    directory = app.config.get("TEMPLATE_CACHE_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    if app.config.get("TEMPLATE_WARMUP"):
+        warm_templates(app)
+
+
+def warm_templates(app):
+    """loads every html template into the environment's template cache
+    Returns:
+        list -- names of the loaded templates
+    """
+    names = [
+        name
+        for name in app.jinja_env.list_templates(extensions=["html"])
+        if name.startswith(TEMPLATE_FOLDERS)
+    ]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
@@ -0,0 +1,1764 @@
+import os
+import unittest
+import json
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# run the suite against an in-memory database instead of the postgres in config.py
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# background jobs are run by the tests themselves
+os.environ.setdefault("SCHEDULER", "0")
+
+from sqlalchemy import event, create_engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.exc import IntegrityError, TimeoutError as PoolTimeout
+
+from app import app
+from models import db, Venue, Artist, Musicshows, ShowCounters, bumped
+from queries import venue_directory, show_listing, venue_shows, artist_shows
+from search import search, reset_indexes
+from filters import format_datetime
+import counters
+import importer
+import exporter
+from booking import find_conflict, Bookings
+import dedup
+import facets
+import geo
+from recommend import Recommender, recommender, np
+from writebehind import GroupCommitQueue
+from scheduler import Scheduler, scheduler as app_scheduler
+from dashboard import dashboard
+from timeline import calendar
+from readmodel import read_model
+from purge import Purger
+import models
+from poolmetrics import PoolMetrics
+from routing import router, WROTE_AT
+from profiler import profiler, Profile, fingerprint
+from cache import page_cache, PageCache, MemoryBackend, RedisBackend, LocalRedis
+
+# sqlite cannot autoincrement a column of a composite primary key,
+# make_show assigns the show ids itself
+Musicshows.__table__.c.id.autoincrement = "auto"
+
+
+def make_venue(name, city="San Francisco", state="CA"):
+    venue = Venue(
+        name=name,
+        genres=["Jazz"],
+        address="1015 Folsom Street",
+        city=city,
+        state=state,
+        phone="1234567890",
+        website_link="https://example.com",
+        facebook_link="https://www.facebook.com/example",
+        image_link="https://example.com/venue.jpg",
+    )
+    db.session.add(venue)
+    return venue
+
+
+def make_artist(name, city="San Francisco", state="CA"):
+    artist = Artist(
+        name=name,
+        genres=["Jazz"],
+        city=city,
+        state=state,
+        phone="1234567890",
+        image_link="https://example.com/artist.jpg",
+        website_link="https://example.com",
+        facebook_link="https://www.facebook.com/example",
+    )
+    db.session.add(artist)
+    return artist
+
+
+def make_show(venue, artist, start_time):
+    db.session.flush()
+    show = Musicshows(venue_id=venue.id, artist_id=artist.id, start_time=start_time)
+    show.id = (db.session.query(db.func.max(Musicshows.id)).scalar() or 0) + 1
+    db.session.add(show)
+    show.update_counters()
+    db.session.flush()
+    return show
+
+
+@contextmanager
+def count_queries():
+    """collects every statement sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_engine()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def query_plans(fn):
+    """runs fn and returns the query plan of every statement it sent,
+    on postgresql sequential scans are disabled so that the plan shows
+    whether an index can serve the statement at all"""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        executed.append((statement, parameters))
+
+    engine = db.get_engine()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    connection = db.session.connection()
+    if engine.dialect.name == "postgresql":
+        connection.execute("SET enable_seqscan = off")
+        explain = "EXPLAIN "
+    else:
+        explain = "EXPLAIN QUERY PLAN "
+    return [
+        "\n".join(str(row[-1]) for row in connection.execute(explain + statement, parameters))
+        for statement, parameters in executed
+    ]
+
+
+def scans_table(plan, table):
+    """true if the plan reads all rows of table instead of seeking an index"""
+    for line in plan.splitlines():
+        if "Seq Scan on " + table in line:
+            return True
+        if line.startswith("SCAN") and table in line.split():
+            return True
+    return False
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config["TESTING"] = True
+        app.config["WTF_CSRF_ENABLED"] = False
+        self.client = app.test_client
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        page_cache.backend.clear()
+        page_cache.reset_stats()
+
+        self.now = datetime.now()
+        self.past = self.now - timedelta(days=30)
+        self.future = self.now + timedelta(days=30)
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        reset_indexes()
+        geo.reset_index()
+        read_model.reset()
+        read_model.enabled = False
+        self.ctx.pop()
+
+    def assertQueryBudget(self, budget, path, method="get", **kwargs):
+        """requests path with the SQL profiler on and fails if it sent more
+        than budget statements, showing the slowest and repeated ones"""
+        app.config["SQL_PROFILE"] = True
+        profiler.last = None
+        try:
+            response = getattr(self.client(), method)(path, **kwargs)
+        finally:
+            app.config["SQL_PROFILE"] = False
+        profile = profiler.last
+        self.assertIsNotNone(profile, "%s was not profiled" % path)
+        self.assertLessEqual(
+            profile["queries"],
+            budget,
+            "%s %s sent %d statements, budget %d:\n%s"
+            % (method.upper(), path, profile["queries"], budget, json.dumps(profile, indent=2)),
+        )
+        return response
+
+    # tests for the venue directory
+
+    def test_venue_directory_groups_by_area(self):
+        hop = make_venue("The Musical Hop")
+        dueling = make_venue("The Dueling Pianos Bar", "New York", "NY")
+        artist = make_artist("Guns N Petals")
+        make_show(hop, artist, self.future)
+        make_show(hop, artist, self.future)
+        make_show(hop, artist, self.past)
+        db.session.commit()
+
+        data = venue_directory()
+
+        self.assertEqual(
+            [(area["city"], area["state"]) for area in data],
+            [("New York", "NY"), ("San Francisco", "CA")],
+        )
+        self.assertEqual(data[0]["venues"][0]["id"], dueling.id)
+        self.assertEqual(data[0]["venues"][0]["num_upcoming_shows"], 0)
+        self.assertEqual(data[1]["venues"][0]["num_upcoming_shows"], 2)
+
+    def test_venue_directory_query_count_is_constant(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        with count_queries() as few:
+            venue_directory()
+
+        artist = make_artist("Guns N Petals")
+        for i in range(20):
+            venue = make_venue("Venue %d" % i, "City %d" % (i % 5))
+            make_show(venue, artist, self.future)
+        db.session.commit()
+        with count_queries() as many:
+            venue_directory()
+
+        self.assertEqual(len(few), 1)
+        self.assertEqual(len(many), len(few))
+
+    def test_get_venues(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        res = self.client().get("/venues")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Musical Hop", res.data)
+
+    # tests for the show counters
+
+    def test_insert_show_updates_counters(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        db.session.commit()
+
+        show = Musicshows(venue.id, artist.id, self.future)
+        show.id = 1
+        show.insert()
+        make_show(venue, artist, self.past)
+        db.session.commit()
+
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (1, 1))
+
+    def test_roll_over_moves_started_shows(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.now + timedelta(hours=1))
+        make_show(venue, artist, self.future)
+        db.session.commit()
+
+        self.assertEqual(counters.roll_over(self.now + timedelta(hours=2)), 1)
+        self.assertEqual(counters.roll_over(self.now + timedelta(hours=2)), 0)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (1, 1))
+
+        # shows inserted after the roll-over are counted against its watermark
+        make_show(venue, artist, self.now + timedelta(hours=3))
+        db.session.commit()
+        self.assertEqual(venue.upcoming_shows_count, 2)
+
+    def test_roll_over_is_scheduled(self):
+        jobs = {job.name: job for job in app_scheduler.jobs}
+        ShowCounters.current().rolled_over_at = self.now - timedelta(hours=1)
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, datetime.now() - timedelta(minutes=1))
+        db.session.commit()
+        self.assertEqual(venue.upcoming_shows_count, 1)
+
+        self.assertEqual(jobs["rollover"].interval, app.config["ROLLOVER_INTERVAL"])
+        jobs["rollover"].fn()
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (0, 1))
+
+    def test_rebuild_matches_incremental_counters(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        for days in (-3, -2, 1, 2, 3):
+            make_show(venue, artist, self.now + timedelta(days=days))
+        db.session.commit()
+        counters.roll_over(self.now + timedelta(days=1, hours=1))
+        counts = (venue.upcoming_shows_count, venue.past_shows_count)
+
+        counters.rebuild(ShowCounters.current().rolled_over_at)
+
+        self.assertEqual(counts, (2, 3))
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), counts)
+
+    # tests for the venue and artist show pages
+
+    def test_venue_shows_splits_past_and_upcoming(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        make_show(venue, artist, self.past)
+        make_show(venue, artist, self.past - timedelta(days=1))
+        db.session.commit()
+        venue_id = venue.id
+
+        with count_queries() as statements:
+            past, upcoming = venue_shows(venue_id)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(len(past), 2)
+        self.assertEqual(len(upcoming), 1)
+        self.assertEqual(upcoming[0]["artist_name"], "Guns N Petals")
+        self.assertEqual(upcoming[0]["start_time"], self.future)
+        self.assertEqual(artist_shows(artist.id)[1][0]["venue_name"], "The Musical Hop")
+
+    def test_show_page_queries_use_indexes(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        venue_id, artist_id = venue.id, artist.id
+
+        for fn in (lambda: venue_shows(venue_id), lambda: artist_shows(artist_id)):
+            plans = query_plans(fn)
+            self.assertEqual(len(plans), 1)
+            self.assertFalse(scans_table(plans[0], "musicshows"), plans[0])
+            # shows come out of the index already ordered by start_time
+            self.assertNotIn("TEMP B-TREE", plans[0])
+
+    def test_get_venue_and_artist(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+
+        res = self.client().get("/venues/%d" % venue.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"Guns N Petals", res.data)
+
+        res = self.client().get("/artists/%d" % artist.id)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Musical Hop", res.data)
+
+    # tests for the datetime filter
+
+    def test_format_datetime_matches_babel(self):
+        import babel.dates
+
+        value = datetime(2035, 4, 1, 20, 0)
+        for format, pattern in (
+            ("full", "EEEE MMMM, d, y 'at' h:mma"),
+            ("medium", "EE MM, dd, y h:mma"),
+        ):
+            expected = babel.dates.format_datetime(value, pattern)
+            self.assertEqual(format_datetime(value, format), expected)
+            self.assertEqual(format_datetime(str(value), format), expected)
+        self.assertEqual(
+            format_datetime(value, "short"), babel.dates.format_datetime(value, "short")
+        )
+
+    # tests for the show listing
+
+    def test_show_listing_pages_with_one_query(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        for days in range(5):
+            make_show(venue, artist, self.future + timedelta(days=days))
+        db.session.commit()
+
+        with count_queries() as statements:
+            first, cursor = show_listing(limit=3)
+        second, last_cursor = show_listing(after=cursor, limit=3)
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(first[0]["venue_name"], "The Musical Hop")
+        self.assertEqual(first[0]["artist_name"], "Guns N Petals")
+        self.assertLess(first[-1]["start_time"], second[0]["start_time"])
+
+    def test_get_shows(self):
+        make_show(make_venue("The Musical Hop"), make_artist("Guns N Petals"), self.future)
+        db.session.commit()
+        res = self.client().get("/shows")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"Guns N Petals", res.data)
+
+    def test_get_shows_400(self):
+        res = self.client().get("/shows?after=not-a-cursor")
+
+        self.assertEqual(res.status_code, 400)
+
+    # tests for venue and artist search
+
+    def test_search_matches_name_city_state_and_genre(self):
+        hop = make_venue("The Musical Hop")
+        dueling = make_venue("The Dueling Pianos Bar", "New York", "NY")
+        dueling.genres = ["Classical", "R&B"]
+        db.session.commit()
+
+        self.assertEqual([v["id"] for v in search(Venue, "hop")["data"]], [hop.id])
+        self.assertEqual([v["id"] for v in search(Venue, "new york")["data"]], [dueling.id])
+        self.assertEqual([v["id"] for v in search(Venue, "classical")["data"]], [dueling.id])
+        self.assertEqual(search(Venue, "NY")["count"], 1)
+        self.assertEqual(search(Venue, "the")["count"], 2)
+        self.assertEqual(search(Venue, "xyz")["count"], 0)
+
+    def test_search_ranks_name_matches_first(self):
+        make_venue("Park Square Live Music & Coffee", "San Francisco")
+        in_city = make_venue("The Musical Hop", "Parksville")
+        db.session.commit()
+
+        results = search(Venue, "park")["data"]
+
+        self.assertEqual(results[0]["name"], "Park Square Live Music & Coffee")
+        self.assertEqual(results[1]["id"], in_city.id)
+
+    def test_search_sees_committed_writes(self):
+        search(Artist, "petals")
+        artist = make_artist("Guns N Petals")
+        make_show(make_venue("The Musical Hop"), artist, self.future)
+        db.session.commit()
+
+        results = search(Artist, "petals")
+
+        self.assertEqual(results["count"], 1)
+        self.assertEqual(results["data"][0]["num_upcoming_shows"], 1)
+
+        artist.name = "The Wild Sax Band"
+        Artist.update(artist)
+        self.assertEqual(search(Artist, "petals")["count"], 0)
+        self.assertEqual(search(Artist, "sax")["count"], 1)
+
+    def test_search_counts_upcoming_shows_in_bulk(self):
+        artist = make_artist("Guns N Petals")
+        for i in range(10):
+            make_show(make_venue("Venue %d" % i), artist, self.future)
+        db.session.commit()
+        search(Venue, "venue")
+
+        with count_queries() as statements:
+            results = search(Venue, "venue")
+
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(all(v["num_upcoming_shows"] == 1 for v in results["data"]))
+
+    def test_search_venues_route(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        res = self.client().post("/venues/search", data={"search_term": "hop"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Musical Hop", res.data)
+
+    # tests for the page cache
+
+    def test_pages_are_served_from_cache(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        self.client().get("/venues")
+
+        with count_queries() as statements:
+            res = self.client().get("/venues")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Musical Hop", res.data)
+        self.assertEqual(len(statements), 0)
+        self.assertEqual(page_cache.hits, 1)
+
+    def test_writes_invalidate_cached_pages(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        venue_id, artist_id = venue.id, artist.id
+        self.client().get("/venues")
+        self.client().get("/artists/%d" % artist_id)
+
+        venue.name = "The Dueling Pianos Bar"
+        Venue.update(venue)
+
+        self.assertIn(b"The Dueling Pianos Bar", self.client().get("/venues").data)
+        # the artist page lists the venue of its show
+        res = self.client().get("/artists/%d" % artist_id)
+        self.assertIn(b"The Dueling Pianos Bar", res.data)
+        self.assertEqual(page_cache.hits, 0)
+
+        show = Musicshows(venue_id, artist_id, self.future + timedelta(days=1))
+        show.id = 2
+        show.insert()
+        res = self.client().get("/venues/%d" % venue_id)
+        self.assertIn(b"2 Upcoming Shows", res.data)
+
+    def test_shared_backend(self):
+        cache = PageCache(RedisBackend(LocalRedis()))
+        cache.set("/venues", "page", cache.snapshot(["venues"]))
+
+        self.assertEqual(cache.get("/venues"), "page")
+        cache.invalidate("venues")
+        self.assertIsNone(cache.get("/venues"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_shared_backend_clears_only_its_keys(self):
+        client = LocalRedis()
+        client.set("session:1", "other data")
+        cache = PageCache(RedisBackend(client))
+        for key in ("/venues", "/artists"):
+            cache.set(key, "page", cache.snapshot(["venues"]))
+        cache.invalidate("venues")
+        self.assertEqual(cache.stats()["entries"], 2)
+
+        cache.backend.clear()
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual(list(client.data), ["session:1"])
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        cache = PageCache(MemoryBackend(maxsize=2))
+        for key in ("a", "b"):
+            cache.set(key, key, {})
+        cache.get("a")
+        cache.set("c", "c", {})
+
+        self.assertEqual(cache.get("a"), "a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_cache_metrics(self):
+        self.client().get("/artists")
+        self.client().get("/artists")
+        res = self.client().get("/metrics/cache")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["hits"], 1)
+        self.assertEqual(data["misses"], 1)
+
+
+    # tests for the bulk import
+
+    def venue_row(self, name, **values):
+        row = {
+            "name": name,
+            "city": "San Francisco",
+            "state": "CA",
+            "address": "1015 Folsom Street",
+            "phone": "1234567890",
+            "image_link": "https://example.com/venue.jpg",
+            "genres": "Jazz,Blues",
+            "facebook_link": "https://www.facebook.com/example",
+            "website_link": "https://example.com",
+            "seeking_talent": "false",
+            "seeking_description": "Looking for local bands",
+        }
+        row.update(values)
+        return row
+
+    def test_import_reports_invalid_rows_and_keeps_the_batch(self):
+        rows = [
+            (2, self.venue_row("The Musical Hop")),
+            (3, self.venue_row("Bad Phone", phone="555-1234")),
+            (4, self.venue_row("Bad State", state="XX", genres="Jazz,Polka")),
+            (5, self.venue_row("Park Square Live")),
+        ]
+        report = importer.Importer("venues").run(rows)
+
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertIn("Invalid Phone number", report.errors[0][1])
+        self.assertIn("Invalid genre", report.errors[1][1])
+        self.assertIn("Invalid state", report.errors[1][1])
+        venues = Venue.query.order_by(Venue.name).all()
+        self.assertEqual([v.name for v in venues], ["Park Square Live", "The Musical Hop"])
+        self.assertEqual(venues[0].genres, ["Jazz", "Blues"])
+        self.assertFalse(venues[0].seeking_talent)
+
+    def test_import_writes_one_insert_per_batch(self):
+        rows = [(i, self.venue_row("Venue %d" % i)) for i in range(25)]
+        with count_queries() as statements:
+            report = importer.Importer("venues", batch_size=10).run(rows)
+        inserts = [s for s in statements if s.startswith("INSERT")]
+
+        self.assertEqual(report.imported, 25)
+        self.assertEqual(len(inserts), 3)
+
+    def test_import_invalidates_the_cached_pages(self):
+        client = self.client()
+        # cached empty before the venue exists
+        self.assertNotIn(b"The Musical Hop", client.get("/venues/1").data)
+        importer.Importer("venues").run([(2, self.venue_row("The Musical Hop"))])
+        self.assertIn(b"The Musical Hop", client.get("/venues/1").data)
+
+        artist = make_artist("Guns N Petals")
+        db.session.commit()
+        artist_id = artist.id
+        self.assertNotIn(b"Guns N Petals", client.get("/venues/1").data)
+        client.get("/artists/%d" % artist_id)
+        fmt = "%Y-%m-%d %H:%M:%S"
+        row = {"venue_id": 1, "artist_id": artist_id, "start_time": self.future.strftime(fmt)}
+        importer.Importer("shows").run([(2, row)])
+        self.assertIn(b"Guns N Petals", client.get("/venues/1").data)
+        self.assertIn(b"The Musical Hop", client.get("/artists/%d" % artist_id).data)
+
+    def test_import_shows_updates_counters(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        db.session.commit()
+        fmt = "%Y-%m-%d %H:%M:%S"
+        rows = [
+            (2, {"venue_id": venue.id, "artist_id": artist.id, "start_time": self.future.strftime(fmt)}),
+            (3, {"venue_id": venue.id, "artist_id": artist.id, "start_time": self.past.strftime(fmt)}),
+            (4, {"venue_id": 999, "artist_id": artist.id, "start_time": self.future.strftime(fmt)}),
+            (5, {"venue_id": venue.id, "artist_id": artist.id, "start_time": "tomorrow"}),
+            (6, {"venue_id": venue.id, "artist_id": artist.id, "start_time": (self.future + timedelta(hours=1)).strftime(fmt)}),
+        ]
+        report = importer.Importer("shows").run(rows)
+
+        self.assertEqual(report.imported, 2)
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+        self.assertIn("already booked", report.errors[2][1])
+        self.assertEqual(venue.upcoming_shows_count, 1)
+        self.assertEqual(venue.past_shows_count, 1)
+        self.assertEqual(artist.upcoming_shows_count, 1)
+        ids = [key for key, in db.session.query(Musicshows.id)]
+        self.assertEqual(len(set(ids)), 2)
+
+
+    # tests for the export
+
+    def test_export_venues_csv_can_be_imported(self):
+        make_venue("The Musical Hop")
+        make_venue("Park Square Live", city="New York", state="NY")
+        db.session.commit()
+        res = self.client().get("/export/venues.csv?state=NY")
+        lines = res.data.decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "text/csv")
+        self.assertEqual(lines[0], "id," + ",".join(importer.VENUE_FIELDS))
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith("2,Park Square Live,New York,NY,"))
+
+    def test_export_shows_ndjson_by_date_range(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.past)
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        res = self.client().get(
+            "/export/shows.ndjson?start=" + self.now.date().isoformat()
+        )
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["venue_name"], "The Musical Hop")
+        self.assertEqual(
+            rows[0]["start_time"], self.future.strftime(exporter.TIME_FORMAT)
+        )
+
+    def test_export_streams_in_chunks(self):
+        for i in range(5):
+            make_artist("Artist %d" % i)
+        db.session.commit()
+        chunks = list(exporter.stream_rows(exporter.export_query("artists"), chunk=2))
+
+        self.assertEqual([len(rows) for rows in chunks], [2, 2, 1])
+
+    def test_export_400(self):
+        res = self.client().get("/export/shows.csv?start=yesterday")
+
+        self.assertEqual(res.status_code, 400)
+
+
+    # tests for the json api
+
+    def test_api_pages_with_one_query_each(self):
+        for i in range(5):
+            make_artist("Artist %d" % i)
+        db.session.commit()
+
+        names, url, queries = [], "/api/v1/artists?limit=2&fields=name", []
+        while url:
+            with count_queries() as statements:
+                data = json.loads(self.client().get(url).data)
+            queries.append(len(statements))
+            names += [artist["name"] for artist in data["data"]]
+            url = data["next"]
+
+        self.assertEqual(names, ["Artist %d" % i for i in range(5)])
+        self.assertEqual(queries, [1, 1, 1])
+        self.assertEqual(data["data"], [{"name": "Artist 4"}])
+
+    def test_api_selects_only_requested_fields(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        with count_queries() as statements:
+            res = self.client().get("/api/v1/venues/1?fields=name,city")
+
+        self.assertEqual(json.loads(res.data), {"name": "The Musical Hop", "city": "San Francisco"})
+        self.assertNotIn("phone", statements[0])
+
+    def test_api_shows_sparse_fieldsets(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        res = self.client().get(
+            "/api/v1/shows?fields=venue_id,start_time&fields[venue]=id,name"
+        )
+        show = json.loads(res.data)["data"][0]
+
+        self.assertEqual(show["venue_id"], venue.id)
+        self.assertEqual(show["venue"], {"id": venue.id, "name": "The Musical Hop"})
+        self.assertEqual(show["start_time"], self.future.isoformat())
+        self.assertNotIn("artist", show)
+
+    def test_api_etag(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        res = self.client().get("/api/v1/venues")
+        again = self.client().get(
+            "/api/v1/venues", headers={"If-None-Match": res.headers["ETag"]}
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(again.status_code, 304)
+
+    def test_api_400(self):
+        res = self.client().get("/api/v1/venues?fields=name,password")
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data)["error"], 400)
+
+
+    # tests for conditional GET
+
+    def test_venue_page_not_modified_with_one_query(self):
+        venue = make_venue("The Musical Hop")
+        db.session.commit()
+        res = self.client().get("/venues/%d" % venue.id)
+        etag = res.headers["ETag"]
+        with count_queries() as statements:
+            again = self.client().get(
+                "/venues/%d" % venue.id, headers={"If-None-Match": etag}
+            )
+
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b"")
+        self.assertEqual(len(statements), 1)
+        self.assertIn("version", statements[0])
+        self.assertNotIn("musicshows", statements[0])
+
+    def test_if_modified_since(self):
+        artist = make_artist("Guns N Petals")
+        db.session.commit()
+        res = self.client().get("/artists/%d" % artist.id)
+        again = self.client().get(
+            "/artists/%d" % artist.id,
+            headers={"If-Modified-Since": res.headers["Last-Modified"]},
+        )
+
+        self.assertEqual(again.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        venue_etag = self.client().get("/venues/%d" % venue.id).headers["ETag"]
+
+        # renaming the artist changes the venue page listing its show
+        artist.name = "The Wild Sax Band"
+        artist.update()
+        res = self.client().get(
+            "/venues/%d" % venue.id, headers={"If-None-Match": venue_etag}
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Wild Sax Band", res.data)
+
+        artist_etag = self.client().get("/artists/%d" % artist.id).headers["ETag"]
+        make_show(venue, artist, self.future + timedelta(days=1))
+        db.session.commit()
+        res = self.client().get(
+            "/artists/%d" % artist.id, headers={"If-None-Match": artist_etag}
+        )
+        self.assertEqual(res.status_code, 200)
+
+    def test_etag_matches_the_cached_page(self):
+        venue = make_venue("The Musical Hop")
+        db.session.commit()
+        venue_id = venue.id
+        etag = self.client().get("/venues/%d" % venue_id).headers["ETag"]
+
+        # a write whose invalidation has not reached this worker's cache
+        table = Venue.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.id == venue_id)
+            .values(name="The Dueling Pianos Bar", **bumped(table.c))
+        )
+        db.session.commit()
+        res = self.client().get("/venues/%d" % venue_id)
+
+        self.assertNotEqual(res.headers["ETag"], etag)
+        self.assertIn(b"The Dueling Pianos Bar", res.data)
+
+
+    # tests for booking conflicts
+
+    def test_create_show_rejects_overlapping_booking(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        other = make_artist("The Wild Sax Band")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        venue_id, other_id = venue.id, other.id
+
+        def submit(start_time):
+            return self.client().post(
+                "/shows/create",
+                data={
+                    "venue_id": venue_id,
+                    "artist_id": other_id,
+                    "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                },
+            )
+
+        res = submit(self.future + timedelta(hours=2))
+        self.assertIn(b"The venue is already booked", res.data)
+        self.assertEqual(Musicshows.query.count(), 1)
+
+    def test_create_show_rejects_non_numeric_ids(self):
+        artist = make_artist("Guns N Petals")
+        db.session.commit()
+        res = self.client().post(
+            "/shows/create",
+            data={
+                "venue_id": "hop",
+                "artist_id": artist.id,
+                "start_time": self.future.strftime("%Y-%m-%d %H:%M:%S"),
+            },
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"Invalid venue_id. Show could not be listed.", res.data)
+        self.assertEqual(Musicshows.query.count(), 0)
+
+    def test_find_conflict_uses_indexes(self):
+        venue = make_venue("The Musical Hop")
+        artist = make_artist("Guns N Petals")
+        make_show(venue, artist, self.future)
+        db.session.commit()
+        venue_id, artist_id = venue.id, artist.id
+
+        self.assertIsNotNone(find_conflict(venue_id, 999, self.future + timedelta(hours=1)))
+        self.assertIsNotNone(find_conflict(999, artist_id, self.future - timedelta(hours=1)))
+        # bookings are half-open, a show may start when the previous one ends
+        self.assertIsNone(find_conflict(venue_id, artist_id, self.future + timedelta(hours=3)))
+        plans = query_plans(lambda: find_conflict(venue_id, artist_id, self.future))
+        self.assertFalse(scans_table(plans[0], "musicshows"), plans[0])
+
+    def test_bookings_validate_a_batch(self):
+        bookings = Bookings()
+        start = self.future
+
+        self.assertIsNone(bookings.book(1, 1, start))
+        self.assertIsNone(bookings.book(2, 2, start))
+        self.assertIsNone(bookings.book(1, 2, start + timedelta(hours=3)))
+        self.assertIn("venue", bookings.book(1, 3, start + timedelta(hours=5)))
+        self.assertIn("artist", bookings.book(3, 2, start - timedelta(minutes=30)))
+        self.assertIsNone(bookings.book(3, 3, start - timedelta(minutes=30)))
+
+
+    # tests for the group commit queue
+
+    def test_group_commit_acknowledges_each_insert(self):
+        venues = [make_venue("Venue %d" % i) for i in range(5)]
+        invalid = make_venue(None)
+        db.session.expunge_all()
+        write_queue = GroupCommitQueue(app, max_rows=10, max_delay=0.5)
+        try:
+            futures = [write_queue.submit(venue) for venue in venues + [invalid]]
+            committed = [future.result(timeout=5) for future in futures[:-1]]
+            with self.assertRaises(IntegrityError):
+                futures[-1].result(timeout=5)
+        finally:
+            write_queue.stop()
+
+        self.assertEqual([venue.name for venue in committed], ["Venue %d" % i for i in range(5)])
+        self.assertTrue(all(venue.id for venue in committed))
+        self.assertEqual(write_queue.stats()["groups"], 1)
+        self.assertEqual(write_queue.stats()["failures"], 1)
+        self.assertEqual(Venue.query.count(), 5)
+
+    def test_insert_waits_for_the_group_commit(self):
+        self.client().get("/venues")
+        models.write_queue = GroupCommitQueue(app, max_delay=0.001)
+        try:
+            venue = make_venue("The Musical Hop")
+            db.session.expunge(venue)
+            venue.insert()
+        finally:
+            models.write_queue.stop()
+            models.write_queue = None
+
+        self.assertIsNotNone(venue.id)
+        self.assertEqual(Venue.query.get(venue.id).name, "The Musical Hop")
+        self.assertIn(b"The Musical Hop", self.client().get("/venues").data)
+
+
+    # tests for the engine setup and pool metrics
+
+    def test_app_and_models_share_one_engine(self):
+        import app as app_module
+
+        self.assertIs(app_module.db, db)
+        self.assertIs(db.session.get_bind(), db.get_engine())
+
+    def test_pool_metrics(self):
+        engine = create_engine(
+            "sqlite://", poolclass=QueuePool, pool_size=2, max_overflow=0, pool_timeout=0.05
+        )
+        metrics = PoolMetrics()
+        metrics.instrument(engine)
+        first, second = engine.connect(), engine.connect()
+        with self.assertRaises(PoolTimeout):
+            engine.connect()
+        stats = metrics.stats()
+        first.close()
+        second.close()
+
+        self.assertEqual(stats["pool"], "QueuePool")
+        self.assertEqual(stats["checkout"]["count"], 2)
+        self.assertGreaterEqual(stats["checkout"]["wait_ms_max"], 50)
+        self.assertEqual(stats["saturation"]["capacity"], 2)
+        self.assertEqual(stats["saturation"]["utilization"], 1.0)
+        self.assertEqual(stats["saturation"]["timeouts"], 1)
+        self.assertEqual(stats["churn"]["connects"], 2)
+        self.assertEqual(metrics.stats()["saturation"]["in_use"], 0)
+
+    def test_metrics(self):
+        self.client().get("/artists")
+        data = json.loads(self.client().get("/metrics").data)
+
+        self.assertEqual(data["cache"]["misses"], 1)
+        self.assertGreater(data["pool"]["checkout"]["count"], 0)
+        self.assertIsNone(data["write_behind"])
+
+
+    # tests for the read replicas
+
+    def use_replicas(self, strategy="round_robin"):
+        """two in-memory sqlite databases standing in for replicas,
+        each holding one venue named after it"""
+        binds = ["replica0", "replica1"]
+        app.config["SQLALCHEMY_BINDS"] = {bind: "sqlite://" for bind in binds}
+        router.configure(binds, strategy)
+        for i, bind in enumerate(binds):
+            engine = db.get_engine(app, bind=bind)
+            db.Model.metadata.create_all(bind=engine)
+            engine.execute(
+                Venue.__table__.insert(),
+                {"id": 10 + i, "name": "Venue on " + bind, "city": "San Francisco",
+                 "state": "CA", "address": "1015 Folsom Street", "phone": "1234567890"},
+            )
+            self.addCleanup(db.Model.metadata.drop_all, bind=engine)
+        self.addCleanup(router.configure, [])
+        self.addCleanup(app.config.__setitem__, "SQLALCHEMY_BINDS", {})
+
+    def test_read_only_views_round_robin_over_replicas(self):
+        self.use_replicas()
+        client = self.client()
+        pages = []
+        for _ in range(3):
+            page_cache.invalidate("venues")
+            pages.append(client.get("/venues").data)
+
+        self.assertIn(b"Venue on replica0", pages[0])
+        self.assertIn(b"Venue on replica1", pages[1])
+        self.assertIn(b"Venue on replica0", pages[2])
+        # search is a POST but reads only, reads stay on the replicas
+        res = client.post("/venues/search", data={"search_term": "replica"})
+        self.assertIn(b"Venue on replica1", res.data)
+        page_cache.invalidate("venues")
+        self.assertIn(b"Venue on replica0", client.get("/venues").data)
+
+    def test_reads_follow_writes_to_the_primary(self):
+        make_venue("Venue on the primary")
+        db.session.commit()
+        self.use_replicas()
+        client = self.client()
+        client.post("/venues/create", data={"name": "Incomplete"})
+        page_cache.invalidate("venues")
+        res = client.get("/venues")
+
+        self.assertIn(b"Venue on the primary", res.data)
+        self.assertNotIn(b"Venue on replica", res.data)
+
+    def test_writers_skip_pages_cached_from_replicas(self):
+        make_venue("Venue on the primary")
+        db.session.commit()
+        self.use_replicas()
+        self.assertIn(b"Venue on replica", self.client().get("/venues").data)
+
+        writer = self.client()
+        for method in ("HEAD", "OPTIONS"):
+            writer.open("/venues/create", method=method)
+        with writer.session_transaction() as session:
+            self.assertNotIn(WROTE_AT, session)
+        writer.post("/venues/create", data={"name": "Incomplete"})
+        res = writer.get("/venues")
+
+        self.assertIn(b"Venue on the primary", res.data)
+        self.assertEqual(page_cache.hits, 0)
+
+    def test_replica_pages_are_not_cached_right_after_an_invalidation(self):
+        self.use_replicas()
+        page_cache.replica_lag = 5
+        self.addCleanup(setattr, page_cache, "replica_lag", 0)
+        client = self.client()
+        client.get("/venues")
+        self.assertEqual(len(page_cache.backend), 1)
+
+        # another client's write, the replicas may not have it yet
+        page_cache.invalidate("venues")
+        client.get("/venues")
+        client.get("/venues")
+        self.assertEqual(page_cache.hits, 0)
+
+        # pages read on the primary are cached
+        router.configure([])
+        client.get("/venues")
+        client.get("/venues")
+        self.assertEqual(page_cache.hits, 1)
+
+    def test_least_loaded_replica(self):
+        router.configure(["replica0", "replica1"], "least_loaded")
+        self.addCleanup(router.configure, [])
+        with app.test_request_context("/venues"):
+            first = router.acquire()
+            second = router.acquire()
+            router.release(first)
+            third = router.acquire()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(third, first)
+
+
+    # tests for the faceted browse
+
+    def test_facets_count_without_their_own_filter(self):
+        for name, state, genres in (
+            ("Jazz in CA", "CA", ["Jazz"]),
+            ("Jazz and Folk in CA", "CA", ["Jazz", "Folk"]),
+            ("Jazz in NY", "NY", ["Jazz"]),
+            ("Folk in NY", "NY", ["Folk"]),
+        ):
+            make_artist(name, state=state).genres = genres
+        db.session.commit()
+
+        page = facets.browse(Artist, {"genre": "Jazz", "state": "CA"})
+
+        self.assertEqual(page["total"], 2)
+        self.assertEqual([a["name"] for a in page["data"]], ["Jazz and Folk in CA", "Jazz in CA"])
+        # states of the Jazz artists, genres of the CA artists
+        self.assertEqual(page["facets"]["state"], [("CA", 2), ("NY", 1)])
+        self.assertEqual(page["facets"]["genre"], [("Jazz", 2), ("Folk", 1)])
+        self.assertEqual(page["facets"]["seeking"], [("no", 2)])
+
+    def test_browse_pages_with_a_cursor(self):
+        for i in range(5):
+            make_venue("Venue %d" % i)
+        db.session.commit()
+
+        names, after = [], None
+        while True:
+            page = facets.browse(Venue, {"genre": "Jazz"}, after=after, limit=2)
+            names += [venue["name"] for venue in page["data"]]
+            after = page["next_cursor"]
+            if not after:
+                break
+
+        self.assertEqual(names, ["Venue %d" % i for i in range(5)])
+        self.assertEqual(self.client().get("/venues/browse?after=x").status_code, 400)
+
+    def test_browse_page_is_two_queries_and_cached(self):
+        make_artist("Guns N Petals")
+        db.session.commit()
+        client = self.client()
+
+        with count_queries() as statements:
+            res = client.get("/artists/browse?genre=Jazz&seeking=no")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"Guns N Petals", res.data)
+        self.assertEqual(len(statements), 2)
+        with count_queries() as statements:
+            client.get("/artists/browse?genre=Jazz&seeking=no")
+        self.assertEqual(statements, [])
+
+        artist = make_artist("The Wild Sax Band")
+        db.session.expunge(artist)
+        artist.insert()
+        res = client.get("/artists/browse?genre=Jazz&seeking=no")
+        self.assertIn(b"The Wild Sax Band", res.data)
+        self.assertIn(b"2 artists", res.data)
+
+
+    # tests for the recommendations
+
+    def seeking_venues(self):
+        """an artist seeking a venue and four venues, three seeking talent"""
+        artist = make_artist("Guns N Petals")
+        artist.seeking_venue = True
+        venues = {}
+        for name, genre, city, state, seeking in (
+            ("Jazz in SF", "Jazz", "San Francisco", "CA", True),
+            ("Jazz in NY", "Jazz", "New York", "NY", True),
+            ("Rock in SF", "Rock n Roll", "San Francisco", "CA", True),
+            ("Jazz in SF, booked out", "Jazz", "San Francisco", "CA", False),
+        ):
+            venue = venues[name] = make_venue(name, city, state)
+            venue.genres = [genre]
+            venue.seeking_talent = seeking
+        db.session.commit()
+        return artist, venues
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_recommend_venues_by_genre_and_location(self):
+        artist, venues = self.seeking_venues()
+        index = Recommender()
+
+        data = index.venues_for(artist.id)
+
+        self.assertEqual([v["name"] for v in data], ["Jazz in SF", "Jazz in NY", "Rock in SF"])
+        self.assertEqual([v["score"] for v in data], [1.75, 1.0, 0.75])
+        self.assertIsNone(index.venues_for(artist.id + 1))
+        # venues not seeking talent get no suggestions
+        self.assertEqual(index.artists_for(venues["Jazz in SF, booked out"].id), [])
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_recommendations_refresh_incrementally(self):
+        artist, venues = self.seeking_venues()
+        index = Recommender()
+        index.venues_for(artist.id)
+
+        # one jazz show in four at the rock venue
+        rock = venues["Rock in SF"]
+        pebbles = make_artist("The Rolling Pebbles")
+        pebbles.genres = ["Rock n Roll"]
+        make_show(rock, artist, self.past)
+        for days in range(3):
+            make_show(rock, pebbles, self.future + timedelta(days=days))
+        db.session.commit()
+        index.refresh(force=True)
+        data = index.venues_for(artist.id)
+
+        self.assertEqual(index.builds, 1)
+        self.assertEqual(data[-1]["name"], "Rock in SF")
+        self.assertEqual(data[-1]["score"], 0.875)
+
+        venues["Jazz in NY"].delete()
+        index.refresh(force=True)
+        self.assertEqual(index.builds, 2)
+        self.assertEqual([v["name"] for v in index.venues_for(artist.id)], ["Jazz in SF", "Rock in SF"])
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_recommendations_rebuild_on_shows_committed_late(self):
+        artist, venues = self.seeking_venues()
+        rock = venues["Rock in SF"]
+        shows = [make_show(rock, artist, self.past + timedelta(days=days)) for days in range(3)]
+        db.session.commit()
+        late = {"id": shows[1].id, "venue_id": rock.id, "artist_id": artist.id, "start_time": self.past}
+        table = Musicshows.__table__
+        db.session.execute(table.delete().where(table.c.id == late["id"]))
+        db.session.commit()
+        index = Recommender()
+        index.venues_for(artist.id)
+
+        # the show took its id before the last one, and committed after it
+        db.session.execute(table.insert(), late)
+        db.session.commit()
+        index.refresh(force=True)
+
+        self.assertEqual(index.builds, 2)
+        self.assertEqual(index.stats()["shows"], 3)
+
+    @unittest.skipUnless(np, "needs numpy")
+    def test_recommendations_api(self):
+        artist, venues = self.seeking_venues()
+        recommender.clear()
+        client = self.client()
+
+        data = json.loads(client.get("/api/v1/artists/%d/recommended-venues?limit=1" % artist.id).data)
+        self.assertEqual([v["name"] for v in data["data"]], ["Jazz in SF"])
+        res = client.get("/api/v1/venues/%d/recommended-artists" % venues["Jazz in SF"].id)
+        self.assertEqual(json.loads(res.data)["data"][0]["id"], artist.id)
+        self.assertEqual(client.get("/api/v1/artists/404/recommended-venues").status_code, 404)
+
+
+    # tests for the home page snapshot and the scheduler
+
+    def test_home_page_reads_only_the_snapshot(self):
+        hop = make_venue("The Musical Hop")
+        dueling = make_venue("The Dueling Pianos Bar", "New York", "NY")
+        artist = make_artist("Guns N Petals")
+        make_show(hop, artist, self.now + timedelta(days=2))
+        make_show(hop, artist, self.now + timedelta(days=20))
+        make_show(dueling, artist, self.now + timedelta(days=3))
+        make_show(dueling, artist, self.now + timedelta(days=10))
+        make_show(hop, artist, self.past)
+        db.session.commit()
+        self.addCleanup(setattr, dashboard, "snapshot", None)
+
+        snapshot = dashboard.refresh(self.now)
+        with count_queries() as statements:
+            res = self.client().get("/")
+
+        self.assertEqual(statements, [])
+        self.assertEqual(
+            [(v["name"], v["num_upcoming_shows"]) for v in snapshot["trending"]],
+            [("The Dueling Pianos Bar", 2), ("The Musical Hop", 1)],
+        )
+        self.assertEqual([s["venue_name"] for s in snapshot["shows"]], ["The Musical Hop", "The Dueling Pianos Bar"])
+        self.assertIn(b"Guns N Petals", res.data)
+        self.assertIn(b"Trending venues", res.data)
+        self.assertIn(b"2 shows in the next 14 days", res.data)
+
+    def test_scheduler_retries_failed_jobs(self):
+        calls = []
+
+        def job():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                raise ValueError("first run fails")
+
+        scheduler = Scheduler()
+        scheduler.app = app
+        scheduler.every(0.01, job)
+        scheduler.start()
+        deadline = datetime.now() + timedelta(seconds=5)
+        while len(calls) < 3 and datetime.now() < deadline:
+            scheduler.stopped.wait(0.01)
+        scheduler.stop()
+
+        stats = scheduler.stats()["jobs"]["job"]
+        self.assertGreaterEqual(stats["runs"], 3)
+        self.assertEqual(stats["failures"], 1)
+        self.assertIn("first run fails", stats["last_error"])
+
+
+    # tests for the SQL profiler
+
+    def test_routes_stay_within_their_query_budget(self):
+        venues = [make_venue("Venue %d" % i) for i in range(3)]
+        artists = [make_artist("Artist %d" % i) for i in range(3)]
+        for day, (venue, artist) in enumerate(zip(venues, artists)):
+            make_show(venue, artist, self.future + timedelta(days=day))
+            make_show(venue, artist, self.past - timedelta(days=day))
+        db.session.commit()
+
+        for budget, path, kwargs in (
+            (0, "/", {}),
+            (1, "/venues", {}),
+            (1, "/artists", {}),
+            (1, "/shows", {}),
+            (3, "/venues/%d" % venues[0].id, {}),
+            (3, "/artists/%d" % artists[0].id, {}),
+            (2, "/artists/browse?genre=Jazz", {}),
+            (1, "/api/v1/shows?fields[venue]=name&fields[artist]=name", {}),
+        ):
+            self.assertQueryBudget(budget, path, **kwargs)
+        for path in ("/venues/search", "/artists/search"):
+            self.assertQueryBudget(2, path, method="post", data={"search_term": "1"})
+
+    def test_profile_header_and_duplicates(self):
+        make_venue("The Musical Hop")
+        db.session.commit()
+        app.config["SQL_PROFILE"] = True
+        self.addCleanup(app.config.__setitem__, "SQL_PROFILE", False)
+
+        res = self.client().get("/venues")
+
+        self.assertRegex(res.headers["X-SQL-Profile"], r"^queries=1; db_ms=[\d.]+; duplicates=0$")
+        # served from the page cache
+        self.assertTrue(self.client().get("/venues").headers["X-SQL-Profile"].startswith("queries=0;"))
+        app.config["SQL_PROFILE"] = False
+        self.assertNotIn("X-SQL-Profile", self.client().get("/venues").headers)
+
+        profile = Profile()
+        for venue_id in (1, 2, 3):
+            profile.record("SELECT name FROM venue WHERE id = %d" % venue_id, 0.001)
+        profile.record("SELECT id FROM artist WHERE id IN (?, ?, ?)", 0.002)
+        summary = profile.summary(slowest=1)
+        self.assertEqual(summary["queries"], 4)
+        self.assertEqual(summary["duplicates"], [{"count": 3, "statement": "SELECT name FROM venue WHERE id = ?"}])
+        self.assertEqual(summary["slowest"][0]["statement"], "SELECT id FROM artist WHERE id IN (...)")
+        self.assertEqual(fingerprint("a  IN (%(id_1)s,\n %(id_2)s)"), "a IN (...)")
+
+
+    # tests for the calendar
+
+    def calendar_shows(self):
+        """shows on Monday 2030-01-07 to Thursday, two in San Francisco, one in New York"""
+        hop = make_venue("The Musical Hop")
+        dueling = make_venue("The Dueling Pianos Bar", "New York", "NY")
+        artist = make_artist("Guns N Petals")
+        monday = datetime(2030, 1, 7, 20)
+        make_show(hop, artist, monday)
+        make_show(dueling, artist, monday + timedelta(days=1))
+        make_show(hop, artist, monday + timedelta(days=3))
+        db.session.commit()
+        return hop, dueling, artist
+
+    def test_calendar_buckets_by_day_and_week(self):
+        hop, dueling, artist = self.calendar_shows()
+        monday = datetime(2030, 1, 7).date()
+
+        days = calendar(monday, monday + timedelta(days=3))
+        weeks = calendar(monday + timedelta(days=2), monday + timedelta(days=9), "week")
+        in_sf = calendar(monday, monday + timedelta(days=3), city="San Francisco")
+        at_dueling = calendar(monday, monday + timedelta(days=3), "week", venue_id=dueling.id)
+
+        self.assertEqual([b["count"] for b in days], [1, 1, 0, 1])
+        self.assertEqual(days[1]["shows"][0]["venue_name"], "The Dueling Pianos Bar")
+        self.assertEqual([(b["start"], b["count"]) for b in weeks], [("2030-01-07", 3), ("2030-01-14", 0)])
+        self.assertEqual([b["count"] for b in in_sf], [1, 0, 0, 1])
+        self.assertEqual([s["venue_id"] for s in at_dueling[0]["shows"]], [dueling.id])
+        with self.assertRaises(ValueError):
+            calendar(monday, monday - timedelta(days=1))
+
+    def test_calendar_caches_each_bucket(self):
+        hop, dueling, artist = self.calendar_shows()
+        first, last = datetime(2030, 1, 1).date(), datetime(2030, 1, 31).date()
+
+        with count_queries() as statements:
+            calendar(first, last)
+        self.assertEqual(len(statements), 1)
+        with count_queries() as statements:
+            calendar(first, last)
+            calendar(first + timedelta(days=7), first + timedelta(days=13))
+        self.assertEqual(statements, [])
+
+        # a new show only invalidates its day
+        show = Musicshows(venue_id=hop.id, artist_id=artist.id, start_time=datetime(2030, 1, 20, 20))
+        show.id = 4
+        show.insert()
+        page_cache.reset_stats()
+        with count_queries() as statements:
+            month = calendar(first, last)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(page_cache.stats()["misses"], 1)
+        self.assertEqual(month[19]["count"], 1)
+
+        plans = query_plans(lambda: calendar(datetime(2030, 2, 1).date(), datetime(2030, 2, 28).date()))
+        self.assertFalse(scans_table(plans[0], "musicshows"), plans[0])
+
+    def test_calendar_page_and_api(self):
+        hop, dueling, artist = self.calendar_shows()
+        client = self.client()
+
+        res = client.get("/shows/calendar?start=2030-01-07&end=2030-01-13&city=New+York")
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b"The Dueling Pianos Bar", res.data)
+        self.assertNotIn(b"The Musical Hop", res.data)
+        data = json.loads(client.get("/api/v1/calendar?start=2030-01-07&end=2030-01-20&bucket=week").data)
+        self.assertEqual([b["count"] for b in data["buckets"]], [3, 0])
+        self.assertEqual(client.get("/api/v1/calendar?bucket=month").status_code, 400)
+        self.assertEqual(client.get("/shows/calendar?start=tomorrow").status_code, 400)
+
+    # tests for the venues near a point search
+
+    def test_venues_are_geocoded_from_the_gazetteer(self):
+        hop = make_venue("The Musical Hop")
+        park = make_venue("Park Square Live Music & Coffee", "St. Louis", "MO")
+        barn = make_venue("The Barn", "Smallville", "KS")
+        db.session.commit()
+
+        self.assertEqual((round(hop.latitude, 2), round(hop.longitude, 2)), (37.77, -122.42))
+        self.assertEqual((park.latitude, park.longitude), geo.geocode("Saint Louis", "MO"))
+        # cities missing from the gazetteer are placed at their state
+        self.assertEqual((barn.latitude, barn.longitude), geo.geocode("", "KS"))
+        hop.city, hop.state = "New York", "NY"
+        hop.update()
+        self.assertEqual(round(hop.latitude, 2), 40.71)
+
+        # rows written without the ORM are placed by `flask geocode-venues`
+        db.session.execute(Venue.__table__.update().values(latitude=None, longitude=None))
+        db.session.commit()
+        self.assertEqual(geo.geocode_missing(batch_size=2), 3)
+        self.assertEqual(db.session.query(Venue.latitude).filter(Venue.id == park.id).scalar(), 38.627)
+
+    def test_nearest_venues_within_a_radius(self):
+        for name, city, state in (
+            ("The Musical Hop", "San Francisco", "CA"),
+            ("Oakland Arena", "Oakland", "CA"),
+            ("The Echo", "Los Angeles", "CA"),
+            ("The Dueling Pianos Bar", "New York", "NY"),
+        ):
+            make_venue(name, city, state)
+        db.session.commit()
+        san_francisco = geo.geocode("San Francisco", "CA")
+
+        nearest = geo.nearest_venues(*san_francisco, 3)
+        self.assertEqual([v["name"] for v in nearest], ["The Musical Hop", "Oakland Arena", "The Echo"])
+        self.assertAlmostEqual(nearest[1]["distance_km"], 13.4, delta=0.5)
+        self.assertAlmostEqual(nearest[2]["distance_km"], 559, delta=5)
+        within = geo.nearest_venues(*san_francisco, 10, radius_km=100)
+        self.assertEqual([v["name"] for v in within], ["The Musical Hop", "Oakland Arena"])
+
+        # writes after the index is built are applied on commit
+        make_venue("Freight & Salvage", "Berkeley", "CA")
+        Venue.query.filter_by(name="Oakland Arena").one().delete()
+        within = geo.nearest_venues(*san_francisco, 10, radius_km=100)
+        self.assertEqual([v["name"] for v in within], ["The Musical Hop", "Freight & Salvage"])
+
+    def test_geo_index_picks_up_other_workers(self):
+        hop = make_venue("The Musical Hop")
+        arena = make_venue("Oakland Arena", "Oakland", "CA")
+        echo = make_venue("The Echo", "Los Angeles", "CA")
+        db.session.commit()
+        hop_id, arena_id, echo_id = hop.id, arena.id, echo.id
+        san_francisco = geo.geocode("San Francisco", "CA")
+        index = geo.get_index()
+
+        # writes of another worker, no event of this session sees them
+        table = Venue.__table__
+        oakland = geo.geocode("Oakland", "CA")
+        db.session.execute(
+            table.update()
+            .where(table.c.id == echo_id)
+            .values(city="Oakland", latitude=oakland[0], longitude=oakland[1], **bumped(table.c))
+        )
+        db.session.execute(
+            table.update()
+            .where(table.c.id == arena_id)
+            .values(deleted_at=datetime.utcnow(), **bumped(table.c))
+        )
+        db.session.commit()
+        self.assertEqual(len(geo.nearest_venues(*san_francisco, 10, radius_km=100)), 2)
+        self.addCleanup(setattr, geo, "refresh_interval", geo.refresh_interval)
+        geo.refresh_interval = 0
+        within = geo.nearest_venues(*san_francisco, 10, radius_km=100)
+        self.assertEqual([v["id"] for v in within], [hop_id, echo_id])
+        self.assertIs(geo.get_index(), index)
+
+        # a purged venue is only noticed by the count
+        db.session.execute(table.delete().where(table.c.id == hop_id))
+        db.session.commit()
+        within = geo.nearest_venues(*san_francisco, 10, radius_km=100)
+        self.assertEqual([v["id"] for v in within], [echo_id])
+        self.assertIsNot(geo.get_index(), index)
+
+    def test_kd_tree_matches_a_linear_scan(self):
+        rnd = random.Random(7)
+        points = [(i, geo.to_xyz(rnd.uniform(25, 49), rnd.uniform(-124, -67))) for i in range(2000)]
+        tree = geo.KDTree(points)
+        for _ in range(50):
+            point = geo.to_xyz(rnd.uniform(25, 49), rnd.uniform(-124, -67))
+            bound = geo.chord(rnd.choice([50, 500, 5000])) ** 2
+            expected = sorted(
+                (sum((a - b) ** 2 for a, b in zip(xyz, point)), key) for key, xyz in points
+            )
+            self.assertEqual(tree.nearest(point, 10), expected[:10])
+            self.assertEqual(
+                tree.nearest(point, 100, bound), [e for e in expected if e[0] <= bound][:100]
+            )
+
+    def test_venues_near_api(self):
+        make_venue("The Musical Hop")
+        make_venue("The Dueling Pianos Bar", "New York", "NY")
+        db.session.commit()
+        client = self.client()
+
+        data = json.loads(client.get("/api/v1/venues/near?lat=37.8&lon=-122.3&limit=1").data)
+        self.assertEqual([v["name"] for v in data["data"]], ["The Musical Hop"])
+        data = json.loads(client.get("/api/v1/venues/near?city=Newark&state=NJ&radius=50").data)
+        self.assertEqual([v["name"] for v in data["data"]], ["The Dueling Pianos Bar"])
+        self.assertEqual(client.get("/api/v1/venues/near?lat=95&lon=0").status_code, 400)
+        self.assertEqual(client.get("/api/v1/venues/near?lat=1&lon=1&radius=-1").status_code, 400)
+        self.assertEqual(client.get("/api/v1/venues/near").status_code, 400)
+
+    # tests for the duplicate detection
+
+    def venue_form(self, name, **fields):
+        form = {
+            "name": name,
+            "city": "San Francisco",
+            "state": "CA",
+            "address": "1015 Folsom St.",
+            "phone": "4150001234",
+            "genres": ["Jazz"],
+            "image_link": "https://example.com/venue.jpg",
+            "facebook_link": "https://www.facebook.com/example",
+            "website_link": "https://example.com",
+            "seeking_talent": "y",
+            "seeking_description": "Looking for jazz bands",
+        }
+        form.update(fields)
+        return form
+
+    def test_blocking_keys_normalize_names_phones_and_addresses(self):
+        self.assertEqual(
+            dedup.name_key("The Musical Hop", "San Francisco", "CA"),
+            dedup.name_key("Musical Hop, The", " san  francisco", "CA"),
+        )
+        self.assertNotEqual(
+            dedup.name_key("The Musical Hop", "San Francisco", "CA"),
+            dedup.name_key("The Musical Hop", "Oakland", "CA"),
+        )
+        self.assertEqual(dedup.phone_key("+1 (415) 000-1234"), "4150001234")
+        self.assertIsNone(dedup.phone_key("n/a"))
+        self.assertEqual(
+            dedup.address_key("1015 Folsom Street", "San Francisco", "CA"),
+            dedup.address_key("1015 folsom st.", "San Francisco", "CA"),
+        )
+        hop = make_venue("The Musical Hop")
+        db.session.commit()
+        self.assertEqual(hop.name_key, "hop musical|san francisco|CA")
+        self.assertEqual(hop.address_key, "1015 folsom st|san francisco|CA")
+
+    def test_create_rejects_duplicates_unless_confirmed(self):
+        make_venue("The Musical Hop")
+        make_artist("Guns N Petals")
+        db.session.commit()
+        client = self.client()
+
+        res = client.post("/venues/create", data=self.venue_form("Musical Hop, The"))
+        self.assertIn(b"Already listed", res.data)
+        self.assertEqual(Venue.query.count(), 1)
+        client.post("/venues/create", data=self.venue_form("Musical Hop, The", allow_duplicate="y"))
+        client.post("/venues/create", data=self.venue_form("The Dueling Pianos Bar", phone="2120001234"))
+        self.assertEqual(Venue.query.count(), 3)
+
+        # the phone number is shared, and the names are alike
+        self.assertEqual(
+            [name for _, name in dedup.find_duplicates(Artist, {"name": "Guns n' Petals", "phone": "1234567890"})],
+            ["Guns N Petals"],
+        )
+        self.assertEqual(dedup.find_duplicates(Artist, {"name": "Matt Quevedo", "phone": "1234567890"}), [])
+        plans = query_plans(lambda: dedup.find_duplicates(Venue, self.venue_form("The Musical Hop")))
+        for plan in plans:
+            self.assertFalse(scans_table(plan, "venue"), plan)
+
+    def test_shared_phone_numbers_do_not_hide_name_matches(self):
+        # an agency number shared by more entries than MAX_BLOCK
+        for i in range(dedup.MAX_BLOCK + 10):
+            make_artist("Agency Artist %d" % i)
+        make_artist("Guns N Petals")
+        db.session.commit()
+
+        new = {"name": "Guns N' Petals", "city": "San Francisco", "state": "CA", "phone": "1234567890"}
+        self.assertEqual([name for _, name in dedup.find_duplicates(Artist, new)], ["Guns N Petals"])
+        new["name"] = "Agency Artist 1"
+        self.assertEqual([name for _, name in dedup.find_duplicates(Artist, new)], ["Agency Artist 1"])
+
+    def test_cluster_groups_the_duplicates_of_a_table(self):
+        for name in ("The Musical Hop", "Musical Hop, The", "Park Square Live Music & Coffee"):
+            make_venue(name)
+        elsewhere = make_venue("The Musical Hop", "New York", "NY")
+        elsewhere.phone, elsewhere.address = "2120001234", "335 Delancey Street"
+        db.session.commit()
+        # rows inserted without the ORM are keyed first
+        db.session.execute(
+            Venue.__table__.insert(),
+            [dict(name="Musical Hop", city="New York", state="NY", address="335 Delancey St",
+                  phone="9170001234", genres=["Jazz"])],
+        )
+        db.session.commit()
+
+        clusters = dedup.cluster(Venue)
+        self.assertEqual(
+            clusters,
+            [[(1, "The Musical Hop"), (2, "Musical Hop, The")], [(4, "The Musical Hop"), (5, "Musical Hop")]],
+        )
+        self.assertEqual(db.session.query(Venue.name_key).filter(Venue.id == 5).scalar(), "hop musical|new york|NY")
+
+    # tests for the read model
+
+    def catalog(self):
+        hop = make_venue("The Musical Hop")
+        dueling = make_venue("The Dueling Pianos Bar", "New York", "NY")
+        guns = make_artist("Guns N Petals")
+        matt = make_artist("Matt Quevedo")
+        db.session.commit()
+        make_show(hop, guns, self.future)
+        make_show(hop, matt, self.past)
+        make_show(dueling, guns, self.past)
+        make_show(hop, guns, self.future + timedelta(days=1))
+        db.session.commit()
+        return hop, dueling, guns, matt
+
+    def orm_page(self, model, key):
+        entity = model.query.get(key)
+        data = entity.details()
+        shows = venue_shows if model is Venue else artist_shows
+        data["past_shows"], data["upcoming_shows"] = shows(key, self.now)
+        data["past_shows_count"] = len(data["past_shows"])
+        data["upcoming_shows_count"] = len(data["upcoming_shows"])
+        return data
+
+    def test_read_model_pages_match_the_orm(self):
+        hop, dueling, guns, matt = self.catalog()
+
+        for entity in (hop, dueling):
+            self.assertEqual(read_model.venue_page(entity.id, self.now), self.orm_page(Venue, entity.id))
+        for entity in (guns, matt):
+            self.assertEqual(read_model.artist_page(entity.id, self.now), self.orm_page(Artist, entity.id))
+        self.assertIsNone(read_model.venue_page(404))
+
+    def test_read_model_follows_writes(self):
+        hop, dueling, guns, matt = self.catalog()
+        read_model.enabled = True
+        read_model.refresh()
+
+        # commits of this worker are applied as they happen
+        hop.name = "The Musical Hop Club"
+        hop.update()
+        dueling_id, matt_id = dueling.id, matt.id
+        show = Musicshows(venue_id=dueling_id, artist_id=matt_id, start_time=self.future)
+        show.id = 5
+        show.insert()
+        with count_queries() as statements:
+            page = read_model.artist_page(matt_id, self.now)
+        self.assertEqual(statements, [])
+        self.assertEqual(
+            [(s["venue_name"], s["start_time"]) for s in page["past_shows"] + page["upcoming_shows"]],
+            [("The Musical Hop Club", self.past), ("The Dueling Pianos Bar", self.future)],
+        )
+
+        # writes of other workers are read on refresh, deletes rebuild the model
+        db.session.execute(Venue.__table__.update().where(Venue.id == dueling_id).values(
+            name="Dueling Pianos", updated_at=datetime.utcnow() + timedelta(seconds=2)))
+        db.session.execute(Musicshows.__table__.delete().where(Musicshows.id == 3))
+        db.session.commit()
+        builds = read_model.builds
+        read_model.refresh(force=True)
+        self.assertEqual(read_model.builds, builds + 1)
+        page = read_model.venue_page(dueling_id, self.now)
+        self.assertEqual(page["name"], "Dueling Pianos")
+        self.assertEqual((page["past_shows_count"], page["upcoming_shows_count"]), (0, 1))
+
+    def test_pages_render_from_the_read_model(self):
+        hop, dueling, guns, matt = self.catalog()
+        read_model.enabled = True
+        read_model.refresh()
+
+        res = self.assertQueryBudget(1, "/venues/%d" % hop.id)
+        self.assertIn(b"Guns N Petals", res.data)
+        res = self.assertQueryBudget(1, "/artists/%d" % matt.id)
+        self.assertIn(b"The Musical Hop", res.data)
+        self.assertEqual(self.client().get("/venues/404").status_code, 200)
+
+    def test_shared_cache_misses_refresh_the_read_model(self):
+        hop, dueling, guns, matt = self.catalog()
+        hop_id = hop.id
+        backend, page_cache.backend = page_cache.backend, RedisBackend(LocalRedis())
+        self.addCleanup(setattr, page_cache, "backend", backend)
+        read_model.enabled = True
+        self.assertIn(b"The Musical Hop", self.client().get("/venues/%d" % hop_id).data)
+
+        # another worker renames the venue and invalidates its page
+        db.session.execute(Venue.__table__.update().where(Venue.id == hop_id).values(
+            name="The Musical Hop Club", updated_at=datetime.utcnow() + timedelta(seconds=2)))
+        db.session.commit()
+        page_cache.invalidate("venue:%d" % hop_id)
+        self.assertIn(b"The Musical Hop Club", self.client().get("/venues/%d" % hop_id).data)
+
+
+    # tests for soft-delete and the purge of deleted entries
+
+    def counts(self, model):
+        return [
+            (row.id, row.upcoming_shows_count, row.past_shows_count)
+            for row in db.session.query(model).order_by(model.id)
+        ]
+
+    def test_deleted_venues_and_artists_are_hidden(self):
+        hop, dueling, guns, matt = self.catalog()
+        hop_id, matt_id, guns_id = hop.id, matt.id, guns.id
+        dueling_show = {
+            "venue_id": dueling.id, "venue_name": dueling.name,
+            "venue_image_link": dueling.image_link, "start_time": self.past,
+        }
+
+        with count_queries() as statements:
+            self.client().delete("/venues/%d" % hop_id)
+        # no show is deleted by the request
+        self.assertFalse([s for s in statements if s.startswith("DELETE")])
+        self.client().delete("/artists/%d" % matt_id)
+
+        self.assertIsNone(Venue.query.get(hop_id))
+        self.assertIsNone(Artist.query.get(matt_id))
+        self.assertEqual([area["city"] for area in venue_directory()], ["New York"])
+        self.assertEqual(facets.browse(Venue, {})["total"], 1)
+        self.assertEqual(artist_shows(guns_id, self.now), ([dueling_show], []))
+        self.assertNotIn(b"Musical Hop", self.client().get("/venues").data)
+        self.assertNotIn(b"Matt Quevedo", self.client().get("/export/artists.csv").data)
+        # still there, with its shows, until purged
+        deleted = db.session.query(Venue).execution_options(include_deleted=True).get(hop_id)
+        self.assertIsNotNone(deleted.deleted_at)
+        self.assertEqual(Musicshows.query.count(), 4)
+
+    def test_shows_of_deleted_entries_are_hidden(self):
+        hop, dueling, guns, matt = self.catalog()
+        hop_id, dueling_id, guns_id, matt_id = hop.id, dueling.id, guns.id, matt.id
+        self.client().delete("/venues/%d" % hop_id)
+
+        data = json.loads(self.client().get("/api/v1/shows").data)["data"]
+        self.assertEqual([show["venue_id"] for show in data], [dueling_id])
+        # the artist's shows at the deleted venue no longer book it
+        self.assertIsNone(find_conflict(dueling_id, guns_id, self.future))
+        res = self.client().post("/shows/create", data={
+            "venue_id": hop_id, "artist_id": guns_id,
+            "start_time": (self.future + timedelta(days=5)).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+        self.assertIn(b"not listed", res.data)
+
+        # and left its counters on deletion, roll-overs do not move them
+        self.assertEqual(self.counts(Artist), [(guns_id, 0, 1), (matt_id, 0, 0)])
+        counters.roll_over(self.future + timedelta(days=2))
+        self.assertEqual(self.counts(Artist), [(guns_id, 0, 1), (matt_id, 0, 0)])
+        counters.rebuild(db.session.query(ShowCounters).get(1).rolled_over_at)
+        self.assertEqual(self.counts(Artist), [(guns_id, 0, 1), (matt_id, 0, 0)])
+
+    def test_purge_deletes_shows_in_batches(self):
+        hop, dueling, guns, matt = self.catalog()
+        hop_id = hop.id
+        hop.delete()
+        purger = Purger(batch_size=2)
+
+        # one batch per run leaves the venue to the next run
+        self.assertEqual(purger.run(max_batches=1), 0)
+        self.assertEqual(Musicshows.query.filter_by(venue_id=hop_id).count(), 1)
+        with count_queries() as statements:
+            self.assertEqual(purger.run(), 1)
+        deletes = [s for s in statements if s.startswith("DELETE FROM musicshows")]
+        self.assertEqual(len(deletes), 1)
+        self.assertEqual(Musicshows.query.count(), 1)
+        self.assertIsNone(db.session.query(Venue).execution_options(include_deleted=True).get(hop_id))
+        self.assertEqual(purger.stats()["shows"], 3)
+
+        # the counters agree with a recount after the purge
+        matt.delete()
+        self.assertEqual(purger.run(), 1)
+        purged = self.counts(Artist), self.counts(Venue)
+        counters.rebuild(db.session.query(ShowCounters).get(1).rolled_over_at)
+        self.assertEqual((self.counts(Artist), self.counts(Venue)), purged)
+        self.assertEqual(self.counts(Artist), [(guns.id, 0, 1)])
+
+        # shows another worker holds keep the entry for the next run
+        dueling_id = dueling.id
+        dueling.delete()
+        purger.purge_batch = lambda key, entity_id: 0
+        self.assertEqual(purger.run(), 0)
+        self.assertIsNotNone(db.session.query(Venue).execution_options(include_deleted=True).get(dueling_id))
+        del purger.purge_batch
+        self.assertEqual(purger.run(), 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
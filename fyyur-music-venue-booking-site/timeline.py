@@ -0,0 +1,152 @@
+"""
+Shows of a date range bucketed by day or week, e.g. this weekend in Austin.
+
+Buckets are aligned, days at midnight and weeks on Monday, so the same
+bucket is shared by every range that contains it and cached on its own
+in the page cache. A range reads its cached buckets and fetches all the
+missing ones with one query: a range scan of the start_time index, or of
+(venue_id, start_time) / (artist_id, start_time) for one venue or artist.
+
+Cached buckets are tagged with the days they cover ("calendar:<date>")
+and "calendar". A new show bumps its day, so only the buckets holding that
+day are recomputed. Edits and deletes of venues and artists, which are
+rare, and bulk imports bump "calendar".
+"""
+from datetime import date, datetime, timedelta
+
+from cache import page_cache
+from models import db, Venue, Artist, Musicshows
+
+BUCKETS = {"day": 1, "week": 7}
+FILTERS = ("city", "state", "venue_id", "artist_id")
+# longest range of one request, in days
+MAX_DAYS = 400
+
+
+def day_tag(day):
+    return "calendar:%s" % day.isoformat()
+
+
+def align(day, bucket):
+    """start of the bucket containing day"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def days(first, count):
+    return [first + timedelta(days=i) for i in range(count)]
+
+
+def bucket_starts(start, end, bucket):
+    """starts of the buckets covering the days start to end, both included"""
+    step = timedelta(days=BUCKETS[bucket])
+    first = align(start, bucket)
+    return [first + step * i for i in range((end - first).days // BUCKETS[bucket] + 1)]
+
+
+def bucket_key(bucket, start, filters):
+    return "calendar:{}:{}:{}".format(
+        bucket, start.isoformat(), ":".join(str(filters.get(name) or "") for name in FILTERS)
+    )
+
+
+def fetch_shows(start, end, filters):
+    """shows starting in [start, end) matching the filters, in one range scan"""
+    query = (
+        db.session.query(
+            Musicshows.id,
+            Musicshows.start_time,
+            Musicshows.venue_id,
+            Venue.name.label("venue_name"),
+            Venue.city,
+            Venue.state,
+            Musicshows.artist_id,
+            Artist.name.label("artist_name"),
+            Artist.image_link.label("artist_image_link"),
+        )
+        .join(Venue, Venue.id == Musicshows.venue_id)
+        .join(Artist, Artist.id == Musicshows.artist_id)
+        .filter(
+            Musicshows.start_time >= datetime.combine(start, datetime.min.time()),
+            Musicshows.start_time < datetime.combine(end, datetime.min.time()),
+        )
+    )
+    if filters.get("venue_id"):
+        query = query.filter(Musicshows.venue_id == filters["venue_id"])
+    if filters.get("artist_id"):
+        query = query.filter(Musicshows.artist_id == filters["artist_id"])
+    if filters.get("city"):
+        query = query.filter(Venue.city == filters["city"])
+    if filters.get("state"):
+        query = query.filter(Venue.state == filters["state"])
+    rows = query.order_by(Musicshows.start_time, Musicshows.id).all()
+    return [dict(row._asdict(), start_time=row.start_time.isoformat()) for row in rows]
+
+
+def calendar(start, end, bucket="day", **filters):
+    """Returns the shows of the days start to end, in buckets.
+    Arguments:
+        start, end {date} -- first and last day, both included
+    Keyword Arguments:
+        bucket {str} -- "day" or "week"
+        city, state {str} -- location of the venue
+        venue_id, artist_id {int} -- shows of one venue or artist
+    Returns:
+        list of dictionary -- buckets with their start, end, count and shows
+    """
+    if bucket not in BUCKETS:
+        raise ValueError("bucket must be day or week")
+    if end < start:
+        raise ValueError("end is before start")
+    if (end - start).days > MAX_DAYS:
+        raise ValueError("ranges are limited to {} days".format(MAX_DAYS))
+
+    step = timedelta(days=BUCKETS[bucket])
+    starts = bucket_starts(start, end, bucket)
+    buckets = {}
+    if page_cache.enabled:
+        for first in starts:
+            buckets[first] = page_cache.get(bucket_key(bucket, first, filters))
+    missing = [first for first in starts if buckets.get(first) is None]
+
+    if missing:
+        # one query from the first to the last missing bucket, the tag
+        # versions are read before it so that no write in between is lost
+        low, high = missing[0], missing[-1] + step
+        if page_cache.enabled:
+            versions = page_cache.snapshot(
+                [day_tag(day) for day in days(low, (high - low).days)] + ["calendar"]
+            )
+        fetched = {first: [] for first in missing}
+        for show in fetch_shows(low, high, filters):
+            first = align(datetime.fromisoformat(show["start_time"]).date(), bucket)
+            if first in fetched:
+                fetched[first].append(show)
+        for first, shows in fetched.items():
+            buckets[first] = shows
+            if page_cache.enabled:
+                tags = {day_tag(day): versions[day_tag(day)] for day in days(first, step.days)}
+                tags["calendar"] = versions["calendar"]
+                page_cache.set(bucket_key(bucket, first, filters), shows, tags)
+
+    return [
+        {
+            "start": first.isoformat(),
+            "end": (first + step).isoformat(),
+            "count": len(buckets[first]),
+            "shows": buckets[first],
+        }
+        for first in starts
+    ]
+
+
+def parse_range(args, default_days=30):
+    """reads start, end, bucket and the filters of a calendar request;
+    raises ValueError on malformed values"""
+    start = date.fromisoformat(args["start"]) if args.get("start") else date.today()
+    end = date.fromisoformat(args["end"]) if args.get("end") else start + timedelta(days=default_days - 1)
+    filters = {name: args.get(name) or None for name in ("city", "state")}
+    for name in ("venue_id", "artist_id"):
+        filters[name] = int(args[name]) if args.get(name) else None
+    return start, end, args.get("bucket", "day"), filters
@@ -0,0 +1,139 @@
+"""
+Group commit of inserts, optional (WRITE_BEHIND in config.py).
+
+Request threads hand their new venues, artists and shows to a single
+writer thread and wait. The writer stages everything that arrived within
+WRITE_BEHIND_MAX_DELAY seconds, up to WRITE_BEHIND_MAX_ROWS rows, and
+commits it as one transaction on its one connection. Each request is
+acknowledged once its row is committed, so a flash message never claims a
+row that is not in the database, and bursts of submissions share commits
+instead of each holding a pooled connection through its own fsync.
+
+If the group fails, its rows are retried one transaction each, so only
+the requests whose row is rejected see the error.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import models
+from cache import page_cache
+from models import db
+
+STOP = object()
+
+
+class GroupCommitQueue:
+    def __init__(self, app, max_rows=100, max_delay=0.005):
+        self.app = app
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.groups = 0
+        self.rows = 0
+        self.failures = 0
+        self.thread = threading.Thread(target=self.run, name="group-commit", daemon=True)
+        self.thread.start()
+
+    def submit(self, entity):
+        """queues the insert of entity, returns a Future set to entity once
+        it is committed, or to the exception that made it fail"""
+        future = Future()
+        self.queue.put((entity, future))
+        return future
+
+    def stop(self):
+        """commits what is queued and ends the writer thread"""
+        self.queue.put(STOP)
+        self.thread.join()
+
+    def next_group(self):
+        """waits for the first insert, then collects more for at most
+        max_delay seconds; returns None once stopped"""
+        first = self.queue.get()
+        if first is STOP:
+            return None
+        group = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(group) < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is STOP:
+                self.queue.put(STOP)
+                break
+            group.append(item)
+        return group
+
+    def run(self):
+        with self.app.app_context():
+            # committed rows are handed back to the request threads,
+            # they must keep their attributes without a session
+            db.session().expire_on_commit = False
+            while True:
+                group = self.next_group()
+                if group is None:
+                    break
+                self.commit(group)
+                db.session.expunge_all()
+            db.session.remove()
+
+    def commit(self, group):
+        try:
+            for entity, _ in group:
+                entity.stage()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            committed = [self.commit_one(entity, future) for entity, future in group]
+        else:
+            committed = [(entity, future) for entity, future in group]
+        committed = [item for item in committed if item]
+
+        self.groups += 1
+        self.rows += len(committed)
+        for entity, _ in committed:
+            page_cache.invalidate(*entity.cache_tags())
+        for entity, future in committed:
+            future.set_result(entity)
+
+    def commit_one(self, entity, future):
+        """commits entity alone, returns (entity, future) on success"""
+        try:
+            entity.stage()
+            db.session.commit()
+            return entity, future
+        except Exception as e:
+            db.session.rollback()
+            self.failures += 1
+            future.set_exception(e)
+            return None
+
+    def stats(self):
+        return {
+            "groups": self.groups,
+            "rows": self.rows,
+            "rows_per_group": self.rows / self.groups if self.groups else 0.0,
+            "failures": self.failures,
+            "queued": self.queue.qsize(),
+        }
+
+
+def init_write_behind(app):
+    """starts the group commit queue if WRITE_BEHIND is on"""
+    if not app.config.get("WRITE_BEHIND"):
+        models.write_queue = None
+        return None
+    models.write_queue = GroupCommitQueue(
+        app,
+        max_rows=app.config.get("WRITE_BEHIND_MAX_ROWS", 100),
+        max_delay=app.config.get("WRITE_BEHIND_MAX_DELAY", 0.005),
+    )
+    atexit.register(models.write_queue.stop)
+    return models.write_queue